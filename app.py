@@ -1,33 +1,404 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, g,
+                   has_app_context, make_response, Response, send_file, stream_template, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from jinja2 import meta
+from markupsafe import Markup
+from werkzeug.datastructures import MultiDict
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from functools import wraps
+from contextlib import contextmanager
+from collections import defaultdict, namedtuple, OrderedDict
+from types import MappingProxyType
+import base64
+import hmac
+import csv
+import fcntl
+import io
 import os
-from sqlalchemy import func, and_
+import re
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+import click
+from sqlalchemy import (func, and_, or_, case, cast, event, select, exists, literal, table, column, text,
+                        create_engine, exc, MetaData, Table)
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.hybrid import hybrid_property
 from config import config
-from flask_socketio import SocketIO, emit
+import migrations
+import socket_queue
+import profiling
+import metrics
+import jobs
+from flask_socketio import SocketIO, emit, join_room
 
 app = Flask(__name__)
-app.config.from_object(config['development'])
+app.config.from_object(config[os.environ.get('FLASK_CONFIG') or 'default'])
 
-# Get the absolute path to the database directory
+# Get the absolute path to the project directory
 basedir = os.path.abspath(os.path.dirname(__file__))
-db_dir = os.path.join(basedir, 'database')
-db_path = os.path.join(db_dir, 'cms.db')
 
-# Create database directory if it doesn't exist
-if not os.path.exists(db_dir):
-    os.makedirs(db_dir)
-
-# Configure SQLite database
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+# Runtime metrics served at /metrics (see metrics.py). Values are recorded per
+# worker; with METRICS_DB set, workers publish them to a shared file so a
+# scrape of any worker reports the totals.
+metrics_registry = metrics.Registry()
+metrics_registry.histogram('cms_http_request_duration_seconds', 'Request handling time by endpoint.')
+metrics_registry.counter('cms_http_responses_total', 'Responses by endpoint and status code.')
+metrics_registry.gauge('cms_http_requests_in_flight', 'Requests being handled.')
+metrics_registry.counter('cms_db_pool_checkouts_total', 'Connections checked out of the SQLAlchemy pool.')
+metrics_registry.histogram('cms_db_pool_wait_seconds', 'Time spent waiting for a pooled connection.',
+                           buckets=(0.0001, 0.001, 0.01, 0.1, 1, 10))
+metrics_registry.gauge('cms_db_pool_checked_out', 'Pooled connections currently in use.')
+metrics_registry.counter('cms_db_sqlite_busy_total',
+                         'Statements that failed because SQLite stayed busy/locked past busy_timeout.')
+metrics_registry.gauge('cms_socketio_connected_clients', 'Open Socket.IO connections.')
+metrics_registry.counter('cms_socketio_events_emitted_total', 'Socket.IO events emitted by event name.')
+metrics_registry.counter('cms_cache_hits_total', 'Cache hits by cache.')
+metrics_registry.counter('cms_cache_misses_total', 'Cache misses by cache.')
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics_registry.observe('cms_db_pool_wait_seconds', time.perf_counter() - started)
+
+SQLITE_BUSY, SQLITE_LOCKED = 5, 6
+
+class CooperativeConnection(sqlite3.Connection):
+    """SQLite connection for the eventlet profile that waits out locks cooperatively.
+
+    SQLite's own busy wait sleeps inside C, which stalls every green thread of the
+    worker, the lock holder included. These connections let SQLite wait only
+    ``BUSY_SLICE_MS``, then yield to the hub and retry the statement until
+    ``busy_timeout`` (seconds, set from ``SQLITE_PRAGMAS`` on connect) has passed.
+    """
+    BUSY_SLICE_MS = 10
+    busy_timeout = 5.0
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or CooperativeCursor)
+
+class CooperativeCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        return self._retry_busy(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._retry_busy(super().executemany, *args)
+
+    def _retry_busy(self, method, *args):
+        from eventlet import sleep
+        deadline = time.monotonic() + self.connection.busy_timeout
+        while True:
+            try:
+                return method(*args)
+            except sqlite3.OperationalError as error:
+                # Only a plain SQLITE_BUSY clears by waiting; BUSY_SNAPSHOT needs a rollback
+                code = getattr(error, 'sqlite_errorcode', None)
+                busy = code == SQLITE_BUSY if code is not None else str(error) == 'database is locked'
+                if not busy or time.monotonic() >= deadline:
+                    raise
+            sleep(self.connection.BUSY_SLICE_MS / 1000)
+
+def configure_database(app):
+    """Resolve the configured database URL and pick engine options for it."""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return
+    # Relative SQLite paths are relative to the project, not Flask's instance folder
+    if not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(basedir, url.database))
+        app.config['SQLALCHEMY_DATABASE_URI'] = str(url)
+    os.makedirs(os.path.dirname(url.database), exist_ok=True)
+    # Pooled connections are handed between request and Socket.IO threads
+    connect_args = {'check_same_thread': False}
+    if app.config['SOCKETIO_ASYNC_MODE'] == 'eventlet':
+        connect_args['factory'] = CooperativeConnection
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'poolclass': TimedQueuePool,
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'connect_args': connect_args
+    })
+
+configure_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
-# socketio = SocketIO(app, cors_allowed_origins="*")
-# socketio = SocketIO(app, cors_allowed_origins="*")
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+class RoutingSession(Session):
+    """Session that runs a view's queries on the engine it picked with ``reads_from``.
+
+    Flushes always go to the primary engine; any other write from a routed view
+    fails on its read-only connection rather than queueing behind billing writes.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            engine = read_engine(g.get('db_bind'))
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+def socketio_options(app):
+    """Pick the Socket.IO client manager for the configured message queue."""
+    url = app.config['SOCKETIO_MESSAGE_QUEUE']
+    if not url:
+        return {}
+    if url.startswith('sqlite://'):
+        if not os.path.isabs(socket_queue.path_from_url(url)):
+            url = 'sqlite:///' + os.path.join(basedir, socket_queue.path_from_url(url))
+        return {'client_manager': socket_queue.SQLiteQueueManager(url)}
+    return {'message_queue': url}
+
+class InstrumentedSocketIO(SocketIO):
+    """Counts every emit, including flask_socketio.emit() from handlers, by event name."""
+    def emit(self, event, *args, **kwargs):
+        metrics_registry.inc('cms_socketio_events_emitted_total', event=event)
+        return super().emit(event, *args, **kwargs)
+
+socketio = InstrumentedSocketIO(app, cors_allowed_origins="*", async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+                                **socketio_options(app))
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    pragmas = dict(app.config['SQLITE_PRAGMAS'])
+    if isinstance(dbapi_connection, CooperativeConnection) and 'busy_timeout' in pragmas:
+        dbapi_connection.busy_timeout = pragmas['busy_timeout'] / 1000
+        pragmas['busy_timeout'] = CooperativeConnection.BUSY_SLICE_MS
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def count_pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics_registry.inc('cms_db_pool_checkouts_total')
+    metrics_registry.inc('cms_db_pool_checked_out')
+
+def count_pool_checkin(dbapi_connection, connection_record):
+    metrics_registry.inc('cms_db_pool_checked_out', -1)
+
+SQLITE_LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+def is_sqlite_lock_error(error):
+    """Whether ``error`` is SQLite giving up on a lock (SQLITE_BUSY or SQLITE_LOCKED)."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)  # extended codes keep the primary one in the low byte
+    return str(error) in SQLITE_LOCK_MESSAGES
+
+def count_sqlite_busy(context):
+    if is_sqlite_lock_error(context.original_exception):
+        metrics_registry.inc('cms_db_sqlite_busy_total')
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', apply_sqlite_pragmas)
+        event.listen(db.engine, 'handle_error', count_sqlite_busy)
+    event.listen(db.engine, 'checkout', count_pool_checkout)
+    event.listen(db.engine, 'checkin', count_pool_checkin)
+    profiler = profiling.RequestProfiler(app, db.engine)
+
+# Read-only engines for read-heavy views, created in each worker on first use:
+# 'reporting' reads the live database through its own pool, 'snapshot' reads a
+# periodic copy of it. Views pick one with ``reads_from``; in-memory databases
+# (tests) have neither, so everything stays on the primary engine.
+read_engines = {}
+read_engines_lock = threading.Lock()
+snapshot_refresh_lock = threading.Lock()
+
+def primary_database_path():
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+def snapshot_path():
+    path = app.config['REPORTING_SNAPSHOT_PATH']
+    return path if os.path.isabs(path) else os.path.join(basedir, path)
+
+def apply_reporting_pragmas(dbapi_connection, connection_record):
+    # The journal settings belong to the writer; query_only backs up mode=ro
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        if name not in ('journal_mode', 'synchronous'):
+            cursor.execute(f'PRAGMA {name}={value}')
+    cursor.execute('PRAGMA query_only=1')
+    cursor.close()
+
+def create_read_engine(path, immutable=False):
+    """A pooled, read-only engine on the SQLite file at ``path``.
+
+    ``immutable`` is for snapshots, which are replaced rather than written: SQLite
+    then skips locking entirely, and pooled connections to a replaced file are
+    reopened on their next checkout.
+    """
+    query = 'mode=ro&immutable=1&uri=true' if immutable else 'mode=ro&uri=true'
+    engine = create_engine(f'sqlite:///file:{path}?{query}', poolclass=TimedQueuePool,
+                           pool_size=app.config['REPORTING_POOL_SIZE'],
+                           max_overflow=app.config['DB_MAX_OVERFLOW'],
+                           pool_timeout=app.config['DB_POOL_TIMEOUT'],
+                           connect_args={'check_same_thread': False})
+    if immutable:
+        def remember_file(dbapi_connection, connection_record):
+            connection_record.info['inode'] = os.stat(path).st_ino
+
+        def check_file(dbapi_connection, connection_record, connection_proxy):
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                return
+            if connection_record.info.get('inode') != inode:
+                raise exc.DisconnectionError('reporting snapshot was refreshed')
+        event.listen(engine, 'connect', remember_file)
+        # Ahead of the metrics listeners, so a discarded connection is not counted
+        event.listen(engine, 'checkout', check_file)
+    event.listen(engine, 'connect', apply_reporting_pragmas)
+    event.listen(engine, 'handle_error', count_sqlite_busy)
+    event.listen(engine, 'checkout', count_pool_checkout)
+    event.listen(engine, 'checkin', count_pool_checkin)
+    profiler.instrument(engine)
+    return engine
+
+def read_engine(name):
+    """The engine for reads routed to ``name``, or None to read from the primary."""
+    if name is None:
+        return None
+    engine = read_engines.get(name)
+    if engine is None:
+        database = primary_database_path()
+        if database is None or not app.config['REPORTING_READS']:
+            return None
+        with read_engines_lock:
+            engine = read_engines.get(name)
+            if engine is None:
+                engine = read_engines[name] = (create_read_engine(snapshot_path(), immutable=True)
+                                               if name == 'snapshot' else create_read_engine(database))
+    return engine
+
+def dispose_read_engines():
+    for engine in list(read_engines.values()):
+        engine.dispose()
+
+def snapshot_taken_at():
+    """When the reporting snapshot was copied, as a Unix time, or None if there is none."""
+    try:
+        return os.stat(snapshot_path()).st_mtime
+    except FileNotFoundError:
+        return None
+
+def refresh_reporting_snapshot(database=None):
+    """Copy the database to the reporting snapshot with SQLite's online backup API.
+
+    The copy is a single read transaction on the source, so it is consistent and,
+    in WAL mode, never blocks writers. It is written beside the snapshot and
+    renamed over it, stamped with the time the copy started. Returns False, doing
+    nothing, when another process is already refreshing it.
+    """
+    database = database or primary_database_path()
+    path = snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        partial = f'{path}.{os.getpid()}.tmp'
+        started = time.time()
+        source = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+        target = sqlite3.connect(partial)
+        try:
+            source.backup(target)
+            # Readers open the copy immutable, so it must not need a -wal file
+            target.execute('PRAGMA journal_mode=DELETE')
+        except BaseException:
+            target.close()
+            os.remove(partial)
+            raise
+        finally:
+            source.close()
+        target.close()
+        os.utime(partial, (started, started))
+        os.replace(partial, path)
+    return True
+
+def refresh_snapshot_in_background():
+    # One refresh at a time per worker; the file lock covers the other workers
+    if not snapshot_refresh_lock.acquire(blocking=False):
+        return
+
+    def refresh():
+        try:
+            refresh_reporting_snapshot()
+        except Exception:
+            app.logger.exception('Refreshing the reporting snapshot failed')
+        finally:
+            snapshot_refresh_lock.release()
+    socketio.start_background_task(refresh)
+
+def read_source(source):
+    """Where ``reads_from(source)`` reads right now.
+
+    The snapshot is only used with REPORTING_SNAPSHOT on and once a copy exists;
+    a stale copy is still served while a fresh one is taken in the background.
+    """
+    if source != 'snapshot':
+        return source
+    if not app.config['REPORTING_SNAPSHOT']:
+        return 'reporting'
+    taken = snapshot_taken_at()
+    if (taken is None or time.time() - taken > app.config['REPORTING_SNAPSHOT_MAX_AGE']) \
+            and primary_database_path() is not None:
+        refresh_snapshot_in_background()
+    return 'reporting' if taken is None else 'snapshot'
+
+@app.before_request
+def reset_read_source():
+    # Tests (and anything else) handling several requests in one app context
+    g.pop('db_bind', None)
+
+def reads_from(source):
+    """Run a view's, socket handler's or job's queries on a read-only engine.
+
+    ``'reporting'`` reads the live database through the reporting pool;
+    ``'snapshot'`` reads the periodic copy, whose age the page then shows. The
+    choice lasts for the request (or app context), including streamed responses.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.db_bind = read_source(source)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+@app.context_processor
+def inject_snapshot_age():
+    taken = snapshot_taken_at() if g.get('db_bind') == 'snapshot' else None
+    if taken is None:
+        return {}
+    return {'snapshot_taken_at': datetime.fromtimestamp(taken),
+            'snapshot_age_minutes': int((time.time() - taken) // 60)}
+
+@app.cli.command('refresh-snapshot')
+def refresh_snapshot_command():
+    """Copy the database to the reporting snapshot now (e.g. from cron)."""
+    if primary_database_path() is None:
+        raise click.ClickException('The reporting snapshot needs a SQLite database file.')
+    started = time.perf_counter()
+    if not refresh_reporting_snapshot():
+        raise click.ClickException('Another process is refreshing the snapshot.')
+    click.echo(f'Refreshed {snapshot_path()} in {time.perf_counter() - started:.2f}s.')
 
 
 # User Model
@@ -78,6 +449,11 @@ class Invoice(db.Model):
     delivery_date = db.Column(db.Date, nullable=True)
     destination = db.Column(db.String(100), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_invoice_customer_date', 'customer_id', 'date'),
+        db.Index('ix_invoice_date', 'date'),
+    )
+
 # InvoiceItem Model
 class InvoiceItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,6 +466,11 @@ class InvoiceItem(db.Model):
     gst_percent = db.Column(db.Float, nullable=False, default=0.0)
     amount = db.Column(db.Float, nullable=False, default=0.0)
 
+    __table_args__ = (
+        db.Index('ix_invoice_item_invoice_id', 'invoice_id'),
+        db.Index('ix_invoice_item_product_id', 'product_id'),
+    )
+
 # Update Customer Model
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -100,15 +481,27 @@ class Customer(db.Model):
     gstin = db.Column(db.String(20), nullable=True)
     credit_limit = db.Column(db.Float, nullable=False, default=0.0)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Running ledger totals, maintained by apply_balance_delta() in the same
+    # transaction as the invoice/transaction write that changes them.
+    invoiced_total = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    credited_total = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    paid_total = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    # Change marker for Socket.IO delta sync, stamped on every write
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     transactions = db.relationship('Transaction', backref='customer', lazy=True)
     invoices = db.relationship('Invoice', backref='customer', lazy=True)
 
-    @property
+    __table_args__ = (
+        db.Index('ix_customer_change_seq', 'change_seq', 'id'),
+    )
+
+    @hybrid_property
     def outstanding_balance(self):
-        total_invoices = sum(inv.total_amount for inv in self.invoices)
-        total_credits = sum(tx.amount for tx in self.transactions if tx.type == 'credit')
-        total_payments = sum(tx.amount for tx in self.transactions if tx.type == 'payment')
-        return total_invoices + total_credits - total_payments
+        return (self.invoiced_total or 0) + (self.credited_total or 0) - (self.paid_total or 0)
+
+    @outstanding_balance.expression
+    def outstanding_balance(cls):
+        return cls.invoiced_total + cls.credited_total - cls.paid_total
 
     def get_balance(self):
         return self.outstanding_balance
@@ -136,6 +529,16 @@ class Transaction(db.Model):
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     payment_mode = db.Column(db.String(50), nullable=True)
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=True)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_transaction_customer_type_date', 'customer_id', 'type', 'date'),
+        db.Index('ix_transaction_customer_date', 'customer_id', 'date'),
+        db.Index('ix_transaction_date', 'date'),
+        db.Index('ix_transaction_type_date', 'type', 'date'),
+        db.Index('ix_transaction_change_seq', 'change_seq', 'id'),
+        db.Index('ix_transaction_customer_change_seq', 'customer_id', 'change_seq', 'id'),
+    )
 
     def to_dict(self):
         return {
@@ -149,6 +552,1022 @@ class Transaction(db.Model):
             'invoice_id': self.invoice_id
         }
 
+# Daily ledger totals per customer and over all customers, kept in step with
+# every invoice and transaction write by triggers (see migrations.py)
+class LedgerRollup(db.Model):
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    invoiced = db.Column(db.Float, nullable=False, default=0.0)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    credited = db.Column(db.Float, nullable=False, default=0.0)
+    credit_count = db.Column(db.Integer, nullable=False, default=0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class LedgerDailyTotal(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    invoiced = db.Column(db.Float, nullable=False, default=0.0)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    credited = db.Column(db.Float, nullable=False, default=0.0)
+    credit_count = db.Column(db.Integer, nullable=False, default=0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+@event.listens_for(db.metadata, 'after_create')
+def create_ledger_rollup_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        migrations.create_ledger_rollup_triggers(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_ledger_rollup_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        migrations.drop_ledger_rollup_triggers(connection)
+
+# Monthly GST totals per HSN code, rate and B2B/B2C class, kept in step with
+# invoice item writes by triggers (see migrations.py)
+class GstSummary(db.Model):
+    month = db.Column(db.Date, primary_key=True)
+    hsn = db.Column(db.String(20), primary_key=True)
+    gst_percent = db.Column(db.Float, primary_key=True)
+    b2b = db.Column(db.Boolean, primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    taxable_value = db.Column(db.Float, nullable=False, default=0.0)
+    cgst = db.Column(db.Float, nullable=False, default=0.0)
+    sgst = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+@event.listens_for(db.metadata, 'after_create')
+def create_gst_summary_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        migrations.create_gst_summary_triggers(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_gst_summary_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        migrations.drop_gst_summary_triggers(connection)
+
+# Financial years moved out to archive files (see archive_financial_year)
+class ArchivedYear(db.Model):
+    financial_year = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 2023 is 2023-24
+    filename = db.Column(db.String(200), nullable=False)
+    start = db.Column(db.Date, nullable=False)
+    end = db.Column(db.Date, nullable=False)
+    invoice_count = db.Column(db.Integer, nullable=False)
+    item_count = db.Column(db.Integer, nullable=False)
+    transaction_count = db.Column(db.Integer, nullable=False)
+    first_invoice_id = db.Column(db.Integer, nullable=True)
+    last_invoice_id = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def label(self):
+        return financial_year_label(self.financial_year)
+
+# Each customer's ledger totals over the archived years, carried forward into
+# the first day still kept in the database (``as_of``)
+class LedgerOpening(db.Model):
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), primary_key=True, autoincrement=False)
+    as_of = db.Column(db.Date, nullable=False)
+    invoiced = db.Column(db.Float, nullable=False, default=0.0)
+    credited = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+
+    @property
+    def balance(self):
+        return self.invoiced + self.credited - self.paid
+
+LEDGER_ROLLUP_COLUMNS = migrations.LEDGER_ROLLUP_COLUMNS
+LedgerTotals = namedtuple('LedgerTotals', LEDGER_ROLLUP_COLUMNS)
+
+# Customer balance maintenance
+def apply_balance_delta(customer_id, invoiced=0.0, credited=0.0, paid=0.0):
+    """Adjust a customer's stored ledger totals inside the current transaction.
+
+    The increment is done in SQL so concurrent writers do not lose updates.
+    """
+    Customer.query.filter_by(id=customer_id).update({
+        Customer.invoiced_total: Customer.invoiced_total + invoiced,
+        Customer.credited_total: Customer.credited_total + credited,
+        Customer.paid_total: Customer.paid_total + paid,
+        Customer.change_seq: change_seq_for_transaction()
+    }, synchronize_session=False)
+
+def rebuild_customer_balances(fix=True):
+    """Recompute stored balances from the ledger and return the customers that drifted.
+
+    Each drift entry is ``(customer_id, column, stored, actual)``. With ``fix`` the
+    stored values are overwritten with the recomputed ones.
+    """
+    invoiced = dict(db.session.query(Invoice.customer_id, func.sum(Invoice.total_amount))
+                    .group_by(Invoice.customer_id).all())
+    credited = dict(db.session.query(Transaction.customer_id, func.sum(Transaction.amount))
+                    .filter(Transaction.type == 'credit').group_by(Transaction.customer_id).all())
+    paid = dict(db.session.query(Transaction.customer_id, func.sum(Transaction.amount))
+                .filter(Transaction.type == 'payment').group_by(Transaction.customer_id).all())
+    actual_totals = {'invoiced_total': ('invoiced', invoiced), 'credited_total': ('credited', credited),
+                     'paid_total': ('paid', paid)}
+    # Archived years only survive as the totals carried forward
+    openings = {row.customer_id: row for row in LedgerOpening.query.all()}
+
+    drift = []
+    for customer in Customer.query.all():
+        for column, (carried, totals) in actual_totals.items():
+            stored = getattr(customer, column) or 0.0
+            actual = (totals.get(customer.id) or 0.0) + getattr(openings.get(customer.id), carried, 0.0)
+            if abs(stored - actual) > 0.005:
+                drift.append((customer.id, column, stored, actual))
+                if fix:
+                    setattr(customer, column, actual)
+    if fix:
+        db.session.commit()
+    return drift
+
+@app.cli.command('rebuild-balances')
+@click.option('--verify', is_flag=True, help='Only report drift, do not fix it.')
+def rebuild_balances_command(verify):
+    """Verify or rebuild the stored customer balances."""
+    drift = rebuild_customer_balances(fix=not verify)
+    for customer_id, column, stored, actual in drift:
+        click.echo(f'customer {customer_id}: {column} stored={stored:.2f} actual={actual:.2f}')
+    if not drift:
+        click.echo('All customer balances match the ledger.')
+    elif verify:
+        raise SystemExit(1)
+    else:
+        click.echo(f'Fixed {len(drift)} drifted balance(s).')
+
+def rebuild_ledger_rollups(fix=True):
+    """Recompute the daily rollups from the ledger and return the values that drifted.
+
+    Each drift entry is ``(customer_id, day, column, stored, actual)``, where a
+    ``customer_id`` of None is the day's total over all customers. With ``fix``
+    both rollup tables are refilled from the invoice and transaction rows.
+    Days in archived financial years are left as they are.
+    """
+    since = archived_until()
+    rollups, daily_totals = LedgerRollup.query, LedgerDailyTotal.query
+    if since is not None:
+        rollups = rollups.filter(LedgerRollup.day >= since)
+        daily_totals = daily_totals.filter(LedgerDailyTotal.day >= since)
+    stored = {(row.customer_id, row.day): row for row in rollups}
+    stored.update(((None, row.day), row) for row in daily_totals)
+    actual = {}
+    for row in db.session.execute(text(migrations.LEDGER_ROLLUP_SELECT)):
+        day = datetime.strptime(row.day, '%Y-%m-%d').date()
+        actual[(row.customer_id, day)] = row._asdict()
+        daily = actual.setdefault((None, day), dict.fromkeys(LEDGER_ROLLUP_COLUMNS, 0))
+        for column in LEDGER_ROLLUP_COLUMNS:
+            daily[column] += row._mapping[column]
+
+    drift = []
+    for key in sorted(stored.keys() | actual.keys(), key=lambda key: (key[1], key[0] or 0)):
+        for column in LEDGER_ROLLUP_COLUMNS:
+            stored_value = getattr(stored.get(key), column, 0)
+            actual_value = actual.get(key, {}).get(column, 0)
+            if abs(stored_value - actual_value) > 0.005:
+                drift.append((key[0], key[1], column, stored_value, actual_value))
+    if fix:
+        migrations.fill_ledger_rollups(db.session.connection(), since)
+        db.session.commit()
+    return drift
+
+@app.cli.command('rebuild-rollups')
+@click.option('--verify', is_flag=True, help='Only report drift, do not fix it.')
+def rebuild_rollups_command(verify):
+    """Verify or rebuild the daily ledger rollups."""
+    drift = rebuild_ledger_rollups(fix=not verify)
+    for customer_id, day, column, stored, actual in drift:
+        owner = f'customer {customer_id}' if customer_id is not None else 'all customers'
+        click.echo(f'{owner} on {day}: {column} stored={stored:.2f} actual={actual:.2f}')
+    if not drift:
+        click.echo('All daily rollups match the ledger.')
+    elif verify:
+        raise SystemExit(1)
+    else:
+        click.echo(f'Fixed {len(drift)} drifted rollup value(s).')
+
+def rebuild_gst_summary(fix=True):
+    """Recompute the GST summary from the invoice items and return the values that drifted.
+
+    Each drift entry is ``(month, hsn, gst_percent, b2b, column, stored, actual)``.
+    With ``fix`` the summary table is refilled from the invoice items. Months in
+    archived financial years are left as they are.
+    """
+    columns = migrations.GST_SUMMARY_COLUMNS
+    since = archived_until()
+    summary = GstSummary.query if since is None else GstSummary.query.filter(GstSummary.month >= since)
+    stored = {(row.month, row.hsn, row.gst_percent, row.b2b): row for row in summary}
+    actual = {}
+    for row in db.session.execute(text(migrations.GST_SUMMARY_SELECT)):
+        month = datetime.strptime(row.month, '%Y-%m-%d').date()
+        actual[(month, row.hsn, row.gst_percent, bool(row.b2b))] = row._asdict()
+
+    drift = []
+    for key in sorted(stored.keys() | actual.keys()):
+        for column in columns:
+            stored_value = getattr(stored.get(key), column, 0)
+            actual_value = actual.get(key, {}).get(column, 0)
+            if abs(stored_value - actual_value) > 0.005:
+                drift.append(key + (column, stored_value, actual_value))
+    if fix:
+        migrations.fill_gst_summary(db.session.connection(), since)
+        db.session.commit()
+    return drift
+
+@app.cli.command('rebuild-gst-summary')
+@click.option('--verify', is_flag=True, help='Only report drift, do not fix it.')
+def rebuild_gst_summary_command(verify):
+    """Verify or rebuild the monthly HSN-wise GST summary."""
+    drift = rebuild_gst_summary(fix=not verify)
+    for month, hsn, gst_percent, b2b, column, stored, actual in drift:
+        kind = 'B2B' if b2b else 'B2C'
+        click.echo(f'{month:%Y-%m} HSN {hsn} at {gst_percent:g}% {kind}: '
+                   f'{column} stored={stored:.2f} actual={actual:.2f}')
+    if not drift:
+        click.echo('The GST summary matches the invoice items.')
+    elif verify:
+        raise SystemExit(1)
+    else:
+        click.echo(f'Fixed {len(drift)} drifted GST summary value(s).')
+
+# Financial-year archives
+def financial_year(when):
+    """The financial year (April to March) ``when`` falls in, named by the year it starts in."""
+    return when.year if when.month >= 4 else when.year - 1
+
+def financial_year_label(year):
+    return f'{year}-{(year + 1) % 100:02d}'
+
+def financial_year_bounds(year):
+    """First day of the financial year and first day of the next one."""
+    return datetime(year, 4, 1).date(), datetime(year + 1, 4, 1).date()
+
+def archived_until():
+    """First day whose ledger is still in the database, or None when no year is archived."""
+    return db.session.query(func.max(ArchivedYear.end)).scalar()
+
+def in_archived_year(when):
+    cutoff = archived_until()
+    return cutoff is not None and when < _midnight(cutoff)
+
+# Archive files hold plain copies of these tables, without foreign keys since
+# customers and products stay in the main database. Items keep their product's
+# name so an archived invoice still prints after the product is deleted.
+archive_metadata = MetaData(schema='archive')
+archive_tables = {
+    model.__tablename__: Table(model.__tablename__, archive_metadata,
+                               *(db.Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                                 for c in model.__table__.columns))
+    for model in (Invoice, InvoiceItem, Transaction)
+}
+archive_tables['invoice_item'].append_column(db.Column('product_name', db.String(100)))
+db.Index('ix_archive_invoice_number', archive_tables['invoice'].c.invoice_number, unique=True)
+db.Index('ix_archive_invoice_customer_date', archive_tables['invoice'].c.customer_id,
+         archive_tables['invoice'].c.date)
+db.Index('ix_archive_invoice_item_invoice_id', archive_tables['invoice_item'].c.invoice_id)
+db.Index('ix_archive_transaction_customer_date', archive_tables['transaction'].c.customer_id,
+         archive_tables['transaction'].c.date)
+
+def archive_path(archived):
+    return os.path.join(app.config['ARCHIVE_DIR'], archived.filename)
+
+@contextmanager
+def attached_archive(path):
+    """A connection to the main database with the archive file at ``path`` attached as ``archive``."""
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            yield conn
+        finally:
+            conn.exec_driver_sql('DETACH DATABASE archive')
+
+def archive_financial_year(year):
+    """Move a settled financial year's invoices, items and transactions to its own archive file.
+
+    Years are archived oldest first, and the current year and the
+    ARCHIVE_KEEP_YEARS before it are never archived. The daily rollups, the GST
+    summary and the stored customer totals keep covering the archived rows;
+    each customer's archived totals are carried forward in ``ledger_opening``.
+    Raises ValueError when the year cannot be archived; returns its ArchivedYear.
+    """
+    label = financial_year_label(year)
+    newest = financial_year(datetime.utcnow()) - app.config['ARCHIVE_KEEP_YEARS'] - 1
+    if year > newest:
+        raise ValueError(f'{label} is not settled yet; the newest year that can be archived is '
+                         f'{financial_year_label(newest)}.')
+    last_archived = db.session.query(func.max(ArchivedYear.financial_year)).scalar()
+    if last_archived is not None and last_archived >= year:
+        raise ValueError(f'{financial_year_label(last_archived)} is already archived.')
+    start, end = financial_year_bounds(year)
+    first = min(filter(None, (db.session.query(func.min(Invoice.date)).scalar(),
+                              db.session.query(func.min(Transaction.date)).scalar())), default=None)
+    if first is not None and first < _midnight(start):
+        raise ValueError(f'Archive {financial_year_label(financial_year(first))} first; '
+                         f'years are archived oldest first.')
+    db.session.commit()
+
+    os.makedirs(app.config['ARCHIVE_DIR'], exist_ok=True)
+    archived = ArchivedYear(financial_year=year, filename=f'cms-fy{year}.db', start=start, end=end)
+    path = archive_path(archived)
+    if os.path.exists(path):
+        os.remove(path)  # left behind by an interrupted run
+    invoice, item, transaction = (archive_tables[name] for name in ('invoice', 'invoice_item', 'transaction'))
+    in_year = lambda model: and_(model.date >= _midnight(start), model.date < _midnight(end))
+    try:
+        with attached_archive(path) as conn:
+            with conn.begin():
+                archive_metadata.create_all(conn)
+                conn.execute(invoice.insert().from_select(
+                    [c.name for c in invoice.columns], select(Invoice.__table__).where(in_year(Invoice))))
+                item_columns = [c.name for c in InvoiceItem.__table__.columns]
+                conn.execute(item.insert().from_select(
+                    item_columns + ['product_name'],
+                    select(*InvoiceItem.__table__.columns, Product.name)
+                    .join(invoice, invoice.c.id == InvoiceItem.invoice_id)
+                    .outerjoin(Product, Product.id == InvoiceItem.product_id)))
+                conn.execute(transaction.insert().from_select(
+                    [c.name for c in transaction.columns],
+                    select(Transaction.__table__).where(in_year(Transaction))))
+
+            archived.invoice_count, archived.first_invoice_id, archived.last_invoice_id = conn.execute(
+                select(func.count(), func.min(invoice.c.id), func.max(invoice.c.id))).one()
+            archived.item_count = conn.execute(select(func.count()).select_from(item)).scalar()
+            archived.transaction_count = conn.execute(select(func.count()).select_from(transaction)).scalar()
+            archived.archived_at = datetime.utcnow()
+
+            with conn.begin():
+                # pysqlite opens the transaction at the first INSERT, so the
+                # balances go first and the trigger swap below is part of it
+                conn.execute(text(
+                    'INSERT INTO ledger_opening (customer_id, as_of, invoiced, credited, paid) '
+                    'SELECT customer_id, :end, SUM(invoiced), SUM(credited), SUM(paid) FROM ('
+                    'SELECT customer_id, total_amount AS invoiced, 0 AS credited, 0 AS paid FROM archive.invoice '
+                    'UNION ALL SELECT customer_id, 0, '
+                    "CASE WHEN type = 'credit' THEN amount ELSE 0 END, "
+                    "CASE WHEN type = 'payment' THEN amount ELSE 0 END FROM archive.\"transaction\""
+                    ') WHERE true GROUP BY customer_id '
+                    'ON CONFLICT (customer_id) DO UPDATE SET invoiced = invoiced + excluded.invoiced, '
+                    'credited = credited + excluded.credited, paid = paid + excluded.paid'), {'end': end})
+                conn.execute(LedgerOpening.__table__.update().values(as_of=end))
+                # The rollups and the GST summary keep the archived rows' totals
+                migrations.drop_ledger_rollup_triggers(conn)
+                migrations.drop_gst_summary_triggers(conn)
+                conn.execute(text('DELETE FROM main.invoice_item WHERE invoice_id IN (SELECT id FROM archive.invoice)'))
+                conn.execute(text('DELETE FROM main.invoice WHERE id IN (SELECT id FROM archive.invoice)'))
+                conn.execute(text('DELETE FROM main."transaction" WHERE id IN (SELECT id FROM archive."transaction")'))
+                # Synced transaction tables drop the archived rows
+                bump_cache_version('sync', conn)
+                conn.execute(text(
+                    'INSERT INTO sync_tombstone (entity, row_id, customer_id, change_seq) '
+                    'SELECT \'transaction\', id, customer_id, '
+                    '(SELECT version FROM cache_version WHERE name = \'sync\') FROM archive."transaction"'))
+                migrations.create_ledger_rollup_triggers(conn)
+                migrations.create_gst_summary_triggers(conn)
+                conn.execute(ArchivedYear.__table__.insert().values(
+                    {c.name: getattr(archived, c.name) for c in ArchivedYear.__table__.columns}))
+                # Invoice ids are not AUTOINCREMENT, so new invoices can reuse archived ones
+                bump_cache_version('invoice_render', conn)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    invoice_render_cache.expire()
+    dashboard_stats.invalidate()
+    return db.session.get(ArchivedYear, year)
+
+@app.cli.command('archive-year')
+@click.argument('year', type=int)
+@click.option('--vacuum', is_flag=True, help='Compact the database file afterwards (locks it while running).')
+def archive_year_command(year, vacuum):
+    """Archive financial year YEAR (April YEAR to March YEAR+1) into its own database file."""
+    try:
+        archived = archive_financial_year(year)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'Archived {financial_year_label(year)} to {archive_path(archived)}: '
+               f'{archived.invoice_count} invoice(s), {archived.item_count} item(s), '
+               f'{archived.transaction_count} transaction(s).')
+    if vacuum:
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+        click.echo('Database compacted.')
+
+def fetch_archived_invoice(archived, invoice_id=None, invoice_number=None):
+    """``(invoice, items)`` from an archived year's file, or None when it is not there.
+
+    Items are dicts with the product name under ``product``, as the invoice
+    templates expect.
+    """
+    path = archive_path(archived)
+    if not os.path.exists(path):
+        abort(404, f'The archive for {archived.label} is missing.')
+    invoice_table, item_table = archive_tables['invoice'], archive_tables['invoice_item']
+    match = (invoice_table.c.id == invoice_id) if invoice_number is None \
+        else (invoice_table.c.invoice_number == invoice_number)
+    with attached_archive(path) as conn:
+        invoice = conn.execute(select(invoice_table).where(match)).first()
+        if invoice is None:
+            return None
+        items = conn.execute(select(item_table).where(item_table.c.invoice_id == invoice.id)
+                             .order_by(item_table.c.id)).all()
+    return invoice, [dict(item._mapping, product={'name': item.product_name}) for item in items]
+
+def find_archived_invoice(invoice_id):
+    """``(archived_year, invoice, items)`` for an invoice that was archived, or None."""
+    candidates = ArchivedYear.query.filter(ArchivedYear.first_invoice_id <= invoice_id,
+                                           ArchivedYear.last_invoice_id >= invoice_id) \
+        .order_by(ArchivedYear.financial_year)
+    for archived in candidates:
+        found = fetch_archived_invoice(archived, invoice_id)
+        if found is not None:
+            return (archived, *found)
+    return None
+
+def _midnight(value):
+    return datetime.combine(value, datetime.min.time())
+
+def ledger_totals(start=None, end=None, customer_id=None):
+    """Ledger totals for ``start <= date < end`` as ``LedgerTotals``; either bound may be open.
+
+    Whole days are summed from the daily rollups: the per-customer ones for a
+    single customer, the all-customer ones otherwise, so a range on day
+    boundaries costs one query over at most one row per day. A bound that falls
+    inside a day leaves that part of the day to be read from the raw invoice and
+    transaction rows.
+    """
+    start = _midnight(start) if start is not None and not isinstance(start, datetime) else start
+    end = _midnight(end) if end is not None and not isinstance(end, datetime) else end
+    # Whole days in range are [first_day, end_day); the rest is read from raw rows
+    first_day = start and (start.date() if start == _midnight(start) else start.date() + timedelta(days=1))
+    end_day = end and end.date()
+    whole_days = not (first_day and end_day and first_day >= end_day)
+
+    raw_ranges = []
+    if not whole_days:
+        raw_ranges.append((start, end))
+    if whole_days and start is not None and start != _midnight(first_day):
+        raw_ranges.append((start, _midnight(first_day)))
+    if whole_days and end is not None and end != _midnight(end_day):
+        raw_ranges.append((_midnight(end_day), end))
+
+    totals = dict.fromkeys(LEDGER_ROLLUP_COLUMNS, 0)
+    if whole_days:
+        model = LedgerRollup if customer_id else LedgerDailyTotal
+        filters = []
+        if first_day:
+            filters.append(model.day >= first_day)
+        if end_day:
+            filters.append(model.day < end_day)
+        if customer_id:
+            filters.append(model.customer_id == customer_id)
+        row = db.session.query(*(func.sum(getattr(model, name)) for name in LEDGER_ROLLUP_COLUMNS)) \
+            .filter(*filters).one()
+        totals.update((name, value or 0) for name, value in zip(LEDGER_ROLLUP_COLUMNS, row))
+
+    if raw_ranges:
+        def in_ranges(model):
+            filters = [or_(*(and_(model.date >= low, model.date < high) for low, high in raw_ranges))]
+            if customer_id:
+                filters.append(model.customer_id == customer_id)
+            return filters
+        invoiced, invoice_count = db.session.query(func.sum(Invoice.total_amount), func.count(Invoice.id)) \
+            .filter(*in_ranges(Invoice)).one()
+        totals['invoiced'] += invoiced or 0
+        totals['invoice_count'] += invoice_count
+        for type, amount, count in db.session.query(Transaction.type, func.sum(Transaction.amount),
+                                                    func.count(Transaction.id)) \
+                .filter(*in_ranges(Transaction)).group_by(Transaction.type).all():
+            if type == 'credit':
+                totals['credited'] += amount or 0
+                totals['credit_count'] += count
+            elif type == 'payment':
+                totals['paid'] += amount or 0
+                totals['payment_count'] += count
+    return LedgerTotals(**totals)
+
+# Dashboard statistics
+RecentTransaction = namedtuple('RecentTransaction', 'id customer_id customer_name type amount date')
+
+class DashboardStats:
+    """Cached snapshot of the dashboard's headline figures and recent transactions.
+
+    Writes in this process patch the snapshot in place after they commit. Writes
+    made by other workers are picked up when the snapshot's TTL runs out. A
+    reload that a patch or invalidation overtakes is served once but not kept,
+    since it may have been read before that write committed.
+    """
+    RECENT_LIMIT = 10
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.patches = 0
+        self.invalidations = 0
+
+    def get(self):
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshot
+            if (snapshot is not None and now - self._loaded_at < self.ttl
+                    and snapshot['day'] == datetime.utcnow().date()):
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            generation = self._generation
+        snapshot = self._load()
+        with self._lock:
+            if self._generation == generation:
+                self._snapshot = snapshot
+                self._loaded_at = now
+        return snapshot
+
+    def _load(self):
+        today = datetime.utcnow().date()
+        day_start = datetime.combine(today, datetime.min.time())
+        totals = db.session.query(
+            func.count(Customer.id),
+            func.coalesce(func.sum(Customer.outstanding_balance), 0),
+            func.coalesce(func.sum(Customer.credited_total), 0)
+        ).one()
+        today_payments = ledger_totals(day_start, day_start + timedelta(days=1)).paid
+        rows = db.session.query(
+            Transaction.id, Transaction.customer_id, Customer.name,
+            Transaction.type, Transaction.amount, Transaction.date
+        ).outerjoin(Customer, Customer.id == Transaction.customer_id) \
+            .order_by(Transaction.date.desc()).limit(self.RECENT_LIMIT).all()
+        return {
+            'day': today,
+            'total_customers': totals[0],
+            'total_credit': totals[1],
+            'today_payments': today_payments,
+            'pending_payments': totals[2],
+            'recent_transactions': tuple(RecentTransaction(*row) for row in rows)
+        }
+
+    def _patch(self, update):
+        with self._lock:
+            self._generation += 1
+            if self._snapshot is None:
+                return
+            snapshot = dict(self._snapshot)
+            update(snapshot)
+            self._snapshot = snapshot
+            self.patches += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+            self.invalidations += 1
+
+    def record_transaction(self, transaction, customer_name):
+        """Fold a committed credit or payment into the snapshot."""
+        def update(snapshot):
+            if transaction.type == 'credit':
+                snapshot['total_credit'] += transaction.amount
+                snapshot['pending_payments'] += transaction.amount
+            elif transaction.type == 'payment':
+                snapshot['total_credit'] -= transaction.amount
+                if transaction.date.date() == snapshot['day']:
+                    snapshot['today_payments'] += transaction.amount
+            recent = list(snapshot['recent_transactions'])
+            recent.append(RecentTransaction(transaction.id, transaction.customer_id, customer_name,
+                                            transaction.type, transaction.amount, transaction.date))
+            recent.sort(key=lambda t: t.date, reverse=True)
+            snapshot['recent_transactions'] = tuple(recent[:self.RECENT_LIMIT])
+        self._patch(update)
+
+    def record_invoice(self, amount):
+        """Fold a committed invoice (negative amount for a deletion) into the snapshot."""
+        def update(snapshot):
+            snapshot['total_credit'] += amount
+        self._patch(update)
+
+    def record_customer_added(self):
+        def update(snapshot):
+            snapshot['total_customers'] += 1
+        self._patch(update)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'patches': self.patches,
+                'invalidations': self.invalidations,
+                'ttl': self.ttl,
+                'cached': self._snapshot is not None
+            }
+
+dashboard_stats = DashboardStats(ttl=app.config['DASHBOARD_CACHE_TTL'])
+
+# Cross-worker cache versions
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+def bump_cache_version(name, conn=None):
+    """Invalidate cache ``name`` in every worker, as part of the current transaction
+    of ``conn`` (the session's by default)."""
+    conn = conn or db.session
+    table = CacheVersion.__table__
+    conn.execute(table.insert().from_select(
+        ['name', 'version'],
+        select(literal(name), literal(0)).where(~exists().where(table.c.name == name))))
+    conn.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+
+def read_cache_version(name):
+    return db.session.query(CacheVersion.version).filter_by(name=name).scalar() or 0
+
+# Change tracking for Socket.IO delta sync
+class SyncTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    customer_id = db.Column(db.Integer)  # the deleted transaction's customer
+    change_seq = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstone_entity_seq', 'entity', 'change_seq'),
+    )
+
+def current_change_seq():
+    return read_cache_version('sync')
+
+def change_seq_for_transaction():
+    """Return the change marker shared by every row written in the current transaction.
+
+    The marker is the ``sync`` cache version, bumped once per transaction. SQLite
+    serialises writers, so markers increase in commit order.
+    """
+    seq = db.session.info.get('change_seq')
+    if seq is None:
+        bump_cache_version('sync')
+        seq = db.session.info['change_seq'] = current_change_seq()
+    return seq
+
+@event.listens_for(db.session, 'before_flush')
+def stamp_sync_changes(session, flush_context, instances):
+    changed = [obj for obj in list(session.new) + list(session.dirty)
+               if isinstance(obj, (Customer, Transaction))]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Customer, Transaction))]
+    if not changed and not deleted:
+        return
+    seq = change_seq_for_transaction()
+    for obj in changed:
+        obj.change_seq = seq
+    for obj in deleted:
+        if isinstance(obj, Customer):
+            session.add(SyncTombstone(entity='customer', row_id=obj.id, change_seq=seq))
+        else:
+            session.add(SyncTombstone(entity='transaction', row_id=obj.id, customer_id=obj.customer_id,
+                                      change_seq=seq))
+
+@event.listens_for(db.session, 'after_transaction_end')
+def reset_change_seq(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('change_seq', None)
+
+# Product catalog cache
+CatalogProduct = namedtuple('CatalogProduct', 'id name hsn gst_percent price')
+CatalogSnapshot = namedtuple('CatalogSnapshot', 'version products by_id')
+
+class CatalogCache:
+    """Immutable per-worker snapshot of the product catalog.
+
+    Each read costs one query for the catalog version; the table itself is only
+    reloaded after add_product/edit_product/delete_product bump that version.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        version = read_cache_version('catalog')
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            self.hits += 1
+            return snapshot
+        with self._lock:
+            self.misses += 1
+            products = tuple(CatalogProduct(*row) for row in db.session.query(
+                Product.id, Product.name, Product.hsn, Product.gst_percent, Product.price
+            ).order_by(Product.id))
+            snapshot = CatalogSnapshot(
+                version=version,
+                products=products,
+                by_id=MappingProxyType({p.id: p for p in products})
+            )
+            self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'version': self._snapshot.version if self._snapshot else None
+        }
+
+catalog_cache = CatalogCache()
+
+# Full-text search. The FTS5 tables and their sync triggers are defined in
+# migrations.py; fresh databases get them together with the model tables.
+SEARCH_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+customer_search = table('customer_search', column('rowid'), column('rank'))
+product_search = table('product_search', column('rowid'), column('rank'))
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        migrations.create_search_indexes(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        migrations.drop_search_indexes(connection)
+
+def fts_prefix_query(terms):
+    """FTS5 query matching rows that contain every word of ``terms`` as a word prefix."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', terms))
+
+def search_rows(model, index, terms, limit):
+    """Best ``limit`` matches of ``terms`` in ``index``, as ``model`` rows, in one query."""
+    match = fts_prefix_query(terms)
+    if not match:
+        return []
+    return (model.query.join(index, index.c.rowid == model.id)
+            .filter(text(f'{index.name} MATCH :match')).params(match=match)
+            .order_by(index.c.rank).limit(limit).all())
+
+# Invoice render cache
+INVOICE_RENDER_CUSTOMER_PREFIX = 'invoice_render:'
+
+def invalidate_invoice_renders(customer_id=None):
+    """Drop the rendered invoices of ``customer_id`` (all of them when None) in every
+    worker, as part of the current transaction."""
+    if customer_id is None:
+        bump_cache_version('invoice_render')
+    else:
+        bump_cache_version(f'{INVOICE_RENDER_CUSTOMER_PREFIX}{customer_id}')
+        bump_cache_version('invoice_render_customers')
+    db.session.info['invoice_render_changed'] = True
+
+class RenderCache:
+    """Byte-bounded LRU cache of rendered invoice HTML.
+
+    Entries are keyed by invoice id, template name and a checksum of the template
+    source and of every template it includes, so edited templates or partials are
+    never served stale. Customer edits and invoice deletions bump the customer's
+    ``invoice_render:<id>`` version, which drops only that customer's invoices;
+    archiving bumps ``invoice_render``, which drops everything. Each worker reads
+    the versions at most every ``check_interval`` seconds, and right after its own
+    invalidating commits.
+    """
+    def __init__(self, max_bytes, check_interval=1.0):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._versions = None
+        self._next_check = 0.0
+        self._template_versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def template_version(self, template):
+        """Checksum of a template and the templates it references; call with ``self._lock`` held."""
+        cached = self._template_versions.get(template)
+        if cached is None or not all(uptodate() for uptodate in cached[1]):
+            env = app.jinja_env
+            checksum, uptodates, pending, seen = 0, [], [template], set()
+            while pending:
+                name = pending.pop()
+                if name in seen:
+                    continue
+                seen.add(name)
+                source, _, uptodate = env.loader.get_source(env, name)
+                checksum = zlib.crc32(source.encode(), checksum)
+                uptodates.append(uptodate or (lambda: True))
+                # Names built at render time come back as None and cannot be followed
+                pending.extend(filter(None, meta.find_referenced_templates(env.parse(source))))
+            cached = (checksum, tuple(uptodates))
+            self._template_versions[template] = cached
+        return cached[0]
+
+    def _key(self, invoice_id, template):
+        return (invoice_id, template, self.template_version(template))
+
+    def expire(self):
+        """Read the versions again on the next lookup."""
+        self._next_check = 0.0
+
+    def _refresh(self):
+        """Apply invalidations committed since the last check; the reads run outside the lock."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        markers = dict(db.session.query(CacheVersion.name, CacheVersion.version)
+                       .filter(CacheVersion.name.in_(('invoice_render', 'invoice_render_customers'))))
+        markers = (markers.get('invoice_render', 0), markers.get('invoice_render_customers', 0))
+        previous = self._versions
+        if previous is not None and previous[0] == markers:
+            return
+        customers = {int(name[len(INVOICE_RENDER_CUSTOMER_PREFIX):]): version
+                     for name, version in db.session.query(CacheVersion.name, CacheVersion.version)
+                     .filter(CacheVersion.name.startswith(INVOICE_RENDER_CUSTOMER_PREFIX, autoescape=True))}
+        with self._lock:
+            previous = self._versions
+            if previous is None or previous[0][0] != markers[0]:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                changed = {customer_id for customer_id, version in customers.items()
+                           if previous[1].get(customer_id) != version}
+                for key in [key for key, (_, customer_id) in self._entries.items() if customer_id in changed]:
+                    self._bytes -= len(self._entries.pop(key)[0].encode())
+            self._versions = (markers, customers)
+
+    def get(self, invoice_id, template):
+        self._refresh()
+        with self._lock:
+            key = self._key(invoice_id, template)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, invoice_id, template, html, customer_id=None):
+        size = len(html.encode())
+        if size > self.max_bytes:
+            return
+        self._refresh()
+        with self._lock:
+            key = self._key(invoice_id, template)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0].encode())
+            self._entries[key] = (html, customer_id)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.encode())
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._versions = None
+            self._next_check = 0.0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+invoice_render_cache = RenderCache(max_bytes=app.config['INVOICE_RENDER_CACHE_BYTES'],
+                                   check_interval=app.config['INVOICE_RENDER_CHECK_INTERVAL'])
+
+@event.listens_for(db.session, 'after_commit')
+def expire_invoice_renders(session):
+    # This worker sees its own invalidations at once, without waiting for the interval
+    if session.info.pop('invoice_render_changed', False):
+        invoice_render_cache.expire()
+
+def render_invoice(template, invoice_id, archived=None):
+    """Render an invoice template, serving repeat views from the render cache.
+
+    Invoices no longer in the database are read from their year's archive file;
+    ``archived`` passes on a ``find_archived_invoice`` result already looked up.
+    """
+    html = invoice_render_cache.get(invoice_id, template)
+    if html is None:
+        invoice = Invoice.query.get(invoice_id) if archived is None else None
+        if invoice is not None:
+            items = InvoiceItem.query.options(joinedload(InvoiceItem.product)) \
+                .filter_by(invoice_id=invoice.id).all()
+        else:
+            archived = archived or find_archived_invoice(invoice_id)
+            if archived is None:
+                abort(404)
+            _, invoice, items = archived
+        customer = Customer.query.get(invoice.customer_id)
+        html = render_template(template, invoice=invoice, customer=customer, items=items)
+        invoice_render_cache.put(invoice_id, template, html, customer_id=invoice.customer_id)
+    return html
+
+# Invoice numbering
+class InvoiceSequence(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+class InvoiceNumberAllocator:
+    """Hands out invoice numbers from the invoice_sequence table.
+
+    With ``block_size`` 1 every number is taken by an atomic increment inside the
+    caller's transaction, so a rolled back invoice gives its number back. A larger
+    block size reserves that many numbers per worker in one short transaction and
+    serves them from memory; numbers left in a block when the worker exits are
+    skipped. In ``financial_year`` scope numbering restarts every April and the
+    year is encoded in the number (2024-25 invoice 17 is ``202400017``).
+    """
+    FY_MULTIPLIER = 100000
+
+    def __init__(self, block_size=1, scope='global'):
+        self.block_size = block_size
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def sequence_for(self, date):
+        """Return the sequence name and the number offset for an invoice date."""
+        if self.scope != 'financial_year':
+            return 'invoice', 0
+        year = financial_year(date)
+        return f'invoice-fy{year}', year * self.FY_MULTIPLIER
+
+    def allocate(self, date):
+        name, offset = self.sequence_for(date)
+        if self.block_size <= 1:
+            return offset + self._reserve(db.session, name, offset, 1)
+        with self._lock:
+            next_value, end = self._blocks.get(name, (0, 0))
+            if next_value >= end:
+                with db.engine.begin() as conn:
+                    next_value = self._reserve(conn, name, offset, self.block_size)
+                end = next_value + self.block_size
+            self._blocks[name] = (next_value + 1, end)
+        return offset + next_value
+
+    def peek(self, date):
+        """Preview the next number without reserving it."""
+        name, offset = self.sequence_for(date)
+        with self._lock:
+            next_value, end = self._blocks.get(name, (0, 0))
+        if next_value < end:
+            return offset + next_value
+        stored = db.session.query(InvoiceSequence.next_value).filter_by(name=name).scalar()
+        return offset + (stored if stored is not None else self._seed(db.session, offset))
+
+    def _seed(self, conn, offset):
+        """First free number for a sequence that has no row yet."""
+        query = select(func.max(Invoice.invoice_number))
+        if self.scope == 'financial_year':
+            query = query.where(Invoice.invoice_number.between(offset, offset + self.FY_MULTIPLIER - 1))
+        last = conn.execute(query).scalar()
+        return (last - offset + 1) if last else 1
+
+    def _reserve(self, conn, name, offset, count):
+        """Atomically take ``count`` numbers from a sequence and return the first one."""
+        table = InvoiceSequence.__table__
+        conn.execute(table.insert().from_select(
+            ['name', 'next_value'],
+            select(literal(name), literal(self._seed(conn, offset)))
+            .where(~exists().where(table.c.name == name))))
+        # The UPDATE takes the write lock, so the SELECT below sees our increment only
+        conn.execute(table.update().where(table.c.name == name)
+                     .values(next_value=table.c.next_value + count))
+        return conn.execute(select(table.c.next_value).where(table.c.name == name)).scalar() - count
+
+invoice_numbers = InvoiceNumberAllocator(block_size=app.config['INVOICE_NUMBER_BLOCK_SIZE'],
+                                         scope=app.config['INVOICE_NUMBER_SCOPE'])
+
 # Authentication middleware
 def login_required(f):
     @wraps(f)
@@ -170,33 +1589,133 @@ def admin_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def query_budget(statements, archived=None):
+    """Declare the most SQL statements one call of a view or socket handler may issue.
+
+    The budget must hold however large the tables get, so anything that loops
+    over rows issuing queries (lazy relationships, per-row lookups) breaks it;
+    tests/test_query_budgets.py enforces it. Apply it directly above the ``def``.
+    Views that can fall back to an archive file declare that path's budget,
+    ATTACH and DETACH included, separately as ``archived`` (see
+    tests/test_archive.py), so the everyday budget stays tight.
+    """
+    def decorator(f):
+        f.query_budget = statements
+        if archived is not None:
+            f.archived_query_budget = archived
+        return f
+    return decorator
+
 # Routes
 @app.route('/')
 @login_required
+@reads_from('reporting')
+@query_budget(3)
 def index():
-    # Get statistics
-    total_customers = Customer.query.count()
-    total_credit = sum(customer.get_balance() for customer in Customer.query.all())
-    today = datetime.utcnow().date()
-    today_payments = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.type == 'payment',
-        func.date(Transaction.date) == today
-    ).scalar() or 0
-    pending_payments = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.type == 'credit'
-    ).scalar() or 0
-
-    # Get recent transactions
-    recent_transactions = Transaction.query.order_by(Transaction.date.desc()).limit(10).all()
-
+    snapshot = dashboard_stats.get()
     return render_template('dashboard.html',
-                         total_customers=total_customers,
-                         total_credit=total_credit,
-                         today_payments=today_payments,
-                         pending_payments=pending_payments,
-                         recent_transactions=recent_transactions)
+                         total_customers=snapshot['total_customers'],
+                         total_credit=snapshot['total_credit'],
+                         today_payments=snapshot['today_payments'],
+                         pending_payments=snapshot['pending_payments'],
+                         recent_transactions=snapshot['recent_transactions'],
+                         recent_limit=DashboardStats.RECENT_LIMIT)
+
+@app.route('/cache_stats')
+@login_required
+@admin_required
+@query_budget(0)
+def cache_stats():
+    return jsonify({
+        'dashboard': dashboard_stats.stats(),
+        'catalog': catalog_cache.stats(),
+        'invoice_render': invoice_render_cache.stats()
+    })
+
+# Metrics and health
+def metrics_store_path(path):
+    return path if os.path.isabs(path) else os.path.join(basedir, path)
+
+metrics_store = (metrics.SQLiteMetricsStore(metrics_store_path(app.config['METRICS_DB']))
+                 if app.config['METRICS_DB'] else None)
+
+@metrics_registry.collect
+def cache_metrics():
+    for name, cache in (('dashboard', dashboard_stats), ('catalog', catalog_cache),
+                        ('invoice_render', invoice_render_cache)):
+        stats = cache.stats()
+        yield 'cms_cache_hits_total', {'cache': name}, stats['hits']
+        yield 'cms_cache_misses_total', {'cache': name}, stats['misses']
+
+def cache_hit_ratios(values):
+    for (name, labels), hits in values.items():
+        if name == 'cms_cache_hits_total':
+            lookups = hits + values.get(('cms_cache_misses_total', labels), 0)
+            yield labels, hits / lookups if lookups else 0.0
+
+metrics_registry.derive('cms_cache_hit_ratio', 'Cache hits per lookup across all workers since start.',
+                        cache_hit_ratios)
+
+def publish_metrics():
+    """Write this worker's metrics to the shared store now (also run on worker exit)."""
+    if metrics_store is not None:
+        metrics_store.write(metrics_registry.snapshot())
+
+@app.before_request
+def start_request_metrics():
+    g._metrics_started = time.perf_counter()
+    metrics_registry.inc('cms_http_requests_in_flight')
+    if metrics_store is not None:
+        metrics_store.start_publisher(metrics_registry, app.config['METRICS_PUBLISH_INTERVAL'],
+                                      socketio.start_background_task, socketio.sleep)
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('_metrics_started')
+    if started is not None:
+        # Unmatched URLs share one label so scanners cannot blow up the series count
+        endpoint = request.endpoint or 'unmatched'
+        metrics_registry.observe('cms_http_request_duration_seconds', time.perf_counter() - started,
+                                 endpoint=endpoint, method=request.method)
+        metrics_registry.inc('cms_http_responses_total', endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if g.pop('_metrics_started', None) is not None:
+        metrics_registry.inc('cms_http_requests_in_flight', -1)
+
+@app.route('/metrics')
+@query_budget(0)
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif request.remote_addr not in ('127.0.0.1', '::1') or 'X-Forwarded-For' in request.headers:
+        # Without a token only a scraper on this host gets in, not clients relayed by a proxy
+        abort(403)
+    if metrics_store is None:
+        body = metrics_registry.render()
+    else:
+        publish_metrics()
+        body = metrics_registry.render(metrics_store.read())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+@query_budget(1)
+def healthz():
+    """Liveness probe: one round trip to the database, timed."""
+    started = time.perf_counter()
+    try:
+        db.session.execute(select(literal(1))).scalar()
+    except Exception as exc:
+        app.logger.warning('Health check failed: %s', exc)
+        return jsonify({'status': 'error', 'error': type(exc).__name__}), 503
+    return jsonify({'status': 'ok', 'db_ms': round((time.perf_counter() - started) * 1000, 3)})
 
 @app.route('/login', methods=['GET', 'POST'])
+@query_budget(0)
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -223,12 +1742,16 @@ def logout():
 # Customer Management Routes
 @app.route('/customers')
 @login_required
+@query_budget(2)
 def customers():
+    # Read the marker before the rows so the page's sync cursor never skips a change
+    sync_cursor = current_change_seq()
     customers = Customer.query.all()
-    return render_template('customers.html', customers=customers)
+    return render_template('customers.html', customers=customers, sync_cursor=sync_cursor)
 
 @app.route('/add_customer', methods=['GET', 'POST'])
 @login_required
+@query_budget(0)
 def add_customer():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -243,6 +1766,8 @@ def add_customer():
         customer = Customer(name=name, email=email, phone=phone, address=address, gstin=gstin, credit_limit=credit_limit)
         db.session.add(customer)
         db.session.commit()
+        dashboard_stats.record_customer_added()
+        publish_customer(customer, event='customer_added')
         flash('Customer added successfully.', 'success')
         return redirect(url_for('customers'))
     return render_template('add_customer.html')
@@ -250,6 +1775,7 @@ def add_customer():
 @app.route('/edit_customer/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@query_budget(1)
 def edit_customer(id):
     customer = Customer.query.get_or_404(id)
     if request.method == 'POST':
@@ -259,35 +1785,169 @@ def edit_customer(id):
         customer.address = request.form.get('address')
         customer.gstin = request.form.get('gstin')
         customer.credit_limit = float(request.form.get('credit_limit', 0))
+        invalidate_invoice_renders(customer.id)
         db.session.commit()
+        publish_customer(customer)
         flash('Customer updated successfully.', 'success')
         return redirect(url_for('customers'))
     return render_template('edit_customer.html', customer=customer)
 
 @app.route('/view_customer/<int:id>')
 @login_required
+@query_budget(4)
 def view_customer(id):
     customer = Customer.query.get_or_404(id)
-    invoices = Invoice.query.filter_by(customer_id=id).all()
-    payments = Transaction.query.filter_by(customer_id=id, type='payment').all()
-    return render_template('view_customer.html', customer=customer, invoices=invoices, payments=payments)
+    # Read the marker before the rows so the transactions table's sync cursor never skips a change
+    sync_cursor = current_change_seq()
+    # The full history is on the statement page
+    invoices = Invoice.query.filter_by(customer_id=id) \
+        .order_by(Invoice.date.desc(), Invoice.id.desc()).limit(CUSTOMER_RECENT_LIMIT).all()
+    transactions = Transaction.query.filter_by(customer_id=id) \
+        .order_by(Transaction.date.desc(), Transaction.id.desc()).limit(CUSTOMER_RECENT_LIMIT).all()
+    return render_template('view_customer.html', customer=customer, invoices=invoices, transactions=transactions,
+                           recent_limit=CUSTOMER_RECENT_LIMIT, sync_cursor=sync_cursor)
+
+# Customer statements
+CUSTOMER_RECENT_LIMIT = 20
+STATEMENT_PAGE_SIZE = 100
+STATEMENT_MAX_PAGE_SIZE = 1000
+
+def statement_query(customer_id, opening, start=None, end=None, after=None, limit=None):
+    """A customer's invoices, credits and payments in ledger order with a running balance.
+
+    Rows are ordered by ``(date, source, id)`` with invoices (source 0) before
+    transactions (source 1) at the same instant; ``after`` is such a key to start
+    behind. ``balance`` is ``opening`` plus a window sum over the rows returned.
+    With ``limit`` each source reads at most ``limit`` rows from its
+    ``(customer_id, date)`` index, so a page costs the same however long the
+    history is.
+    """
+    def branch(model, source, columns, *criteria):
+        # Every filter goes inside the branch, ahead of its LIMIT, or a page comes back short
+        filters = [model.customer_id == customer_id, *criteria]
+        if start is not None:
+            filters.append(model.date >= start)
+        if end is not None:
+            filters.append(model.date < end)
+        if after is not None:
+            after_date, after_source, after_id = after
+            if source < after_source:
+                filters.append(model.date > after_date)
+            elif source > after_source:
+                filters.append(model.date >= after_date)
+            else:
+                filters.append(or_(model.date > after_date, and_(model.date == after_date, model.id > after_id)))
+        query = select(model.date, literal(source).label('source'), model.id, *columns) \
+            .where(*filters).order_by(model.date, model.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return select(query.subquery())
+
+    invoices = branch(Invoice, 0, (
+        literal('invoice').label('kind'),
+        cast(Invoice.invoice_number, db.String).label('reference'),
+        literal('').label('description'),
+        Invoice.total_amount.label('debit'),
+        literal(0.0).label('credit'),
+    ))
+    transactions = branch(Transaction, 1, (
+        Transaction.type.label('kind'),
+        func.coalesce(Transaction.payment_mode, '').label('reference'),
+        Transaction.description,
+        case((Transaction.type == 'credit', Transaction.amount), else_=0.0).label('debit'),
+        case((Transaction.type == 'payment', Transaction.amount), else_=0.0).label('credit'),
+    ), Transaction.type.in_(('credit', 'payment')))
+    entries = invoices.union_all(transactions).subquery()
+    order = (entries.c.date, entries.c.source, entries.c.id)
+    query = select(
+        *entries.c,
+        (literal(opening) + func.sum(entries.c.debit - entries.c.credit).over(order_by=order, rows=(None, 0)))
+        .label('balance')
+    ).order_by(*order)
+    return query.limit(limit) if limit is not None else query
+
+def archived_start(start, carried):
+    """Move a statement's ``start`` up to the first day kept when the customer has archived entries."""
+    if carried is None:
+        return start
+    cutoff = _midnight(carried.as_of)
+    return cutoff if start is None or start < cutoff else start
+
+def statement_opening(customer_id, start, carried=None):
+    """Balance owed before ``start`` (a datetime), read from the daily rollups.
+
+    ``carried`` is the customer's LedgerOpening, which already holds the balance
+    on the first day kept.
+    """
+    if start is None:
+        return 0.0
+    if carried is not None and start == _midnight(carried.as_of):
+        return carried.balance
+    totals = ledger_totals(end=start, customer_id=customer_id)
+    return totals.invoiced + totals.credited - totals.paid
+
+def encode_statement_cursor(entry):
+    raw = f'{entry.date.isoformat()}|{entry.source}|{entry.id}|{entry.balance!r}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_statement_cursor(cursor):
+    try:
+        date, source, id, balance = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return (datetime.fromisoformat(date), int(source), int(id)), float(balance)
+    except (ValueError, UnicodeDecodeError):
+        abort(400, 'Invalid statement cursor.')
+
+@app.route('/customer/<int:id>/statement')
+@login_required
+@reads_from('reporting')
+@query_budget(3)
+def customer_statement(id):
+    customer, carried = Customer.query.add_entity(LedgerOpening) \
+        .outerjoin(LedgerOpening, LedgerOpening.customer_id == Customer.id) \
+        .filter(Customer.id == id).first_or_404()
+    start, end, _ = report_range(request.args)
+    # Entries in archived years are only available as the balance carried forward
+    start = archived_start(start, carried)
+    page_size = min(max(request.args.get('page_size', STATEMENT_PAGE_SIZE, type=int), 1), STATEMENT_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    if cursor:
+        after, opening = decode_statement_cursor(cursor)
+    else:
+        after, opening = None, statement_opening(id, start, carried)
+
+    # Keyset pagination on (date, source, id); the balance so far travels in the cursor
+    entries = db.session.execute(statement_query(id, opening, start, end, after, limit=page_size + 1)).all()
+    next_cursor = None
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        next_cursor = encode_statement_cursor(entries[-1])
+    archived_before = carried.as_of if carried and start == _midnight(carried.as_of) else None
+    response = make_response(render_template('customer_statement.html', customer=customer, entries=entries,
+                                             opening=opening, cursor=cursor, next_cursor=next_cursor,
+                                             archived_before=archived_before))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/delete_customer/<int:id>', methods=['POST'])
 @login_required
 @admin_required
 def delete_customer(id):
     customer = Customer.query.get_or_404(id)
-    if customer.outstanding_balance > 0 or Invoice.query.filter_by(customer_id=id).count() > 0:
+    if (customer.outstanding_balance > 0 or Invoice.query.filter_by(customer_id=id).count() > 0
+            or db.session.get(LedgerOpening, id) is not None):
         flash('Cannot delete customer with outstanding balance or invoices.', 'danger')
         return redirect(url_for('customers'))
     db.session.delete(customer)
     db.session.commit()
+    dashboard_stats.invalidate()
     flash('Customer deleted successfully.', 'success')
     return redirect(url_for('customers'))
 
 # Transaction Routes
 @app.route('/add_transaction', methods=['GET', 'POST'])
 @login_required
+@query_budget(1)
 def add_transaction():
     if request.method == 'POST':
         customer_id = request.form.get('customer_id')
@@ -295,6 +1955,10 @@ def add_transaction():
         amount = float(request.form.get('amount'))
         description = request.form.get('description')
         date = datetime.strptime(request.form.get('date'), '%Y-%m-%dT%H:%M')
+        if in_archived_year(date):
+            flash(f'{financial_year_label(financial_year(date))} is archived; transactions can no longer be '
+                  f'dated in it.', 'danger')
+            return redirect(url_for('add_transaction'))
 
         customer = Customer.query.get_or_404(customer_id)
         if type == 'credit' and customer.get_balance() + amount > customer.credit_limit:
@@ -309,53 +1973,579 @@ def add_transaction():
             date=date
         )
         db.session.add(transaction)
+        if type == 'credit':
+            apply_balance_delta(customer.id, credited=amount)
+        elif type == 'payment':
+            apply_balance_delta(customer.id, paid=amount)
         db.session.commit()
-
-        # Emit real-time updates
-        socketio.emit('transaction_added', transaction.to_dict())
-        socketio.emit('customer_updated', customer.to_dict())
+        dashboard_stats.record_transaction(transaction, customer.name)
+        publish_transaction(transaction, customer)
 
         flash('Transaction added successfully.', 'success')
         return redirect(url_for('view_customer', id=customer_id))
 
-    customers = Customer.query.all()
-    return render_template('add_transaction.html', customers=customers, now=datetime.utcnow())
+    customer_id = request.args.get('customer_id', type=int)
+    selected = Customer.query.get(customer_id) if customer_id else None
+    return render_template('add_transaction.html', selected_customer=selected, now=datetime.utcnow())
 
 # Reports Routes
+REPORT_PAGE_SIZE = 50
+REPORT_MAX_PAGE_SIZE = 500
+
+def report_filters(args, model=None):
+    """Translate the report filter query-string into filter clauses on ``model``.
+
+    ``model`` defaults to Transaction; any model with ``date`` and ``customer_id``
+    columns (e.g. Invoice) can be filtered the same way.
+    """
+    model = model or Transaction
+    filters = []
+    start, end, customer_id = report_range(args)
+    if start:
+        filters.append(model.date >= start)
+    if end:
+        filters.append(model.date < end)
+    if customer_id:
+        filters.append(model.customer_id == customer_id)
+    return filters
+
+def report_range(args):
+    """``(start, end, customer_id)`` of the report filters; ``end`` is exclusive."""
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+    return start, end, args.get('customer_id') or None
+
+def encode_report_cursor(transaction):
+    raw = f'{transaction.date.isoformat()}|{transaction.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_report_cursor(cursor):
+    try:
+        date, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(date), int(id)
+    except (ValueError, UnicodeDecodeError):
+        abort(400, 'Invalid report cursor.')
+
 @app.route('/reports')
 @login_required
+@reads_from('snapshot')
+@query_budget(3)
 def reports():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    customer_id = request.args.get('customer_id')
-
-    query = Transaction.query
-
-    if start_date:
-        query = query.filter(Transaction.date >= datetime.strptime(start_date, '%Y-%m-%d'))
-    if end_date:
-        query = query.filter(Transaction.date <= datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-    if customer_id:
-        query = query.filter(Transaction.customer_id == customer_id)
-
-    transactions = query.order_by(Transaction.date.desc()).all()
-    customers = Customer.query.all()
-
-    total_payments = sum(t.amount for t in transactions if t.type == 'payment')
-    total_credits = sum(t.amount for t in transactions if t.type == 'credit')
+    filters = report_filters(request.args)
+    page_size = min(max(request.args.get('page_size', REPORT_PAGE_SIZE, type=int), 1), REPORT_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+
+    # Whole-day filters, so the totals come from the daily rollups alone
+    totals = ledger_totals(*report_range(request.args))
+    total_count = totals.credit_count + totals.payment_count
+    total_payments = totals.paid
+    total_credits = totals.credited
     net_balance = total_credits - total_payments
 
-    return render_template('reports.html',
+    # Keyset pagination on (date, id), newest first
+    query = Transaction.query.options(joinedload(Transaction.customer)).filter(*filters)
+    if cursor:
+        cursor_date, cursor_id = decode_report_cursor(cursor)
+        query = query.filter(or_(Transaction.date < cursor_date,
+                                 and_(Transaction.date == cursor_date, Transaction.id < cursor_id)))
+    transactions = query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(transactions) > page_size:
+        transactions = transactions[:page_size]
+        next_cursor = encode_report_cursor(transactions[-1])
+
+    customers = db.session.query(Customer.id, Customer.name).order_by(Customer.name).all()
+
+    response = make_response(render_template('reports.html',
                          transactions=transactions,
                          customers=customers,
+                         total_count=total_count,
                          total_payments=total_payments,
                          total_credits=total_credits,
-                         net_balance=net_balance)
+                         net_balance=net_balance,
+                         page_size=page_size,
+                         cursor=cursor,
+                         next_cursor=next_cursor))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# Aged receivables
+AGEING_BUCKETS = (('days_0_30', 0, 30), ('days_31_60', 31, 60), ('days_61_90', 61, 90),
+                  ('days_91_120', 91, 120), ('days_120_plus', 121, None))
+AGEING_SORTS = ('outstanding', 'name') + tuple(name for name, _, _ in AGEING_BUCKETS)
+
+def aged_receivables_query(as_of, sort='outstanding', descending=True):
+    """Per-customer balance at the end of day ``as_of``, split into age buckets.
+
+    Payments settle the oldest invoices and credits first, so what is still open
+    is the newest debits: each bucket holds the smaller of its own debits and
+    the balance the newer buckets leave uncovered, and the oldest bucket takes
+    the rest. Balances come from the stored customer totals less anything dated
+    after ``as_of``, so only rollups from the last 120 days on are read. Customers
+    who owe nothing are left out; ``total_rows`` on every row counts those who do.
+    """
+    debit = LedgerRollup.invoiced + LedgerRollup.credited
+    oldest = max(high for _, _, high in AGEING_BUCKETS if high is not None)
+    recent = db.session.query(
+        LedgerRollup.customer_id,
+        func.sum(case((LedgerRollup.day > as_of, debit - LedgerRollup.paid), else_=0)).label('later'),
+        *(func.sum(case((LedgerRollup.day.between(as_of - timedelta(days=high), as_of - timedelta(days=low)),
+                         debit), else_=0)).label(name)
+          for name, low, high in AGEING_BUCKETS if high is not None)
+    ).filter(LedgerRollup.day >= as_of - timedelta(days=oldest)).group_by(LedgerRollup.customer_id).subquery()
+
+    outstanding = Customer.outstanding_balance - func.coalesce(recent.c.later, 0)
+    columns = {'outstanding': outstanding.label('outstanding'), 'name': Customer.name}
+    covered = literal(0)
+    for name, low, high in AGEING_BUCKETS:
+        uncovered = func.max(outstanding - covered, 0)
+        if high is None:
+            columns[name] = uncovered.label(name)
+        else:
+            debits = func.coalesce(recent.c[name], 0)
+            columns[name] = func.min(debits, uncovered).label(name)
+            covered = covered + debits
+
+    order = columns[sort]
+    return db.session.query(
+        Customer.id, Customer.name, Customer.phone, Customer.credit_limit,
+        *(columns[name] for name in ('outstanding',) + tuple(name for name, _, _ in AGEING_BUCKETS)),
+        func.count().over().label('total_rows')
+    ).outerjoin(recent, recent.c.customer_id == Customer.id) \
+        .filter(outstanding > 0.005) \
+        .order_by(order.desc() if descending else order.asc(), Customer.id)
+
+def aged_receivables_filters(args):
+    """``(as_of, sort, descending)`` from the query-string; ``as_of`` defaults to today."""
+    as_of = args.get('as_of')
+    as_of = datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else datetime.utcnow().date()
+    sort = args.get('sort', 'outstanding')
+    if sort not in AGEING_SORTS:
+        abort(400, 'Unsupported sort column.')
+    return as_of, sort, args.get('order', 'desc') != 'asc'
+
+@app.route('/aged_receivables')
+@login_required
+@reads_from('snapshot')
+@query_budget(1)
+def aged_receivables():
+    as_of, sort, descending = aged_receivables_filters(request.args)
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', REPORT_PAGE_SIZE, type=int), 1), REPORT_MAX_PAGE_SIZE)
+    rows = aged_receivables_query(as_of, sort, descending) \
+        .limit(page_size).offset((page - 1) * page_size).all()
+    total_rows = rows[0].total_rows if rows else 0
+    return render_template('aged_receivables.html', rows=rows, buckets=AGEING_BUCKETS, as_of=as_of,
+                           sort=sort, descending=descending, page=page, page_size=page_size,
+                           total_rows=total_rows, has_next=page * page_size < total_rows)
+
+# GST summary
+def gst_summary_month(args):
+    """First day of the ``month`` (``YYYY-MM``) asked for; defaults to the current month."""
+    month = args.get('month')
+    try:
+        return datetime.strptime(month, '%Y-%m').date() if month else datetime.utcnow().date().replace(day=1)
+    except ValueError:
+        abort(400, 'Invalid month.')
+
+def gst_summary_query(month):
+    """One row per HSN code and GST rate of ``month``, with its B2B and B2C shares."""
+    def share(column, b2b):
+        return func.sum(case((GstSummary.b2b == b2b, column), else_=0.0))
+    return db.session.query(
+        GstSummary.hsn, GstSummary.gst_percent,
+        func.sum(GstSummary.item_count).label('item_count'),
+        func.sum(GstSummary.quantity).label('quantity'),
+        func.sum(GstSummary.taxable_value).label('taxable_value'),
+        func.sum(GstSummary.cgst).label('cgst'),
+        func.sum(GstSummary.sgst).label('sgst'),
+        share(GstSummary.taxable_value, True).label('b2b_taxable_value'),
+        share(GstSummary.cgst + GstSummary.sgst, True).label('b2b_tax'),
+        share(GstSummary.taxable_value, False).label('b2c_taxable_value'),
+        share(GstSummary.cgst + GstSummary.sgst, False).label('b2c_tax'),
+    ).filter(GstSummary.month == month) \
+        .group_by(GstSummary.hsn, GstSummary.gst_percent) \
+        .having(func.sum(GstSummary.item_count) > 0) \
+        .order_by(GstSummary.hsn, GstSummary.gst_percent)
+
+@app.route('/gst_summary')
+@login_required
+@reads_from('snapshot')
+@query_budget(1)
+def gst_summary():
+    month = gst_summary_month(request.args)
+    rows = gst_summary_query(month).all()
+    # Rate-wise B2B/B2C split and grand totals come from the same rows
+    rates = {}
+    for row in rows:
+        rate = rates.setdefault(row.gst_percent, dict.fromkeys(
+            ('b2b_taxable_value', 'b2b_tax', 'b2c_taxable_value', 'b2c_tax'), 0.0))
+        for column in rate:
+            rate[column] += row._mapping[column]
+    totals = {column: sum(row._mapping[column] for row in rows)
+              for column in ('quantity', 'taxable_value', 'cgst', 'sgst', 'b2b_taxable_value', 'b2b_tax',
+                             'b2c_taxable_value', 'b2c_tax')}
+    return render_template('gst_summary.html', month=month, rows=rows, rates=sorted(rates.items()),
+                           totals=totals)
+
+# Export Routes
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+def export_transaction_rows(args, type=None):
+    """Header and a lazily fetched row iterator for the transaction ledger."""
+    header = ['Date', 'Customer', 'Type', 'Amount', 'Payment Mode', 'Description']
+    filters = report_filters(args)
+    if type:
+        filters.append(Transaction.type == type)
+    query = db.session.query(
+        Transaction.date, Customer.name, Transaction.type, Transaction.amount,
+        Transaction.payment_mode, Transaction.description
+    ).outerjoin(Customer, Customer.id == Transaction.customer_id) \
+        .filter(*filters).order_by(Transaction.date.desc(), Transaction.id.desc())
+    rows = ((date.strftime('%Y-%m-%d %H:%M'), name, type, round(amount, 2), mode or '', description)
+            for date, name, type, amount, mode, description in query.yield_per(EXPORT_BATCH_SIZE))
+    return header, rows
+
+def export_invoice_rows(args):
+    """Header and a lazily fetched row iterator with one row per invoice line item."""
+    header = ['Invoice No', 'Date', 'Customer', 'GSTIN', 'Payment Mode', 'Product', 'HSN',
+              'GST %', 'Quantity', 'Rate', 'Discount %', 'Taxable', 'CGST', 'SGST', 'Amount',
+              'Invoice Total']
+    query = db.session.query(
+        Invoice.invoice_number, Invoice.date, Customer.name, Customer.gstin, Invoice.payment_mode,
+        Product.name, InvoiceItem.hsn, InvoiceItem.gst_percent, InvoiceItem.quantity,
+        InvoiceItem.rate, InvoiceItem.discount_percent, InvoiceItem.amount, Invoice.total_amount
+    ).join(InvoiceItem, InvoiceItem.invoice_id == Invoice.id) \
+        .outerjoin(Customer, Customer.id == Invoice.customer_id) \
+        .outerjoin(Product, Product.id == InvoiceItem.product_id) \
+        .filter(*report_filters(args, Invoice)) \
+        .order_by(Invoice.date.desc(), Invoice.id.desc(), InvoiceItem.id)
+
+    def rows():
+        for (number, date, customer, gstin, mode, product, hsn, gst_percent, qty, rate,
+             discount_percent, amount, invoice_total) in query.yield_per(EXPORT_BATCH_SIZE):
+            taxable = qty * rate * (1 - discount_percent / 100)
+            half_gst = round(taxable * gst_percent / 200, 2)
+            yield (number, date.strftime('%Y-%m-%d'), customer, gstin or '', mode, product, hsn,
+                   gst_percent, qty, rate, discount_percent, round(taxable, 2), half_gst, half_gst,
+                   round(amount, 2), round(invoice_total, 2))
+    return header, rows()
+
+def export_aged_receivable_rows(args):
+    """Header and row iterator for the aged receivables report, in its on-screen order."""
+    header = ['Customer', 'Phone', 'Credit Limit', 'Outstanding', '0-30 Days', '31-60 Days',
+              '61-90 Days', '91-120 Days', '120+ Days']
+    query = aged_receivables_query(*aged_receivables_filters(args))
+    rows = ((row.name, row.phone, round(row.credit_limit, 2), round(row.outstanding, 2),
+             *(round(row._mapping[name], 2) for name, _, _ in AGEING_BUCKETS))
+            for row in query.yield_per(EXPORT_BATCH_SIZE))
+    return header, rows
+
+def export_statement_rows(args):
+    """Header and a lazily fetched row iterator for one customer's statement, opening balance first."""
+    customer_id = args.get('customer_id', type=int)
+    if not customer_id:
+        abort(400, 'A customer is required.')
+    carried = db.session.get(LedgerOpening, customer_id)
+    start, end, _ = report_range(args)
+    start = archived_start(start, carried)
+    opening = statement_opening(customer_id, start, carried)
+    header = ['Date', 'Type', 'Reference', 'Description', 'Debit', 'Credit', 'Balance']
+    query = statement_query(customer_id, opening, start, end)
+
+    def rows():
+        yield (start.strftime('%Y-%m-%d') if start else '', 'opening', '', 'Opening balance', '', '',
+               round(opening, 2))
+        for entry in db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield (entry.date.strftime('%Y-%m-%d %H:%M'), entry.kind, entry.reference, entry.description,
+                   round(entry.debit, 2), round(entry.credit, 2), round(entry.balance, 2))
+    return header, rows()
+
+def export_gst_summary_rows(args):
+    """Header and rows of the HSN-wise GST summary for one month."""
+    month = gst_summary_month(args)
+    header = ['Month', 'HSN', 'GST %', 'Items', 'Quantity', 'Taxable Value', 'CGST', 'SGST', 'Total Tax',
+              'B2B Taxable Value', 'B2B Tax', 'B2C Taxable Value', 'B2C Tax']
+    rows = ((month.strftime('%Y-%m'), row.hsn, row.gst_percent, row.item_count, round(row.quantity, 3),
+             round(row.taxable_value, 2), round(row.cgst, 2), round(row.sgst, 2), round(row.cgst + row.sgst, 2),
+             round(row.b2b_taxable_value, 2), round(row.b2b_tax, 2), round(row.b2c_taxable_value, 2),
+             round(row.b2c_tax, 2))
+            for row in gst_summary_query(month))
+    return header, rows
+
+EXPORTS = {
+    'reports': export_transaction_rows,
+    'invoices': export_invoice_rows,
+    'payments': lambda args: export_transaction_rows(args, type='payment'),
+    'aged_receivables': export_aged_receivable_rows,
+    'statement': export_statement_rows,
+    'gst_summary': export_gst_summary_rows
+}
+
+def generate_csv(header, rows):
+    """Yield CSV text in chunks of EXPORT_BATCH_SIZE rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def build_xlsx(header, rows, output=None):
+    """Write rows to ``output`` (a path or file) using openpyxl's constant-memory writer.
+
+    Without ``output`` a temporary file is written and returned rewound.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    if output is not None:
+        workbook.save(output)
+        return output
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+@app.route('/export/<any(reports, invoices, payments, aged_receivables, statement, gst_summary):dataset>')
+@login_required
+@reads_from('reporting')
+@query_budget(3)
+def export_data(dataset):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_MIMETYPES:
+        abort(400, 'Unsupported export format.')
+    header, rows = EXPORTS[dataset](request.args)
+    filename = f'{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}'
+    if fmt == 'xlsx':
+        return send_file(build_xlsx(header, rows), mimetype=EXPORT_MIMETYPES[fmt],
+                         as_attachment=True, download_name=filename)
+    response = Response(stream_with_context(generate_csv(header, rows)), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+# Background jobs
+_job_queues = {}
+
+def job_queue():
+    """The queue in the configured JOBS_DB, opened once per process."""
+    path = app.config['JOBS_DB']
+    queue = _job_queues.get(path)
+    if queue is None:
+        queue = _job_queues[path] = jobs.JobQueue(path, app.config['JOBS_RESULT_DIR'],
+                                                  stale_after=app.config['JOBS_STALE_AFTER'],
+                                                  retention=app.config['JOBS_RETENTION_DAYS'] * 86400)
+    return queue
+
+JobType = namedtuple('JobType', 'run label admin_only')
+JOB_TYPES = {}
+
+def job_type(name, label, admin_only=False):
+    """Register ``function(job, progress)`` as the handler of ``name`` jobs."""
+    def register(function):
+        JOB_TYPES[name] = JobType(function, label, admin_only)
+        return function
+    return register
+
+def publish_job(job):
+    """Send a job's state to its submitter's sockets."""
+    if job is not None and job.user_id is not None:
+        socketio.emit('job_updated', jobs.to_dict(job), to=f'user:{job.user_id}')
+
+@job_type('export', 'Export')
+@reads_from('reporting')
+def run_export_job(job, progress):
+    """Write one of the EXPORTS to a CSV or XLSX result file."""
+    dataset, fmt = job.params.get('dataset'), job.params.get('format', 'csv')
+    if dataset not in EXPORTS or fmt not in EXPORT_MIMETYPES:
+        raise ValueError('Unsupported export.')
+    header, rows = EXPORTS[dataset](MultiDict(job.params))
+    written = 0
+
+    def counted():
+        nonlocal written
+        for written, row in enumerate(rows, 1):
+            if written % EXPORT_BATCH_SIZE == 0:
+                progress(message=f'{written} rows written')
+            yield row
+
+    path = job_queue().result_path(job.id, f'.{fmt}')
+    if fmt == 'xlsx':
+        build_xlsx(header, counted(), output=path)
+    else:
+        with open(path, 'w', newline='') as output:
+            output.writelines(generate_csv(header, counted()))
+    return jobs.JobResult(path, f'{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}', EXPORT_MIMETYPES[fmt],
+                          f'{written} rows')
+
+PRINT_BATCH_SIZE = 200
+
+@job_type('print_invoices', 'Print invoices')
+@reads_from('reporting')
+def run_print_invoices_job(job, progress):
+    """Render every invoice matching the report filters into one printable A4 page."""
+    filters = report_filters(MultiDict(job.params), Invoice)
+    total = db.session.query(func.count(Invoice.id)).filter(*filters).scalar()
+
+    def invoices():
+        # Batches by id, each with its customers and items loaded in two queries
+        last_id, done = 0, 0
+        while True:
+            batch = Invoice.query.filter(*filters, Invoice.id > last_id) \
+                .order_by(Invoice.id).limit(PRINT_BATCH_SIZE).all()
+            if not batch:
+                return
+            customers = {customer.id: customer for customer in
+                         Customer.query.filter(Customer.id.in_({invoice.customer_id for invoice in batch}))}
+            items = defaultdict(list)
+            for item in InvoiceItem.query.options(joinedload(InvoiceItem.product)) \
+                    .filter(InvoiceItem.invoice_id.in_([invoice.id for invoice in batch])).order_by(InvoiceItem.id):
+                items[item.invoice_id].append(item)
+            for invoice in batch:
+                yield invoice, customers.get(invoice.customer_id), items[invoice.id]
+            done += len(batch)
+            last_id = batch[-1].id
+            progress(done / total, f'{done} of {total} invoices')
+
+    path = job_queue().result_path(job.id, '.html')
+    with open(path, 'w') as output:
+        output.writelines(stream_template('print_invoices_a4.html', invoices=invoices(), total=total))
+    return jobs.JobResult(path, f'invoices-{datetime.utcnow():%Y%m%d-%H%M%S}.html', 'text/html',
+                          f'{total} invoices')
+
+REBUILDS = {
+    'balances': rebuild_customer_balances,
+    'rollups': rebuild_ledger_rollups,
+    'gst_summary': rebuild_gst_summary,
+}
+
+@job_type('rebuild', 'Rebuild derived tables', admin_only=True)
+def run_rebuild_job(job, progress):
+    """Recompute stored balances, rollups and the GST summary, fixing any drift."""
+    targets = job.params.get('targets') or list(REBUILDS)
+    targets = targets.split(',') if isinstance(targets, str) else targets
+    unknown = set(targets) - REBUILDS.keys()
+    if unknown:
+        raise ValueError(f"Unknown rebuild target(s): {', '.join(sorted(unknown))}.")
+    fixed = []
+    for step, target in enumerate(targets):
+        progress(step / len(targets), f'Rebuilding {target}')
+        fixed.append(f'{target}: {len(REBUILDS[target](fix=True))} fixed')
+    return jobs.JobResult(message='; '.join(fixed))
+
+def wants_json():
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+def user_job(id):
+    """The job ``id`` if the current user submitted it or is an admin, else 404."""
+    job = job_queue().get(id)
+    if job is None or (job.user_id != session['user_id'] and session.get('user_role') != 'admin'):
+        abort(404)
+    return job
+
+@app.route('/jobs')
+@login_required
+@query_budget(0)
+def background_jobs():
+    return render_template('jobs.html', jobs=job_queue().list(session['user_id']), job_types=JOB_TYPES,
+                           rebuilds=REBUILDS)
+
+@app.route('/jobs', methods=['POST'])
+@login_required
+def enqueue_job():
+    """Queue a job from a JSON ``{"type", "params"}`` body or a form with ``type`` and the params."""
+    if request.is_json:
+        payload = request.get_json()
+        type, params = payload.get('type'), payload.get('params') or {}
+    else:
+        form = request.form.to_dict(flat=False)
+        type = form.pop('type', [None])[0]
+        params = {name: values[0] if len(values) == 1 else values for name, values in form.items()}
+    job_type = JOB_TYPES.get(type)
+    if job_type is None:
+        abort(400, 'Unknown job type.')
+    if job_type.admin_only and session.get('user_role') != 'admin':
+        abort(403)
+    job = job_queue().get(job_queue().enqueue(type, params, user_id=session['user_id']))
+    if wants_json():
+        return jsonify(jobs.to_dict(job)), 202, {'Location': url_for('job_status', id=job.id)}
+    flash(f'{job_type.label} queued as job #{job.id}.', 'success')
+    return redirect(url_for('background_jobs'))
+
+@app.route('/jobs/<int:id>')
+@login_required
+def job_status(id):
+    return jsonify(jobs.to_dict(user_job(id)))
+
+@app.route('/jobs/<int:id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(id):
+    job = job_queue().cancel(user_job(id).id)
+    publish_job(job)
+    if wants_json():
+        return jsonify(jobs.to_dict(job))
+    flash(f'Job #{id} cancelled.' if job.status == 'cancelled' else f'Job #{id} will stop shortly.', 'info')
+    return redirect(url_for('background_jobs'))
+
+@app.route('/jobs/<int:id>/result')
+@login_required
+def job_result(id):
+    job = user_job(id)
+    if job.status != 'done' or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, mimetype=job.result_mimetype, as_attachment=True,
+                     download_name=job.result_name)
+
+def job_worker():
+    return jobs.Worker(job_queue(), {name: type.run for name, type in JOB_TYPES.items()},
+                       app.config['JOBS_CONCURRENCY'], notify=publish_job, context=app.app_context)
+
+@app.cli.command('jobs-worker')
+@click.option('--processes', type=int, help='Worker processes (default: JOBS_WORKERS).')
+@click.option('--once', is_flag=True, help='Run the queued jobs in this process, then exit.')
+def jobs_worker_command(processes, once):
+    """Run background jobs from the queue."""
+    if once:
+        worker = job_worker()
+        ran = 0
+        while worker.run_once():
+            ran += 1
+        click.echo(f'Ran {ran} job(s).')
+        return
+
+    def serve():
+        # Connections inherited from the parent must not be shared with it
+        with app.app_context():
+            db.engine.dispose()
+        dispose_read_engines()
+        worker = job_worker()
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+        worker.run()
+
+    processes = processes or app.config['JOBS_WORKERS']
+    click.echo(f'Running {processes} job worker(s) for {", ".join(JOB_TYPES)}.')
+    jobs.run_pool(processes, serve)
 
 # Settings Routes (Admin only)
 @app.route('/settings')
 @login_required
 @admin_required
+@query_budget(1)
 def settings():
     users = User.query.all()
     return render_template('settings.html', users=users)
@@ -440,30 +2630,190 @@ def change_password():
     flash('Password updated successfully.', 'success')
     return redirect(url_for('settings'))
 
+# Live updates
+class EventCoalescer:
+    """Collapse bursts of keyed Socket.IO events into one emit per window.
+
+    Keyed events (e.g. ``customer_updated`` for one customer) are held for
+    ``window`` seconds and only the latest payload per event, room and key is
+    sent. Unkeyed events, or a window of 0, go out immediately.
+    """
+    def __init__(self, socketio, window):
+        self.socketio = socketio
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._scheduled = False
+        self.queued = 0
+        self.emitted = 0
+
+    def emit(self, event, payload, room, key=None):
+        if key is None or self.window <= 0:
+            self._send(event, payload, room)
+            return
+        with self._lock:
+            self.queued += 1
+            self._pending[(event, room, key)] = payload
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        for (event, room, _), payload in pending.items():
+            self._send(event, payload, room)
+
+    def _send(self, event, payload, room):
+        self.socketio.emit(event, payload, to=room)
+        with self._lock:
+            self.emitted += 1
+
+    def stats(self):
+        with self._lock:
+            return {'queued': self.queued, 'emitted': self.emitted, 'pending': len(self._pending)}
+
+live_updates = EventCoalescer(socketio, window=app.config['SOCKETIO_COALESCE_WINDOW'])
+
+SUBSCRIBABLE_VIEWS = ('customers', 'transactions')
+
+def publish_customer(customer, event='customer_updated'):
+    """Send a customer's current row to the customer list and its own page."""
+    payload = customer.to_dict()
+    for room in ('view:customers', f'customer:{customer.id}'):
+        live_updates.emit(event, payload, room, key=customer.id)
+
+def publish_transaction(transaction, customer):
+    payload = dict(transaction.to_dict(), customer_name=customer.name if customer is not None else None)
+    for room in ('view:transactions', f'customer:{transaction.customer_id}'):
+        live_updates.emit('transaction_added', payload, room)
+    if customer is not None:
+        publish_customer(customer)
+
 # Socket.IO event handlers
 @socketio.on('connect')
 def handle_connect():
+    metrics_registry.inc('cms_socketio_connected_clients')
     if 'user_id' in session:
+        # Background job progress is sent to all of a user's sockets
+        join_room(f'user:{session["user_id"]}')
         emit('connection_response', {'data': 'Connected'})
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    metrics_registry.inc('cms_socketio_connected_clients', -1)
+
+@socketio.on('subscribe')
+@query_budget(0)
+def handle_subscribe(data=None):
+    """Join the rooms for the views and customer shown on the client's page."""
+    if 'user_id' not in session:
+        return
+    data = data if isinstance(data, dict) else {}
+    for view in data.get('views') or []:
+        if view in SUBSCRIBABLE_VIEWS:
+            join_room(f'view:{view}')
+    try:
+        customer_id = int(data['customer_id'])
+    except (KeyError, TypeError, ValueError):
+        return
+    join_room(f'customer:{customer_id}')
+
+SYNC_PAGE_SIZE = 200
+SYNC_MAX_PAGE_SIZE = 1000
+
+def parse_sync_cursor(value):
+    """Parse a ``"seq"`` or ``"seq:id"`` sync cursor; anything else means a full sync."""
+    try:
+        seq, _, row_id = str(value).partition(':')
+        return int(seq), int(row_id) if row_id else None
+    except (TypeError, ValueError):
+        return None
+
+def sync_changes(model, data, *criteria):
+    """Return one page of ``model`` rows changed after the client's cursor.
+
+    A cursor of ``"seq"`` means every change up to ``seq`` has been applied;
+    ``"seq:id"`` is handed out mid-page when the rows of one marker span pages.
+    When nothing has changed since a complete cursor the reply is just
+    ``{'unchanged': True}``, costing a single primary-key lookup.
+    """
+    data = data if isinstance(data, dict) else {}
+    cursor = parse_sync_cursor(data.get('cursor')) if data.get('cursor') is not None else None
+    try:
+        limit = min(max(int(data.get('limit') or SYNC_PAGE_SIZE), 1), SYNC_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = SYNC_PAGE_SIZE
+    current = current_change_seq()
+    if cursor is not None and cursor[1] is None and cursor[0] >= current:
+        return {'unchanged': True, 'cursor': str(cursor[0])}, cursor, []
+
+    query = model.query.filter(*criteria)
+    if cursor is not None:
+        seq, row_id = cursor
+        if row_id is None:
+            query = query.filter(model.change_seq > seq)
+        else:
+            query = query.filter(or_(model.change_seq > seq,
+                                     and_(model.change_seq == seq, model.id > row_id)))
+    rows = query.order_by(model.change_seq, model.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_cursor = f'{rows[-1].change_seq}:{rows[-1].id}'
+    else:
+        next_cursor = str(max([current] + [row.change_seq for row in rows[-1:]]))
+    reply = {
+        'unchanged': False,
+        'reset': cursor is None,
+        'cursor': next_cursor,
+        'has_more': has_more
+    }
+    return reply, cursor, rows
+
+def sync_deletions(entity, reply, cursor, rows, *criteria):
+    """Ids of ``entity`` rows deleted after ``cursor``, up to the end of this page."""
+    if cursor is None:
+        return []
+    tombstones = db.session.query(SyncTombstone.row_id).filter(
+        SyncTombstone.entity == entity, SyncTombstone.change_seq > cursor[0], *criteria)
+    if reply['has_more']:
+        tombstones = tombstones.filter(SyncTombstone.change_seq <= rows[-1].change_seq)
+    return [row_id for row_id, in tombstones]
+
 @socketio.on('get_customers')
-def handle_get_customers():
-    customers = Customer.query.all()
-    emit('customers_data', {'customers': [customer.to_dict() for customer in customers]})
+@query_budget(2)
+def handle_get_customers(data=None):
+    reply, cursor, customers = sync_changes(Customer, data)
+    if not reply['unchanged']:
+        reply['customers'] = [customer.to_dict() for customer in customers]
+        reply['deleted'] = sync_deletions('customer', reply, cursor, customers)
+    emit('customers_data', reply)
 
 @socketio.on('get_transactions')
-def handle_get_transactions(data):
-    customer_id = data.get('customer_id')
-    if customer_id:
-        transactions = Transaction.query.filter_by(customer_id=customer_id).order_by(Transaction.date.desc()).all()
-    else:
-        transactions = Transaction.query.order_by(Transaction.date.desc()).all()
-    emit('transactions_data', {'transactions': [t.to_dict() for t in transactions]})
-
-# Helper to get next invoice number
-def get_next_invoice_number():
-    last_invoice = Invoice.query.order_by(Invoice.invoice_number.desc()).first()
-    return (last_invoice.invoice_number + 1) if last_invoice else 1
+@reads_from('reporting')
+@query_budget(3)
+def handle_get_transactions(data=None):
+    customer_id = data.get('customer_id') if isinstance(data, dict) else None
+    criteria = [Transaction.customer_id == customer_id] if customer_id else []
+    reply, cursor, transactions = sync_changes(Transaction, data, *criteria)
+    if not reply['unchanged']:
+        reply['transactions'] = [t.to_dict() for t in transactions]
+        reply['deleted'] = sync_deletions(
+            'transaction', reply, cursor, transactions,
+            *([SyncTombstone.customer_id == customer_id] if customer_id else []))
+    reply['customer_id'] = customer_id
+    emit('transactions_data', reply)
+
+# Helper to preview the next invoice number (does not reserve it)
+def get_next_invoice_number(date=None):
+    return invoice_numbers.peek(date or datetime.utcnow())
 
 # Initialize database and create default users
 def init_db():
@@ -474,6 +2824,7 @@ def init_db():
         # Drop all tables and recreate them
         db.drop_all()
         db.create_all()
+        migrations.stamp(db.engine)
 
         # Create default users if they don't exist
         if not User.query.filter_by(username=app.config['ADMIN_USERNAME']).first():
@@ -494,8 +2845,20 @@ def init_db():
             
         db.session.commit()
 
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Apply pending schema migrations to the existing database in place."""
+    with db.engine.connect() as conn:
+        version = migrations.current_version(conn)
+    applied = migrations.upgrade(db.engine)
+    for number, description in applied:
+        click.echo(f'Applied migration {number}: {description}')
+    if not applied:
+        click.echo(f'Database is up to date at version {version}.')
+
 @app.route('/create_invoice', methods=['GET', 'POST'])
 @login_required
+@query_budget(1)
 def create_invoice():
     if request.method == 'POST':
         data = request.form
@@ -507,39 +2870,42 @@ def create_invoice():
         vehicle_no = data.get('vehicle_no')
         delivery_date = datetime.strptime(data.get('delivery_date'), '%Y-%m-%d') if data.get('delivery_date') else None
         destination = data.get('destination')
+        if in_archived_year(date):
+            flash(f'{financial_year_label(financial_year(date))} is archived; invoices can no longer be dated in it.',
+                  'danger')
+            return redirect(url_for('create_invoice'))
         items = []
         # Expecting items as JSON string (from JS form)
         import json
         if 'items' in data:
             items = json.loads(data.get('items'))
 
+        # Resolve every product from the catalog snapshot and reject unknown ids up front
+        product_ids = {int(item['product_id']) for item in items}
+        products = catalog_cache.get().by_id
+        missing = sorted(product_ids - products.keys())
+        if missing:
+            flash(f"Unknown product id(s): {', '.join(map(str, missing))}.", 'danger')
+            return redirect(url_for('create_invoice'))
+
         # Calculate totals
-        subtotal = 0
-        total_taxable = 0
-        total_cgst = 0
-        total_sgst = 0
         grand_total = 0
         invoice_items = []
         for item in items:
-            product = Product.query.get(item['product_id'])
+            product_id = int(item['product_id'])
+            hsn, gst_percent = products[product_id].hsn, products[product_id].gst_percent
             qty = float(item['quantity'])
             rate = float(item['rate'])
             discount_percent = float(item.get('discount_percent', 0))
-            hsn = product.hsn
-            gst_percent = product.gst_percent
             price = rate * qty
             discount = price * (discount_percent / 100)
             taxable = price - discount
             cgst = taxable * (gst_percent / 2) / 100
             sgst = taxable * (gst_percent / 2) / 100
             amount = taxable + cgst + sgst
-            subtotal += price
-            total_taxable += taxable
-            total_cgst += cgst
-            total_sgst += sgst
             grand_total += amount
             invoice_items.append({
-                'product_id': product.id,
+                'product_id': product_id,
                 'quantity': qty,
                 'rate': rate,
                 'discount_percent': discount_percent,
@@ -550,7 +2916,7 @@ def create_invoice():
         grand_total += transport_charges + round_off
 
         # Create Invoice
-        invoice_number = get_next_invoice_number()
+        invoice_number = invoice_numbers.allocate(date)
         invoice = Invoice(
             invoice_number=invoice_number,
             customer_id=customer_id,
@@ -567,66 +2933,79 @@ def create_invoice():
         db.session.add(invoice)
         db.session.flush()  # Get invoice.id
 
-        # Add Invoice Items
-        for item in invoice_items:
-            invoice_item = InvoiceItem(
-                invoice_id=invoice.id,
-                product_id=item['product_id'],
-                quantity=item['quantity'],
-                rate=item['rate'],
-                discount_percent=item['discount_percent'],
-                hsn=item['hsn'],
-                gst_percent=item['gst_percent'],
-                amount=item['amount']
-            )
-            db.session.add(invoice_item)
+        # Add Invoice Items with a single executemany INSERT
+        if invoice_items:
+            for item in invoice_items:
+                item['invoice_id'] = invoice.id
+            db.session.execute(InvoiceItem.__table__.insert(), invoice_items)
 
+        apply_balance_delta(invoice.customer_id, invoiced=grand_total)
         db.session.commit()
+        dashboard_stats.record_invoice(grand_total)
+        publish_customer(Customer.query.get(invoice.customer_id))
         flash('Invoice created successfully.', 'success')
         return redirect(url_for('view_invoice', invoice_id=invoice.id))
 
-    # GET: Render invoice creation form
-    customers = Customer.query.all()
-    products = [p.to_dict() for p in Product.query.all()]
-    return render_template('create_invoice.html',
-                           customers=customers,
-                           products=products,
-                           next_invoice_number=get_next_invoice_number())
+    # GET: Render invoice creation form; customers and products are looked up via /search
+    return render_template('create_invoice.html', next_invoice_number=get_next_invoice_number())
+
+@app.route('/search/<any(customers, products):kind>')
+@login_required
+@query_budget(1)
+def search(kind):
+    """Typeahead API: the top prefix matches for ``q`` as JSON."""
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), SEARCH_MAX_LIMIT))
+    model, index = (Customer, customer_search) if kind == 'customers' else (Product, product_search)
+    rows = search_rows(model, index, request.args.get('q', ''), limit)
+    return jsonify([row.to_dict() for row in rows])
+
+@app.route('/invoice_number_preview')
+@login_required
+@query_budget(1)
+def invoice_number_preview():
+    date = request.args.get('date')
+    date = datetime.strptime(date, '%Y-%m-%d') if date else None
+    return jsonify({'next_invoice_number': get_next_invoice_number(date)})
 
 @app.route('/invoice/<int:invoice_id>')
 @login_required
+@query_budget(6, archived=9)
 def view_invoice(invoice_id):
-    invoice = Invoice.query.get_or_404(invoice_id)
-    customer = Customer.query.get(invoice.customer_id)
-    items = InvoiceItem.query.filter_by(invoice_id=invoice.id).all()
-    return render_template('view_invoice.html', invoice=invoice, customer=customer, items=items)
+    invoice_number = db.session.query(Invoice.invoice_number).filter_by(id=invoice_id).scalar()
+    archived = None
+    if invoice_number is None:
+        archived = find_archived_invoice(invoice_id)
+        if archived is None:
+            abort(404)
+        invoice_number = archived[1].invoice_number
+    return render_template('view_invoice.html', invoice_id=invoice_id, invoice_number=invoice_number,
+                           archived_year=archived[0] if archived else None,
+                           invoice_detail=Markup(render_invoice('_invoice_detail.html', invoice_id, archived)))
 
 @app.route('/invoice/<int:invoice_id>/print_receipt')
 @login_required
+@query_budget(5, archived=9)
 def print_receipt(invoice_id):
-    invoice = Invoice.query.get_or_404(invoice_id)
-    customer = Customer.query.get(invoice.customer_id)
-    items = InvoiceItem.query.filter_by(invoice_id=invoice.id).all()
-    return render_template('print_receipt.html', invoice=invoice, customer=customer, items=items)
+    return render_invoice('print_receipt.html', invoice_id)
 
 @app.route('/invoice/<int:invoice_id>/print_a4')
 @login_required
+@query_budget(5, archived=9)
 def print_invoice_a4(invoice_id):
-    invoice = Invoice.query.get_or_404(invoice_id)
-    customer = Customer.query.get(invoice.customer_id)
-    items = InvoiceItem.query.filter_by(invoice_id=invoice.id).all()
-    return render_template('print_invoice_a4.html', invoice=invoice, customer=customer, items=items)
+    return render_invoice('print_invoice_a4.html', invoice_id)
 
 @app.route('/products')
 @login_required
 @admin_required
+@query_budget(2)
 def products():
-    products = Product.query.all()
+    products = catalog_cache.get().products
     return render_template('products.html', products=products)
 
 @app.route('/add_product', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@query_budget(0)
 def add_product():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -635,6 +3014,7 @@ def add_product():
         price = float(request.form.get('price', 0))
         product = Product(name=name, hsn=hsn, gst_percent=gst_percent, price=price)
         db.session.add(product)
+        bump_cache_version('catalog')
         db.session.commit()
         flash('Product added successfully.', 'success')
         return redirect(url_for('products'))
@@ -643,6 +3023,7 @@ def add_product():
 @app.route('/edit_product/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@query_budget(1)
 def edit_product(id):
     product = Product.query.get_or_404(id)
     if request.method == 'POST':
@@ -650,6 +3031,7 @@ def edit_product(id):
         product.hsn = request.form.get('hsn')
         product.gst_percent = float(request.form.get('gst_percent', 0))
         product.price = float(request.form.get('price', 0))
+        bump_cache_version('catalog')
         db.session.commit()
         flash('Product updated successfully.', 'success')
         return redirect(url_for('products'))
@@ -661,12 +3043,15 @@ def edit_product(id):
 def delete_product(id):
     product = Product.query.get_or_404(id)
     db.session.delete(product)
+    bump_cache_version('catalog')
     db.session.commit()
     flash('Product deleted successfully.', 'success')
     return redirect(url_for('products'))
 
 @app.route('/invoices')
 @login_required
+@reads_from('reporting')
+@query_budget(2)
 def invoices():
     invoices = Invoice.query.order_by(Invoice.date.desc()).all()
     customers = {c.id: c for c in Customer.query.all()}
@@ -677,13 +3062,36 @@ def invoices():
 @admin_required
 def delete_invoice(id):
     invoice = Invoice.query.get_or_404(id)
+    amount = invoice.total_amount
+    customer_id = invoice.customer_id
+    apply_balance_delta(customer_id, invoiced=-amount)
     db.session.delete(invoice)
+    invalidate_invoice_renders(customer_id)
     db.session.commit()
+    dashboard_stats.record_invoice(-amount)
+    publish_customer(Customer.query.get(customer_id))
     flash('Invoice deleted successfully.', 'success')
     return redirect(url_for('invoices'))
 
+@app.route('/archives')
+@login_required
+@query_budget(5)
+def archives():
+    year = request.args.get('year', type=int)
+    invoice_number = request.args.get('invoice_number', type=int)
+    if year is not None and invoice_number is not None:
+        archived = db.session.get(ArchivedYear, year)
+        found = fetch_archived_invoice(archived, invoice_number=invoice_number) if archived else None
+        if found is not None:
+            return redirect(url_for('view_invoice', invoice_id=found[0].id))
+        flash(f'Invoice {invoice_number} is not in the {financial_year_label(year)} archive.', 'warning')
+    years = ArchivedYear.query.order_by(ArchivedYear.financial_year.desc()).all()
+    return render_template('archives.html', years=years)
+
 @app.route('/payments')
 @login_required
+@reads_from('reporting')
+@query_budget(2)
 def payments():
     payments = Transaction.query.filter_by(type='payment').order_by(Transaction.date.desc()).all()
     customers = {c.id: c for c in Customer.query.all()}
@@ -691,13 +3099,18 @@ def payments():
 
 @app.route('/add_payment', methods=['GET', 'POST'])
 @login_required
+@query_budget(0)
 def add_payment():
     if request.method == 'POST':
         customer_id = request.form.get('customer_id')
         amount = float(request.form.get('amount', 0))
         payment_mode = request.form.get('payment_mode')
         notes = request.form.get('notes')
-        date = request.form.get('date')
+        date = datetime.strptime(request.form.get('date'), '%Y-%m-%d') if request.form.get('date') else datetime.utcnow()
+        if in_archived_year(date):
+            flash(f'{financial_year_label(financial_year(date))} is archived; payments can no longer be dated in it.',
+                  'danger')
+            return redirect(url_for('add_payment'))
         payment = Transaction(
             customer_id=customer_id,
             type='payment',
@@ -707,15 +3120,20 @@ def add_payment():
             payment_mode=payment_mode
         )
         db.session.add(payment)
+        apply_balance_delta(customer_id, paid=amount)
         db.session.commit()
+        customer = Customer.query.get(customer_id)
+        dashboard_stats.record_transaction(payment, customer.name if customer else None)
+        publish_transaction(payment, customer)
         flash('Payment recorded successfully.', 'success')
         return redirect(url_for('payments'))
-    customers = Customer.query.all()
-    return render_template('add_payment.html', customers=customers)
+    return render_template('add_payment.html')
 
 @app.route('/credit_report')
 @login_required
 @admin_required
+@reads_from('snapshot')
+@query_budget(1)
 def credit_report():
     customers = Customer.query.order_by(Customer.outstanding_balance.desc()).all()
     return render_template('credit_report.html', customers=customers)
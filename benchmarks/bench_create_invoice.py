@@ -0,0 +1,73 @@
+"""Invoice creation latency against line-item count.
+
+Posts invoices with 1, 10, 100 and 500 line items to /create_invoice through
+the Flask test client and reports latency and SQL statements per request.
+With batched product lookup and a single bulk item insert, the statement
+count is constant and latency grows only with the per-row Python work.
+
+    python benchmarks/bench_create_invoice.py --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LINE_COUNTS = (1, 10, 100, 500)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help='invoices posted per line count')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        from sqlalchemy import event
+        from app import app, db, User, Customer, Product
+
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', password='x', role='admin')
+            customer = Customer(name='Bench Dealer', email='bench@example.com', phone='1', address='-')
+            db.session.add_all([user, customer])
+            db.session.add_all(Product(name=f'Product {i}', hsn=f'{7000 + i}', gst_percent=(0, 5, 12, 18, 28)[i % 5],
+                                       price=10 + i) for i in range(max(LINE_COUNTS)))
+            db.session.commit()
+            user_id, customer_id = user.id, customer.id
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *rest: statements.append(statement))
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['user_role'] = 'admin'
+
+        print(f'{"lines":>6} {"median ms":>10} {"p95 ms":>8} {"ms/line":>8} {"SQL/req":>8}')
+        for lines in LINE_COUNTS:
+            items = json.dumps([{'product_id': i + 1, 'quantity': 2, 'rate': 10 + i, 'discount_percent': 5}
+                                for i in range(lines)])
+            form = {'customer_id': customer_id, 'date': '2024-06-01', 'payment_mode': 'Credit', 'items': items}
+            timings = []
+            statements.clear()
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.post('/create_invoice', data=form)
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 302, response.status_code
+            timings.sort()
+            median = statistics.median(timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f'{lines:>6} {median:>10.2f} {p95:>8.2f} {median / lines:>8.3f} '
+                  f'{len(statements) / args.repeat:>8.1f}')
+
+        with app.app_context():
+            db.engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Throughput and memory benchmark for the streaming CSV export.
+
+Seeds a throw-away SQLite database with N transactions, then downloads
+/export/reports through the Flask test client while sampling the process RSS.
+A streaming export keeps RSS flat no matter how many rows are written.
+
+    python benchmarks/bench_export.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def current_rss_mb():
+    """Resident set size of this process in MiB (Linux /proc, falling back to peak RSS)."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def seed(path, rows, customers=1000):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO customer (id, name, email, phone, address, credit_limit, created_at, '
+        'invoiced_total, credited_total, paid_total) VALUES (?, ?, ?, ?, ?, 0, ?, 0, 0, 0)',
+        ((i, f'Customer {i}', f'customer{i}@example.com', '9000000000', 'Address', '2024-01-01 00:00:00')
+         for i in range(1, customers + 1)))
+    rng = random.Random(42)
+    start = datetime(2020, 4, 1)
+
+    def transactions():
+        for i in range(rows):
+            date = start + timedelta(minutes=i)
+            yield (rng.randint(1, customers), rng.choice(('credit', 'payment')),
+                   round(rng.uniform(10, 50000), 2), f'Entry {i}', date.strftime('%Y-%m-%d %H:%M:%S.000000'))
+    conn.executemany('INSERT INTO "transaction" (customer_id, type, amount, description, date) '
+                     'VALUES (?, ?, ?, ?, ?)', transactions())
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--samples', type=int, default=10, help='RSS samples taken during the download')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        from app import app, db
+        with app.app_context():
+            db.create_all()
+        seed(path, args.rows)
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_role'] = 'admin'
+
+        baseline = current_rss_mb()
+        print(f'seeded {args.rows:,} rows, RSS before export {baseline:.1f} MiB')
+        started = time.perf_counter()
+        response = client.get('/export/reports', buffered=False)
+        sample_every = max(args.rows // args.samples, 1)
+        written = lines = 0
+        next_sample = sample_every
+        peak = baseline
+        for chunk in response.response:
+            written += len(chunk)
+            lines += chunk.count(b'\n') if isinstance(chunk, bytes) else chunk.count('\n')
+            if lines >= next_sample:
+                rss = current_rss_mb()
+                peak = max(peak, rss)
+                print(f'{lines - 1:>10,} rows  {time.perf_counter() - started:7.2f}s  RSS {rss:7.1f} MiB')
+                next_sample += sample_every
+        elapsed = time.perf_counter() - started
+        response.close()
+        with app.app_context():
+            db.engine.dispose()
+
+    rows = lines - 1
+    print(f'exported {rows:,} rows ({written / 1e6:.1f} MB) in {elapsed:.2f}s '
+          f'= {rows / elapsed:,.0f} rows/s; RSS growth {peak - baseline:+.1f} MiB')
+
+if __name__ == '__main__':
+    main()
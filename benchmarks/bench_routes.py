@@ -0,0 +1,352 @@
+"""Per-route latency, throughput and RSS against a synthetic dataset.
+
+Builds (or reuses) a dataset from dataset.py, copies it to a scratch file and
+drives the hot routes and Socket.IO handlers, reporting p50/p95/p99 latency,
+throughput and peak RSS per scenario. Runs in-process through the Flask test
+client by default; --live drives an already running server over HTTP, and
+--gunicorn starts one with gunicorn_config.py on the scratch copy.
+
+    python benchmarks/bench_routes.py --scale production --save baseline.json
+    python benchmarks/bench_routes.py --scale production --compare baseline.json
+    python benchmarks/bench_routes.py --scale medium --gunicorn eventlet --concurrency 8
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import dataset
+from bench_export import current_rss_mb
+
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+
+# p95 limits in ms that hold up to --scale production; a run over any of them exits 1
+LATENCY_BUDGETS_MS = {
+    'GET /aged_receivables': 250,
+    'GET /export/aged_receivables': 300,
+    'GET /customer/statement': 50,
+    'GET /customer/statement (last quarter)': 50,
+    'GET /gst_summary': 100,
+}
+
+def scenarios(customer_id, invoice_id, items):
+    """(name, kind, target, payload) for every benchmarked route or socket event."""
+    invoice_form = {'customer_id': customer_id, 'date': '2025-03-31', 'payment_mode': 'Credit',
+                    'items': json.dumps(items)}
+    return [
+        ('GET /', 'get', '/', None),
+        ('GET /customers', 'get', '/customers', None),
+        ('GET /invoices', 'get', '/invoices', None),
+        ('GET /payments', 'get', '/payments', None),
+        ('GET /reports', 'get', '/reports', None),
+        ('GET /aged_receivables', 'get', '/aged_receivables?as_of=2025-03-31', None),
+        ('GET /aged_receivables (year back)', 'get', '/aged_receivables?as_of=2024-03-31', None),
+        ('GET /export/aged_receivables', 'get', '/export/aged_receivables?as_of=2025-03-31', None),
+        ('GET /gst_summary', 'get', '/gst_summary?month=2025-03', None),
+        ('GET /view_customer', 'get', f'/view_customer/{customer_id}', None),
+        ('GET /customer/statement', 'get', f'/customer/{customer_id}/statement', None),
+        ('GET /customer/statement (last quarter)', 'get',
+         f'/customer/{customer_id}/statement?start_date=2025-01-01&end_date=2025-03-31', None),
+        ('GET /export/statement', 'get', f'/export/statement?customer_id={customer_id}', None),
+        ('GET /invoice', 'get', f'/invoice/{invoice_id}', None),
+        ('POST /create_invoice', 'post', '/create_invoice', invoice_form),
+        ('socket get_customers (first page)', 'socket', 'get_customers', {'limit': 1000}),
+        # A cursor at or past the latest change marker takes the "unchanged" path
+        ('socket get_customers (unchanged)', 'socket', 'get_customers', {'cursor': str(2 ** 62)}),
+        ('socket get_transactions', 'socket', 'get_transactions', {'customer_id': customer_id}),
+    ]
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def summarize(timings, wall, peak_rss, errors):
+    """Latency figures cover successful requests only; failures are counted in ``errors``."""
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': statistics.mean(timings) * 1000 if timings else float('nan'),
+        'throughput_rps': len(timings) / wall if wall else 0.0,
+        'peak_rss_mb': peak_rss,
+    }
+
+def run(call, iterations, concurrency, rss, setup=lambda: None):
+    """Time ``call`` ``iterations`` times over ``concurrency`` threads, sampling ``rss``.
+
+    ``setup`` runs once per thread before its timed calls (e.g. to log in).
+    """
+    timings, errors, peak = [], [0], [rss()]
+    lock = threading.Lock()
+
+    def worker(count):
+        setup()
+        for _ in range(count):
+            started = time.perf_counter()
+            ok = call()
+            elapsed = time.perf_counter() - started
+            sample = rss()
+            with lock:
+                if ok:
+                    timings.append(elapsed)
+                else:
+                    errors[0] += 1
+                peak[0] = max(peak[0], sample)
+
+    share = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, share))
+    return summarize(timings, time.perf_counter() - started, peak[0], errors[0])
+
+class InProcessDriver:
+    """Drives the app through the Flask and Socket.IO test clients."""
+    def __init__(self):
+        from app import app, socketio
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_role'] = 'admin'
+        self.socket = socketio.test_client(app, flask_test_client=self.client)
+        self.socket.get_received()
+
+    rss = staticmethod(current_rss_mb)
+
+    def setup(self):
+        pass
+
+    def close(self):
+        self.socket.disconnect()
+
+    def request(self, kind, target, payload):
+        if kind == 'get':
+            return self.client.get(target).status_code == 200
+        if kind == 'post':
+            return self.client.post(target, data=payload).status_code == 302
+        self.socket.emit(target, payload)
+        return bool(self.socket.get_received())
+
+class LiveDriver:
+    """Drives a running server over HTTP and a real Socket.IO connection."""
+    def __init__(self, base, username, password, pid=None):
+        import requests
+        import socketio
+        self.requests = requests
+        self.socketio = socketio
+        self.base = base.rstrip('/')
+        self.local = threading.local()
+        self.sessions = []
+        self.username, self.password = username, password
+        self.pid = pid
+        login = self.session()
+        self.cookie = '; '.join(f'{name}={value}' for name, value in login.cookies.items())
+        self.socket = socketio.Client(reconnection=False)
+        try:
+            self.socket.connect(self.base, headers={'Cookie': self.cookie}, wait_timeout=10)
+        except socketio.exceptions.ConnectionError:
+            pass  # socket scenarios then count as errors
+        self.socket_lock = threading.Lock()
+
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+            self.sessions.append(session)
+            session.post(f'{self.base}/login', data={'username': self.username, 'password': self.password})
+        return session
+
+    def setup(self):
+        self.session()
+
+    def close(self):
+        self.socket.disconnect()
+        for session in self.sessions:
+            session.close()
+
+    def rss(self):
+        """Server RSS in MiB when its pid is known (gunicorn master plus workers), else 0."""
+        if self.pid is None:
+            return 0.0
+        total = 0
+        for pid in [self.pid] + self._children():
+            try:
+                with open(f'/proc/{pid}/status') as status:
+                    total += next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+            except (OSError, StopIteration):
+                pass
+        return total / 1024
+
+    def _children(self):
+        try:
+            with open(f'/proc/{self.pid}/task/{self.pid}/children') as children:
+                return [int(pid) for pid in children.read().split()]
+        except OSError:
+            return []
+
+    def request(self, kind, target, payload):
+        if kind in ('get', 'post'):
+            try:
+                response = self.session().request(kind.upper(), self.base + target, data=payload,
+                                                  allow_redirects=False, timeout=60)
+            except self.requests.RequestException:
+                return False
+            return response.status_code == (200 if kind == 'get' else 302)
+        # Handlers emit their reply before returning, so the ack arrives after the data
+        with self.socket_lock:
+            try:
+                self.socket.call(target, payload, timeout=60)
+            except self.socketio.exceptions.SocketIOError:
+                return False
+        return True
+
+def prepare(scale, seed_value, rebuild):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'{scale}-{seed_value}.db')
+    if rebuild or not os.path.exists(path):
+        if os.path.exists(path):
+            os.remove(path)
+        started = time.perf_counter()
+        # Build in a child process so this process imports the app against the scratch copy
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'dataset.py'), '--scale', scale,
+                        '--seed', str(seed_value), '--out', path], check=True)
+        print(f'dataset built in {time.perf_counter() - started:.1f}s')
+    return path
+
+def sample_ids(path):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    try:
+        # The busiest customer and its latest invoice are the worst case for per-customer pages
+        customer_id = conn.execute('SELECT customer_id FROM invoice GROUP BY customer_id '
+                                   'ORDER BY COUNT(*) DESC LIMIT 1').fetchone()[0]
+        invoice_id = conn.execute('SELECT MAX(id) FROM invoice WHERE customer_id = ?',
+                                  (customer_id,)).fetchone()[0]
+        products = [row[0] for row in conn.execute('SELECT id FROM product ORDER BY id LIMIT 10')]
+    finally:
+        conn.close()
+    items = [{'product_id': pid, 'quantity': 2, 'rate': 100, 'discount_percent': 0} for pid in products]
+    return customer_id, invoice_id, items
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['routes']
+    print(f'\nvs {baseline_path}')
+    print(f'{"scenario":<34} {"p50 ms":>16} {"p95 ms":>16} {"req/s":>16}')
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+
+        def cell(key):
+            change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            return f'{result[key]:>8.1f} {change:>+6.0f}%'
+        print(f'{name:<34} {cell("p50_ms"):>16} {cell("p95_ms"):>16} {cell("throughput_rps"):>16}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=dataset.SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rebuild', action='store_true', help='regenerate the cached dataset')
+    parser.add_argument('--iterations', type=int, default=30, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads per scenario')
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='substrings of scenarios to run')
+    parser.add_argument('--live', metavar='URL', help='benchmark a running server instead of the test client')
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench')
+    parser.add_argument('--gunicorn', choices=('threading', 'eventlet'),
+                        help='start gunicorn with this profile on the scratch copy and benchmark it')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers with --gunicorn')
+    parser.add_argument('--save', metavar='JSON', help='write results as a baseline file')
+    parser.add_argument('--compare', metavar='JSON', help='show changes against a saved baseline')
+    args = parser.parse_args()
+
+    source = None if args.live else prepare(args.scale, args.seed, args.rebuild)
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if source:
+            path = os.path.join(workdir, 'bench.db')
+            shutil.copyfile(source, path)
+            os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+            customer_id, invoice_id, items = sample_ids(path)
+        else:
+            customer_id, invoice_id, items = 1, 1, [{'product_id': 1, 'quantity': 1, 'rate': 100,
+                                                     'discount_percent': 0}]
+        driver = None
+        try:
+            if args.gunicorn:
+                from bench_serving import free_port, start_server
+                port = free_port()
+                server = start_server(args.gunicorn, port, args.workers, workdir)
+                driver = LiveDriver(f'http://127.0.0.1:{port}', args.username, args.password, pid=server.pid)
+            elif args.live:
+                driver = LiveDriver(args.live, args.username, args.password)
+            else:
+                driver = InProcessDriver()
+
+            mode = f'gunicorn/{args.gunicorn}' if args.gunicorn else ('live' if args.live else 'test-client')
+            # The test client is not thread-safe; concurrency only applies to a real server
+            concurrency = args.concurrency if mode != 'test-client' else 1
+            print(f'{mode}, scale={args.scale}, {args.iterations} requests x {concurrency} thread(s)')
+            print(f'{"scenario":<34} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8} {"RSS MiB":>8} {"err":>4}')
+            results = {}
+            for name, kind, target, payload in scenarios(customer_id, invoice_id, items):
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                driver.request(kind, target, payload)  # warm caches and connections
+                result = run(lambda: driver.request(kind, target, payload), args.iterations,
+                             concurrency if kind != 'socket' else 1, driver.rss, driver.setup)
+                results[name] = result
+                print(f'{name:<34} {result["p50_ms"]:>8.1f} {result["p95_ms"]:>8.1f} {result["p99_ms"]:>8.1f} '
+                      f'{result["throughput_rps"]:>8.1f} {result["peak_rss_mb"]:>8.1f} {result["errors"]:>4}')
+        finally:
+            if driver is not None:
+                driver.close()
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({
+                'meta': {
+                    'mode': mode,
+                    'scale': args.scale,
+                    'seed': args.seed,
+                    'counts': dataset.SCALES[args.scale],
+                    'iterations': args.iterations,
+                    'concurrency': concurrency,
+                    'python': platform.python_version(),
+                    'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                },
+                'routes': results,
+            }, baseline_file, indent=2)
+        print(f'saved {args.save}')
+    if args.compare:
+        compare(results, args.compare)
+    over = [(name, results[name]['p95_ms'], budget) for name, budget in LATENCY_BUDGETS_MS.items()
+            if name in results and results[name]['p95_ms'] > budget]
+    for name, p95, budget in over:
+        print(f'{name}: p95 {p95:.1f} ms is over its {budget} ms budget')
+    if over:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""HTTP latency with many open Socket.IO clients, sync vs. eventlet workers.
+
+Starts gunicorn with gunicorn_config.py once per serving profile against a
+throw-away database, opens --clients Socket.IO connections that subscribe to the
+customer list and stay connected, then times authenticated GET /customers
+requests from --http-threads concurrent threads while those sockets are
+connecting and open. A sync worker is held by each open socket, so page loads
+queue behind them and time out; eventlet workers multiplex the sockets and keep
+serving pages.
+
+--writers adds threads posting payments during the timed window, and --hold-ms
+has a separate process hold the SQLite write lock for that long once per
+--hold-every seconds, as an archive run or a bulk import would. Together they
+measure how each profile rides out lock contention.
+
+Needs gunicorn and eventlet from requirements.txt, and requests and
+python-socketio[client] from requirements-dev.txt.
+
+    python benchmarks/bench_serving.py --clients 50 --workers 1
+    python benchmarks/bench_serving.py --clients 20 --writers 4 --hold-ms 300 --profiles eventlet
+"""
+import sqlite3
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROFILES = ('threading', 'eventlet')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def seed(customers):
+    from werkzeug.security import generate_password_hash
+    from app import app, db, User, Customer
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', password=generate_password_hash('bench'), role='admin'))
+        db.session.add_all(Customer(name=f'Customer {i}', email=f'c{i}@example.com', phone='1', address='-')
+                           for i in range(customers))
+        db.session.commit()
+
+def start_server(profile, port, workers, workdir):
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=profile, FLASK_CONFIG='production')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', 'wsgi:app',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--access-logfile', os.devnull, '--error-logfile', os.path.join(workdir, f'{profile}.log'),
+         '--pid', os.path.join(workdir, f'{profile}.pid')],
+        cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'gunicorn ({profile}) did not start')
+
+def connect_clients(url, cookie, count, timeout):
+    clients, failures = [], []
+    lock = threading.Lock()
+
+    def connect(_):
+        client = socketio.Client(reconnection=False)
+        try:
+            client.connect(url, headers={'Cookie': cookie}, wait_timeout=timeout)
+            client.emit('subscribe', {'views': ['customers']})
+            with lock:
+                clients.append(client)
+        except Exception as exc:
+            with lock:
+                failures.append(type(exc).__name__)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        list(pool.map(connect, range(count)))
+    return clients, failures, time.perf_counter() - started
+
+def time_requests(url, cookie, threads, per_thread, timeout):
+    timings, errors = [], []
+    lock = threading.Lock()
+
+    def worker(_):
+        session = requests.Session()
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                response = session.get(url, headers={'Cookie': cookie}, timeout=timeout)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (timings if ok else errors).append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return timings, errors
+
+def time_writes(url, cookie, threads, per_thread, timeout):
+    timings, errors = [], []
+    if not threads:
+        return timings, errors
+    lock = threading.Lock()
+
+    def worker(number):
+        session = requests.Session()
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                response = session.post(url, headers={'Cookie': cookie}, allow_redirects=False, timeout=timeout,
+                                        data={'customer_id': number + 1, 'amount': 1, 'payment_mode': 'Cash'})
+                ok = response.status_code == 302
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (timings if ok else errors).append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return timings, errors
+
+def hold_write_lock(path, hold, every, stop):
+    """Take the database's write lock for ``hold`` seconds once per ``every`` seconds until ``stop``."""
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    try:
+        while not stop.wait(every):
+            conn.execute('BEGIN IMMEDIATE')
+            time.sleep(hold)
+            conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+def run_profile(profile, args, workdir):
+    port = free_port()
+    server = start_server(profile, port, args.workers, workdir)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        session = requests.Session()
+        session.post(f'{base}/login', data={'username': 'bench', 'password': 'bench'})
+        cookie = '; '.join(f'{name}={value}' for name, value in session.cookies.items())
+        # Time page loads while the sockets are connecting and holding their connections
+        connecting = ThreadPoolExecutor(max_workers=1)
+        sockets = connecting.submit(connect_clients, base, cookie, args.clients, args.timeout)
+        time.sleep(args.settle)
+        stop = threading.Event()
+        holder = threading.Thread(target=hold_write_lock, daemon=True,
+                                  args=(args.database, args.hold_ms / 1000, args.hold_every, stop))
+        if args.hold_ms:
+            holder.start()
+        writing = ThreadPoolExecutor(max_workers=1)
+        writes = writing.submit(time_writes, f'{base}/add_payment', cookie, args.writers,
+                                args.requests, args.timeout)
+        timings, errors = time_requests(f'{base}/customers', cookie, args.http_threads,
+                                        args.requests, args.timeout)
+        write_timings, write_errors = writes.result()
+        writing.shutdown()
+        stop.set()
+        if args.hold_ms:
+            holder.join()
+        clients, failures, connect_seconds = sockets.result()
+        connecting.shutdown()
+        transports = {client.transport() for client in clients}
+        for client in clients:
+            client.disconnect()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {
+        'profile': profile,
+        'connected': len(clients),
+        'connect_s': connect_seconds,
+        'transport': '/'.join(sorted(transports)) or '-',
+        'ok': len(timings),
+        'errors': len(errors),
+        'median_ms': statistics.median(timings) * 1000 if timings else float('nan'),
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'max_ms': max(timings) * 1000 if timings else float('nan'),
+        'writes_ok': len(write_timings),
+        'write_errors': len(write_errors),
+        'write_p95_ms': percentile(write_timings, 0.95) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50, help='Socket.IO clients held open')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers per profile')
+    parser.add_argument('--http-threads', type=int, default=8, help='concurrent HTTP clients')
+    parser.add_argument('--requests', type=int, default=25, help='requests per HTTP client')
+    parser.add_argument('--customers', type=int, default=200, help='rows on the timed page')
+    parser.add_argument('--timeout', type=float, default=10, help='per-connect/request timeout (s)')
+    parser.add_argument('--settle', type=float, default=1, help='seconds between opening sockets and timing')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--writers', type=int, default=0, help='concurrent clients posting payments')
+    parser.add_argument('--hold-ms', type=float, default=0, help='write lock held by another process (ms)')
+    parser.add_argument('--hold-every', type=float, default=1, help='seconds between write lock holds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.database = os.path.join(workdir, 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{args.database}'
+        seed(args.customers)
+        print(f'{args.clients} Socket.IO clients, {args.http_threads}x{args.requests} GET /customers, '
+              f'{args.writers}x{args.requests} POST /add_payment, write lock held {args.hold_ms:g} ms '
+              f'every {args.hold_every:g} s, {args.workers} worker(s)')
+        print(f'{"profile":>10} {"sockets":>8} {"connect s":>10} {"transport":>10} {"ok/err":>8} '
+              f'{"median ms":>10} {"p95 ms":>8} {"max ms":>8} {"writes ok/err":>14} {"write p95":>10}')
+        for profile in args.profiles:
+            r = run_profile(profile, args, workdir)
+            print(f'{r["profile"]:>10} {r["connected"]:>8} {r["connect_s"]:>10.2f} {r["transport"]:>10} '
+                  f'{r["ok"]:>4}/{r["errors"]:<3} {r["median_ms"]:>10.1f} {r["p95_ms"]:>8.1f} {r["max_ms"]:>8.1f} '
+                  f'{r["writes_ok"]:>9}/{r["write_errors"]:<4} {r["write_p95_ms"]:>10.1f}')
+
+if __name__ == '__main__':
+    main()
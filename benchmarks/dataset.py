@@ -0,0 +1,189 @@
+"""Deterministic synthetic dataset at up to production scale.
+
+Seeds products across the GST slabs, customers with a skewed (Zipf) share of
+the business, invoices with 1-100 line items, and credit/payment transactions,
+then brings the derived state (stored balances, invoice sequence, sync markers)
+in line so the app behaves as if the data had been entered through it. The same
+scale and seed always produce the same database.
+
+    python benchmarks/dataset.py --scale production --out /tmp/cms-production.db
+
+Users ``bench``/``bench`` (admin) and ``staff``/``staff`` are created for logins.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCALES = {
+    'tiny': dict(customers=20, products=10, invoices=50, transactions=200),
+    'small': dict(customers=200, products=50, invoices=2000, transactions=10000),
+    'medium': dict(customers=1000, products=200, invoices=20000, transactions=100000),
+    'production': dict(customers=5000, products=500, invoices=200000, transactions=1000000),
+}
+
+GST_SLABS = (0, 5, 12, 18, 28)
+GST_WEIGHTS = (5, 20, 20, 40, 15)
+PAYMENT_MODES = ('Cash', 'UPI', 'Card', 'Bank Transfer', 'Credit')
+START = datetime(2022, 4, 1)
+END = datetime(2025, 3, 31, 23, 59)
+BATCH = 10000
+
+def _timestamps(rng, count):
+    """``count`` sorted datetimes spread over the dataset's three financial years."""
+    span = int((END - START).total_seconds())
+    return [START + timedelta(seconds=offset) for offset in sorted(rng.randrange(span) for _ in range(count))]
+
+def _fmt(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S.000000')
+
+def _batched(cursor, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            cursor.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        cursor.executemany(sql, batch)
+
+INVOICE_SQL = ('INSERT INTO invoice (id, invoice_number, customer_id, date, payment_mode, transport_charges, '
+               'round_off, total_amount, created_by, vehicle_no, delivery_date) '
+               'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+ITEM_SQL = ('INSERT INTO invoice_item (invoice_id, product_id, quantity, rate, discount_percent, hsn, '
+            'gst_percent, amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+
+def _flush_invoices(cursor, invoice_rows, item_rows):
+    cursor.executemany(INVOICE_SQL, invoice_rows)
+    cursor.executemany(ITEM_SQL, item_rows)
+    written = len(item_rows)
+    invoice_rows.clear()
+    item_rows.clear()
+    return written
+
+def seed(conn, customers, products, invoices, transactions, seed=42, password_hash=None):
+    """Fill an empty, fully migrated database through the DB-API connection ``conn``.
+
+    Returns the row counts written, including the generated invoice items.
+    """
+    from werkzeug.security import generate_password_hash
+    password_hash = password_hash or generate_password_hash
+    rng = random.Random(seed)
+    cur = conn.cursor()
+
+    cur.executemany('INSERT INTO user (id, username, password, role, created_at) VALUES (?, ?, ?, ?, ?)',
+                    [(1, 'bench', password_hash('bench'), 'admin', _fmt(START)),
+                     (2, 'staff', password_hash('staff'), 'staff', _fmt(START))])
+
+    catalog = []
+    for i in range(1, products + 1):
+        gst = rng.choices(GST_SLABS, GST_WEIGHTS)[0]
+        catalog.append((i, f'Product {i:04d}', f'{rng.randint(1000, 9999)}', gst, round(rng.uniform(20, 5000), 2)))
+    cur.executemany('INSERT INTO product (id, name, hsn, gst_percent, price) VALUES (?, ?, ?, ?, ?)', catalog)
+
+    _batched(cur, 'INSERT INTO customer (id, name, email, phone, address, gstin, credit_limit, created_at, '
+                  'invoiced_total, credited_total, paid_total, change_seq) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0, 0, 1)',
+             ((i, f'Customer {i:05d}', f'customer{i}@example.com', f'9{rng.randrange(10 ** 9):09d}',
+               f'{rng.randint(1, 999)} Market Road', f'33ABCDE{i:04d}F1Z{i % 10}' if rng.random() < 0.4 else None,
+               rng.choice((50000, 100000, 250000, 500000)), _fmt(START))
+              for i in range(1, customers + 1)))
+
+    # Zipf-weighted customers: the top fifth account for roughly 80% of the business
+    ranked = list(range(1, customers + 1))
+    rng.shuffle(ranked)
+    weights = list(accumulate(1 / rank for rank in range(1, customers + 1)))
+
+    def pick_customer():
+        return rng.choices(ranked, cum_weights=weights)[0]
+
+    items_written = 0
+    invoice_rows, item_rows = [], []
+    for number, date in enumerate(_timestamps(rng, invoices), start=1):
+        lines = min(100, int(rng.paretovariate(1.2)))
+        subtotal = 0.0
+        for _ in range(lines):
+            product_id, _, hsn, gst, price = catalog[rng.randrange(products)]
+            quantity = rng.randint(1, 50)
+            rate = round(price * rng.uniform(0.9, 1.1), 2)
+            discount = rng.choice((0, 0, 0, 5, 10))
+            amount = round(quantity * rate * (1 - discount / 100) * (1 + gst / 100), 2)
+            subtotal += amount
+            item_rows.append((number, product_id, quantity, rate, discount, hsn, gst, amount))
+        transport = rng.choice((0, 0, 0, 150, 500))
+        total = subtotal + transport
+        round_off = round(round(total) - total, 2)
+        invoice_rows.append((number, number, pick_customer(), _fmt(date), rng.choice(PAYMENT_MODES), transport,
+                             round_off, round(total + round_off, 2), rng.choice((1, 2)), None, None))
+        if len(item_rows) >= BATCH:
+            items_written += _flush_invoices(cur, invoice_rows, item_rows)
+    items_written += _flush_invoices(cur, invoice_rows, item_rows)
+
+    def transaction_rows():
+        for i, date in enumerate(_timestamps(rng, transactions), start=1):
+            if rng.random() < 0.7:
+                yield (pick_customer(), 'payment', round(rng.uniform(500, 100000), 2), f'Payment {i}',
+                       _fmt(date), rng.choice(PAYMENT_MODES[:4]))
+            else:
+                yield (pick_customer(), 'credit', round(rng.uniform(100, 50000), 2), f'Credit {i}',
+                       _fmt(date), None)
+    _batched(cur, 'INSERT INTO "transaction" (customer_id, type, amount, description, date, payment_mode, '
+                  'change_seq) VALUES (?, ?, ?, ?, ?, ?, 1)', transaction_rows())
+
+    # Derived state the write paths would normally maintain
+    cur.execute('UPDATE customer SET '
+                'invoiced_total = COALESCE((SELECT SUM(total_amount) FROM invoice '
+                '    WHERE invoice.customer_id = customer.id), 0), '
+                'credited_total = COALESCE((SELECT SUM(amount) FROM "transaction" '
+                '    WHERE "transaction".customer_id = customer.id AND type = \'credit\'), 0), '
+                'paid_total = COALESCE((SELECT SUM(amount) FROM "transaction" '
+                '    WHERE "transaction".customer_id = customer.id AND type = \'payment\'), 0)')
+    cur.execute('INSERT OR REPLACE INTO invoice_sequence (name, next_value) VALUES (\'invoice\', ?)',
+                (invoices + 1,))
+    cur.execute('INSERT OR REPLACE INTO cache_version (name, version) VALUES (\'sync\', 1)')
+    cur.execute('ANALYZE')
+    conn.commit()
+    return {'customers': customers, 'products': products, 'invoices': invoices,
+            'invoice_items': items_written, 'transactions': transactions}
+
+def build(path, scale='small', seed_value=42):
+    """Create a migrated database at ``path`` and seed it; the app is imported here."""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'
+    from app import app, db
+    import migrations
+    with app.app_context():
+        db.create_all()
+        migrations.stamp(db.engine)
+        conn = db.engine.raw_connection()
+        try:
+            counts = seed(conn, seed=seed_value, **SCALES[scale])
+        finally:
+            conn.close()
+        db.engine.dispose()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', required=True, help='database file to create')
+    parser.add_argument('--force', action='store_true', help='replace an existing file')
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        if not args.force:
+            parser.error(f'{args.out} exists; pass --force to replace it')
+        os.remove(args.out)
+    started = time.perf_counter()
+    counts = build(args.out, args.scale, args.seed)
+    summary = ', '.join(f'{count:,} {name}' for name, count in counts.items())
+    print(f'{args.out}: {summary} in {time.perf_counter() - started:.1f}s '
+          f'({os.path.getsize(args.out) / 2 ** 20:.0f} MiB)')
+
+if __name__ == '__main__':
+    main()
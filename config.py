@@ -1,15 +1,115 @@
 import os
+import tempfile
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+def parse_limits(value, defaults):
+    """``defaults`` updated from a ``name=number,name=number`` string."""
+    limits = dict(defaults)
+    for part in filter(None, (value or '').split(',')):
+        name, _, limit = part.partition('=')
+        limits[name.strip()] = int(limit)
+    return limits
+
 class Config:
     # Flask configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
     
-    # Database configuration
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database/cms.db'
+    # Database configuration. Relative SQLite paths are resolved against the
+    # project directory, so DATABASE_URL can point the database at faster storage.
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'database', 'cms.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
+
+    # Serving profile: 'threading' for sync gunicorn workers, 'eventlet' for the
+    # cooperative profile (see gunicorn_config.py). Must match the worker class.
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+
+    # SQLite engine profile. The pragmas are applied to every new connection;
+    # the pool is per worker process, so size it for the threads in one worker.
+    # SQLite waits for locks inside C, which stalls every green thread of an
+    # eventlet worker, so that profile retries busy statements between short
+    # waits instead (see CooperativeConnection in app.py).
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),  # ms
+        'cache_size': -20000,  # KiB
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY'
+    }
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 5)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
+
+    # Read-heavy views (reports, dashboard totals, statements, lists) read
+    # through a separate read-only pool, so long scans never hold a slot that
+    # billing writes wait for. With REPORTING_SNAPSHOT on, the report pages read
+    # a copy of the database taken with the online backup API instead, refreshed
+    # once it is REPORTING_SNAPSHOT_MAX_AGE old (or by `flask refresh-snapshot`).
+    REPORTING_READS = os.environ.get('REPORTING_READS', '1').lower() in ('1', 'true', 'yes')
+    REPORTING_POOL_SIZE = int(os.environ.get('REPORTING_POOL_SIZE') or 3)
+    REPORTING_SNAPSHOT = os.environ.get('REPORTING_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+    REPORTING_SNAPSHOT_PATH = (os.environ.get('REPORTING_SNAPSHOT_PATH')
+                               or os.path.join(basedir, 'database', 'reporting-snapshot.db'))
+    REPORTING_SNAPSHOT_MAX_AGE = int(os.environ.get('REPORTING_SNAPSHOT_MAX_AGE') or 300)  # seconds
+
+    # Dashboard snapshot lifetime in seconds; bounds how long writes made by
+    # other workers take to show up on the landing page
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL') or 30)
+
+    # Byte budget for rendered invoice/print pages cached in each worker
+    INVOICE_RENDER_CACHE_BYTES = int(os.environ.get('INVOICE_RENDER_CACHE_BYTES') or 32 * 1024 * 1024)
+    # Seconds between a worker's checks for invoices invalidated by other workers
+    INVOICE_RENDER_CHECK_INTERVAL = float(os.environ.get('INVOICE_RENDER_CHECK_INTERVAL') or 1)
+
+    # Invoice numbering: 'global' or 'financial_year' (restarts every April).
+    # A block size above 1 lets each worker reserve numbers in batches; unused
+    # numbers in a worker's block are skipped when it restarts.
+    INVOICE_NUMBER_SCOPE = os.environ.get('INVOICE_NUMBER_SCOPE') or 'global'
+    INVOICE_NUMBER_BLOCK_SIZE = int(os.environ.get('INVOICE_NUMBER_BLOCK_SIZE') or 1)
+
+    # Socket.IO fan-out between workers: unset keeps events in-process,
+    # sqlite:///path shares them through a local file, redis:// (or any Kombu
+    # URL) uses that broker. Per-customer updates are coalesced over the window.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_COALESCE_WINDOW = float(os.environ.get('SOCKETIO_COALESCE_WINDOW') or 0.25)  # seconds
+
+    # Opt-in request profiling (see profiling.py): Server-Timing headers, a JSON
+    # line per request on the cms.profile logger and a slow-query log. Only the
+    # sampled share of requests is instrumented.
+    PROFILING = os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE') or 1.0)
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 100)
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or os.path.join(basedir, 'logs', 'slow_queries.log')
+
+    # /metrics: set METRICS_DB (a SQLite file) when running several workers so
+    # each scrape reports all of them. METRICS_TOKEN requires a bearer token;
+    # without one, only direct requests from this host are served.
+    METRICS_DB = os.environ.get('METRICS_DB')
+    METRICS_PUBLISH_INTERVAL = float(os.environ.get('METRICS_PUBLISH_INTERVAL') or 5)  # seconds
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Background jobs (see jobs.py): exports, bulk printing and rebuilds are queued
+    # in a SQLite file and run by `flask --app app jobs-worker`, JOBS_WORKERS
+    # processes that at most run JOBS_CONCURRENCY jobs of each type at once
+    # (e.g. JOBS_CONCURRENCY="export=3,rebuild=1"). Progress reaches the browser
+    # through SOCKETIO_MESSAGE_QUEUE, so set it when the worker runs.
+    JOBS_DB = os.environ.get('JOBS_DB') or os.path.join(basedir, 'database', 'jobs.db')
+    JOBS_RESULT_DIR = os.environ.get('JOBS_RESULT_DIR') or os.path.join(basedir, 'database', 'job_results')
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS') or 2)
+    JOBS_CONCURRENCY = parse_limits(os.environ.get('JOBS_CONCURRENCY'),
+                                    {'export': 2, 'print_invoices': 1, 'rebuild': 1})
+    JOBS_STALE_AFTER = int(os.environ.get('JOBS_STALE_AFTER') or 60)  # seconds without a heartbeat
+    JOBS_RETENTION_DAYS = int(os.environ.get('JOBS_RETENTION_DAYS') or 7)
+
+    # Financial-year archives (`flask --app app archive-year 2023`): settled years'
+    # invoices, items and transactions move to one SQLite file per year in
+    # ARCHIVE_DIR. The current year and the ARCHIVE_KEEP_YEARS before it stay.
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(basedir, 'database', 'archive')
+    ARCHIVE_KEEP_YEARS = int(os.environ.get('ARCHIVE_KEEP_YEARS') or 1)
+
     # Application configuration
     APP_NAME = 'Customer Management System'
     ADMIN_USERNAME = 'Krishna'
@@ -70,8 +170,19 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    SQLITE_PRAGMAS = {'temp_store': 'MEMORY'}
+    JOBS_DB = os.path.join(tempfile.gettempdir(), f'cms-test-jobs-{os.getpid()}.db')
+    JOBS_RESULT_DIR = os.path.join(tempfile.gettempdir(), f'cms-test-job-results-{os.getpid()}')
+    ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), f'cms-test-archive-{os.getpid()}')
 
 class ProductionConfig(Config):
+    SQLITE_PRAGMAS = dict(Config.SQLITE_PRAGMAS,
+                          cache_size=-64000,
+                          mmap_size=512 * 1024 * 1024)
+    # Cheap enough to leave PROFILING on when only a few requests are measured
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE') or 0.05)
+    METRICS_DB = os.environ.get('METRICS_DB') or 'database/metrics.db'
+
     @classmethod
     def init_app(cls, app):
         Config.init_app(app)
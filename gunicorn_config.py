@@ -1,13 +1,31 @@
 import multiprocessing
+import os
 
 # Server socket
 bind = "0.0.0.0:8000"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
+# Each worker owns its own SQLAlchemy pool (DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections), so total SQLite connections are workers * pool size.
+#
+# SOCKETIO_ASYNC_MODE picks the serving profile:
+# - 'threading' (default): sync workers. Simple, but every open Socket.IO
+#   long-poll holds a whole worker, so a few browsers can starve HTTP requests.
+# - 'eventlet': one cooperative worker per core, each multiplexing up to
+#   worker_connections sockets. Socket.IO needs sticky sessions when workers > 1,
+#   and SOCKETIO_MESSAGE_QUEUE so events reach clients on other workers.
+# WEB_CONCURRENCY overrides the worker count for either profile.
+async_mode = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+if async_mode == 'eventlet':
+    worker_class = 'eventlet'
+    workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count())
+else:
+    worker_class = 'sync'
+    workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
 worker_connections = 1000
+# Exports, bulk printing and rebuilds that can outlast this belong in the
+# background job queue (`flask --app app jobs-worker`), not in a request
 timeout = 30
 keepalive = 2
 
@@ -44,6 +62,23 @@ def on_exit(server):
     """
     pass
 
+def post_worker_init(worker):
+    """
+    Drop any database connections inherited from the master process. Runs once
+    the worker has loaded the app, i.e. after eventlet has patched the stdlib.
+    """
+    from app import app, db, dispose_read_engines
+    with app.app_context():
+        db.engine.dispose()
+    dispose_read_engines()
+
+def worker_exit(server, worker):
+    """
+    Publish the worker's final metrics so the totals keep its last requests
+    """
+    from app import publish_metrics
+    publish_metrics()
+
 def worker_int(worker):
     """
     Worker interrupt hook
@@ -0,0 +1,300 @@
+"""Durable background jobs in a SQLite file, run by a separate worker pool.
+
+A web worker only inserts a job row and returns. Worker processes claim queued
+jobs oldest first, with at most ``concurrency[type]`` jobs of each type running
+at once across all of them, and record progress, results and failures on the
+row. Running jobs heartbeat; a job whose worker stops heartbeating (killed,
+restarted) goes back to the queue, so nothing submitted is lost. Cancelling a
+running job is cooperative: its next progress report raises ``JobCancelled``.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger('cms.jobs')
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS job ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, params TEXT NOT NULL, user_id INTEGER, '
+    'status TEXT NOT NULL, progress REAL, message TEXT, error TEXT, '
+    'result_path TEXT, result_name TEXT, result_mimetype TEXT, '
+    'attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0, worker TEXT, '
+    'created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)',
+    'CREATE INDEX IF NOT EXISTS ix_job_status_type ON job (status, type, id)',
+    'CREATE INDEX IF NOT EXISTS ix_job_user ON job (user_id, id)',
+)
+
+Job = namedtuple('Job', 'id type params user_id status progress message error result_path result_name '
+                        'result_mimetype attempts cancel_requested worker created_at started_at finished_at '
+                        'heartbeat_at')
+
+# What a job handler returns: an optional result file and a closing message
+JobResult = namedtuple('JobResult', 'path name mimetype message', defaults=(None, None, None, None))
+
+def _job(row):
+    return Job(*row[:2], json.loads(row[2]), *row[3:]) if row else None
+
+def to_dict(job):
+    """The client-facing fields of ``job``; the result file path stays on the server."""
+    return {
+        'id': job.id, 'type': job.type, 'status': job.status, 'progress': job.progress,
+        'message': job.message, 'error': job.error, 'has_result': bool(job.result_path),
+        'result_name': job.result_name, 'created_at': job.created_at, 'started_at': job.started_at,
+        'finished_at': job.finished_at
+    }
+
+
+class JobCancelled(Exception):
+    """Raised from a progress report of a job whose cancellation was requested."""
+
+
+class JobQueue:
+    """Job rows in a SQLite file shared by the web workers and the job workers.
+
+    Result files are written to ``result_dir``. Finished jobs and their files
+    are pruned ``retention`` seconds after they finish.
+    """
+
+    def __init__(self, path, result_dir, stale_after=60, retention=7 * 86400):
+        self.path = path
+        self.result_dir = result_dir
+        self.stale_after = stale_after
+        self.retention = retention
+        for directory in (os.path.dirname(path), result_dir):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA busy_timeout = 5000')
+        return conn
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+        finally:
+            conn.close()
+
+    def enqueue(self, type, params, user_id=None):
+        """Queue a job and return its id."""
+        conn = self._connect()
+        try:
+            return conn.execute('INSERT INTO job (type, params, user_id, status, created_at) '
+                                "VALUES (?, ?, ?, 'queued', ?)",
+                                (type, json.dumps(params), user_id, time.time())).lastrowid
+        finally:
+            conn.close()
+
+    def get(self, id):
+        rows, _ = self._execute('SELECT * FROM job WHERE id = ?', (id,))
+        return _job(rows[0]) if rows else None
+
+    def list(self, user_id=None, limit=50):
+        """The latest jobs, of one user or of everyone."""
+        if user_id is None:
+            rows, _ = self._execute('SELECT * FROM job ORDER BY id DESC LIMIT ?', (limit,))
+        else:
+            rows, _ = self._execute('SELECT * FROM job WHERE user_id = ? ORDER BY id DESC LIMIT ?',
+                                    (user_id, limit))
+        return [_job(row) for row in rows]
+
+    def cancel(self, id):
+        """Cancel a queued job outright, or ask a running one to stop; returns the job."""
+        now = time.time()
+        _, cancelled = self._execute("UPDATE job SET status = 'cancelled', cancel_requested = 1, "
+                                     "finished_at = ? WHERE id = ? AND status = 'queued'", (now, id))
+        if not cancelled:
+            self._execute("UPDATE job SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (id,))
+        return self.get(id)
+
+    def claim(self, worker, concurrency):
+        """Mark the oldest queued job of a type with a free slot as running by ``worker``.
+
+        ``concurrency`` maps each job type this worker can run to the most jobs of
+        that type allowed to run at once. Returns the job, or None.
+        """
+        if not concurrency:
+            return None
+        now = time.time()
+        types = ', '.join('?' * len(concurrency))
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front, so two workers cannot both see a free slot
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("UPDATE job SET status = 'queued', worker = NULL WHERE status = 'running' "
+                             'AND heartbeat_at < ?', (now - self.stale_after,))
+                running = dict(conn.execute(f"SELECT type, COUNT(*) FROM job WHERE status = 'running' "
+                                            f'AND type IN ({types}) GROUP BY type', tuple(concurrency)))
+                candidates = conn.execute(f"SELECT MIN(id), type FROM job WHERE status = 'queued' "
+                                          f'AND type IN ({types}) GROUP BY type ORDER BY 1',
+                                          tuple(concurrency)).fetchall()
+                for id, type in candidates:
+                    if running.get(type, 0) < concurrency[type]:
+                        conn.execute("UPDATE job SET status = 'running', worker = ?, started_at = ?, "
+                                     'heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?',
+                                     (worker, now, now, id))
+                        conn.execute('COMMIT')
+                        return self.get(id)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+        return None
+
+    def heartbeat(self, id, worker):
+        self._execute("UPDATE job SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                      (time.time(), id, worker))
+
+    def progress(self, id, progress=None, message=None):
+        """Record progress; returns True if the job has been asked to stop."""
+        rows, _ = self._execute('UPDATE job SET progress = coalesce(?, progress), message = coalesce(?, message), '
+                                'heartbeat_at = ? WHERE id = ? RETURNING cancel_requested',
+                                (progress, message, time.time(), id))
+        return bool(rows and rows[0][0])
+
+    def finish(self, id, status, message=None, error=None, result=None):
+        """Close a job as done, failed or cancelled, with the ``JobResult`` of a done one."""
+        path, name, mimetype, _ = result or JobResult()
+        self._execute('UPDATE job SET status = ?, message = coalesce(?, message), error = ?, result_path = ?, '
+                      "result_name = ?, result_mimetype = ?, progress = CASE ? WHEN 'done' THEN 1.0 "
+                      'ELSE progress END, finished_at = ? WHERE id = ?',
+                      (status, message, error, path, name, mimetype, status, time.time(), id))
+
+    def result_path(self, id, suffix):
+        return os.path.join(self.result_dir, f'job-{id}{suffix}')
+
+    def prune(self):
+        """Delete jobs that finished more than ``retention`` seconds ago, with their files."""
+        cutoff = time.time() - self.retention
+        rows, _ = self._execute(f"SELECT result_path FROM job WHERE status IN {FINISHED} AND finished_at < ?",
+                                (cutoff,))
+        for path, in rows:
+            if path and os.path.exists(path):
+                os.remove(path)
+        self._execute(f'DELETE FROM job WHERE status IN {FINISHED} AND finished_at < ?', (cutoff,))
+
+
+class Worker:
+    """Runs jobs from ``queue`` one at a time.
+
+    ``handlers`` maps a job type to ``function(job, progress)``, which returns
+    a ``JobResult`` or None. ``progress(fraction=None, message=None)``
+    records how far the job got and raises ``JobCancelled`` when asked to stop.
+    ``notify(job)`` is called with the job row after every change; ``context()``
+    wraps each job (e.g. in an application context).
+    """
+
+    def __init__(self, queue, handlers, concurrency, notify=None, context=None, poll_interval=1.0, name=None):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = {type: concurrency.get(type, 1) for type in handlers}
+        self.notify = notify or (lambda job: None)
+        self.context = context
+        self.poll_interval = poll_interval
+        self.name = name or f'{os.uname().nodename}-{os.getpid()}'
+        self._stopping = threading.Event()
+
+    def run_once(self):
+        """Run the next job, if a slot is free for one; returns whether a job ran."""
+        job = self.queue.claim(self.name, self.concurrency)
+        if job is None:
+            return False
+        self.notify(job)
+        beating = threading.Event()
+        heart = threading.Thread(target=self._heartbeat, args=(job.id, beating), daemon=True)
+        heart.start()
+        try:
+            if self.context is None:
+                self._run(job)
+            else:
+                with self.context():
+                    self._run(job)
+        finally:
+            beating.set()
+            heart.join()
+        self.notify(self.queue.get(job.id))
+        return True
+
+    def _run(self, job):
+        def progress(fraction=None, message=None):
+            if self.queue.progress(job.id, fraction, message):
+                raise JobCancelled()
+            self.notify(job._replace(progress=fraction, message=message))
+
+        try:
+            result = self.handlers[job.type](job, progress)
+        except JobCancelled:
+            self.queue.finish(job.id, 'cancelled', message='Cancelled')
+        except Exception as exc:
+            logger.exception('job %s (%s) failed', job.id, job.type)
+            self.queue.finish(job.id, 'failed', error=str(exc) or type(exc).__name__)
+        else:
+            result = result or JobResult()
+            self.queue.finish(job.id, 'done', message=result.message, result=result)
+
+    def _heartbeat(self, id, stopped):
+        # Long steps between progress reports must not look like a dead worker
+        while not stopped.wait(self.queue.stale_after / 3):
+            self.queue.heartbeat(id, self.name)
+
+    def run(self):
+        """Run jobs until ``stop()``, pruning old jobs now and then."""
+        pruned = 0
+        while not self._stopping.is_set():
+            if time.time() - pruned > 3600:
+                self.queue.prune()
+                pruned = time.time()
+            if not self.run_once():
+                self._stopping.wait(self.poll_interval)
+
+    def stop(self):
+        self._stopping.set()
+
+
+def run_pool(processes, target):
+    """Run ``target()`` in ``processes`` child processes until SIGINT/SIGTERM, restarting any that die.
+
+    Each child gets SIGTERM on shutdown, so ``target`` should stop after its current job.
+    """
+    context = multiprocessing.get_context('fork')
+    children = {}
+    stopping = threading.Event()
+
+    def shutdown(signum, frame):
+        stopping.set()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while not stopping.is_set():
+        for slot in range(processes):
+            child = children.get(slot)
+            if child is None or not child.is_alive():
+                if child is not None:
+                    logger.warning('job worker %s exited with %s; restarting', child.pid, child.exitcode)
+                children[slot] = context.Process(target=target, name=f'cms-jobs-{slot}', daemon=False)
+                children[slot].start()
+        stopping.wait(1)
+    for child in children.values():
+        child.terminate()
+    for child in children.values():
+        child.join()
@@ -0,0 +1,231 @@
+"""In-process metrics with Prometheus text exposition, aggregated across workers.
+
+Each worker keeps its counters, gauges and histograms in memory, so recording a
+value is a dictionary update under a lock. With a ``SQLiteMetricsStore`` every
+worker also publishes a snapshot of its values to a shared SQLite file every few
+seconds. A scrape merges the snapshots: counters and histograms are summed over
+all workers, including ones that have exited so totals never go backwards, and
+gauges are summed over the workers that are still running.
+"""
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS metrics_snapshot ('
+          'worker TEXT PRIMARY KEY, pid INTEGER NOT NULL, payload TEXT NOT NULL, updated_at REAL NOT NULL)')
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """Named metrics of one process. Declare each name before recording it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._values = {}
+        self._collectors = []
+        self._derived = {}
+
+    def counter(self, name, help):
+        self._metrics[name] = ('counter', help, None)
+
+    def gauge(self, name, help):
+        self._metrics[name] = ('gauge', help, None)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._metrics[name] = ('histogram', help, tuple(buckets))
+
+    def derive(self, name, help, function):
+        """Gauge computed at render time: ``function(values)`` yields ``(labels, value)``
+        from the merged ``{(name, labels): value}`` of all workers."""
+        self._metrics[name] = ('gauge', help, None)
+        self._derived[name] = function
+
+    def collect(self, collector):
+        """Register ``collector()``, which yields ``(name, labels, value)`` to set on every snapshot."""
+        self._collectors.append(collector)
+        return collector
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, _labels(labels))] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self._metrics[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, one for +Inf, then the running sum
+                counts = self._values[key] = [0] * (len(buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        """All current values as a JSON-serialisable list of ``[name, labels, value]``."""
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                self.set(name, value, **labels)
+        with self._lock:
+            return [[name, list(map(list, labels)), list(value) if isinstance(value, list) else value]
+                    for (name, labels), value in self._values.items()]
+
+    def render(self, snapshots=None):
+        """Prometheus text format for this process, or for ``merge()``d worker snapshots."""
+        values = merge(self._metrics, snapshots if snapshots is not None else [(self.snapshot(), True)])
+        for name, function in self._derived.items():
+            values.update([((name, labels), value) for labels, value in function(values)])
+        lines = []
+        for name, (kind, help, buckets) in self._metrics.items():
+            series = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), value):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def merge(metrics, snapshots):
+    """Combine ``(snapshot, alive)`` pairs into ``{(name, labels): value}``."""
+    merged = {}
+    for snapshot, alive in snapshots:
+        for name, labels, value in snapshot:
+            kind = metrics.get(name, (None,))[0]
+            if kind is None or (kind == 'gauge' and not alive):
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            if kind == 'histogram':
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SQLiteMetricsStore:
+    """Per-worker metric snapshots in a SQLite file shared by the workers on one host.
+
+    Each worker process writes one row. Rows of workers that have not published
+    for ``retention`` seconds are dropped, which shows up as a counter reset for
+    their share of the totals.
+    """
+
+    def __init__(self, path, retention=86400):
+        self.path = path
+        self.retention = retention
+        self._worker = None
+        self._publisher = None
+        self._publisher_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _worker_id(self):
+        # A pid is reused by a later worker, so the start time tells them apart
+        pid = os.getpid()
+        if self._worker is None or self._worker[0] != pid:
+            self._worker = (pid, f'{pid}-{time.time():.6f}')
+        return self._worker
+
+    def write(self, snapshot):
+        """Replace this process's row with ``snapshot``."""
+        pid, worker = self._worker_id()
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO metrics_snapshot (worker, pid, payload, updated_at) '
+                             'VALUES (?, ?, ?, ?)', (worker, pid, json.dumps(snapshot), now))
+                conn.execute('DELETE FROM metrics_snapshot WHERE updated_at < ?', (now - self.retention,))
+        finally:
+            conn.close()
+
+    def read(self):
+        """``(snapshot, alive)`` for every worker that has published."""
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT worker, pid, payload FROM metrics_snapshot').fetchall()
+        finally:
+            conn.close()
+        current = self._worker[1] if self._worker else None
+        # A row whose pid now belongs to a newer worker is from a dead process
+        live = {pid: worker for worker, pid, _ in sorted(rows, key=lambda row: float(row[0].split('-')[1]))}
+        return [(json.loads(payload), worker == current or (live[pid] == worker and pid_alive(pid)))
+                for worker, pid, payload in rows]
+
+    def start_publisher(self, registry, interval, start_background_task, sleep):
+        """Publish ``registry`` every ``interval`` seconds; idempotent within a process.
+
+        Call it after the worker has forked (e.g. from a request hook), since
+        background tasks do not survive a fork.
+        """
+        with self._publisher_lock:
+            pid, worker = self._worker_id()
+            if self._publisher == worker:
+                return
+            self._publisher = worker
+
+        def publish():
+            while True:
+                sleep(interval)
+                try:
+                    self.write(registry.snapshot())
+                except sqlite3.Error:
+                    pass  # the file is busy; the next round publishes the same totals
+
+        start_background_task(publish)
@@ -0,0 +1,378 @@
+"""Versioned, non-destructive schema migrations for the CMS database.
+
+Each migration upgrades an existing database in place; nothing is dropped. The
+applied version is kept in the ``schema_version`` table. Databases created
+from the models with ``db.create_all()`` already have the latest schema and
+are stamped instead of migrated.
+
+    flask --app app upgrade-db
+"""
+from sqlalchemy import inspect, text
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+def _record(conn, version, description):
+    conn.execute(text('INSERT INTO schema_version (version, description, applied_at) '
+                      'VALUES (:version, :description, CURRENT_TIMESTAMP)'),
+                 {'version': version, 'description': description})
+
+def _ensure_version_table(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version ('
+                      'version INTEGER PRIMARY KEY, description TEXT NOT NULL, '
+                      'applied_at DATETIME NOT NULL)'))
+
+def upgrade(engine, target=None):
+    """Apply pending migrations up to ``target`` and return the ones applied.
+
+    Each migration runs in its own transaction together with its version row, so
+    an interrupted upgrade resumes from the last completed step.
+    """
+    target = latest_version() if target is None else target
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version > target:
+            break
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+            if version <= current_version(conn):
+                continue
+            func(conn)
+            _record(conn, version, description)
+        applied.append((version, description))
+    return applied
+
+def stamp(engine, version=None):
+    """Mark a freshly created database as being at ``version`` without running migrations."""
+    version = latest_version() if version is None else version
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        for number, description, _ in MIGRATIONS:
+            if current_version(conn) < number <= version:
+                _record(conn, number, description)
+
+@migration(1, 'Stored customer balance columns')
+def add_customer_balance_columns(conn):
+    existing = {c['name'] for c in inspect(conn).get_columns('customer')}
+    columns = [c for c in ('invoiced_total', 'credited_total', 'paid_total') if c not in existing]
+    for column in columns:
+        conn.execute(text(f'ALTER TABLE customer ADD COLUMN {column} FLOAT NOT NULL DEFAULT 0'))
+    if columns:
+        conn.execute(text(
+            'UPDATE customer SET '
+            'invoiced_total = COALESCE((SELECT SUM(total_amount) FROM invoice '
+            '    WHERE invoice.customer_id = customer.id), 0), '
+            'credited_total = COALESCE((SELECT SUM(amount) FROM "transaction" '
+            '    WHERE "transaction".customer_id = customer.id AND type = \'credit\'), 0), '
+            'paid_total = COALESCE((SELECT SUM(amount) FROM "transaction" '
+            '    WHERE "transaction".customer_id = customer.id AND type = \'payment\'), 0)'
+        ))
+
+@migration(2, 'Indexes for the hot query shapes')
+def add_hot_query_indexes(conn):
+    indexes = [
+        # view_customer payments, balance rebuilds, per-customer socket feeds
+        ('ix_transaction_customer_type_date', '"transaction"', 'customer_id, type, date'),
+        # reports keyset pagination, dashboard recent transactions
+        ('ix_transaction_date', '"transaction"', 'date'),
+        # payments listing, today's payments and pending credit totals
+        ('ix_transaction_type_date', '"transaction"', 'type, date'),
+        # view_customer invoices, per-customer invoice totals
+        ('ix_invoice_customer_date', 'invoice', 'customer_id, date'),
+        # invoices listing and invoice exports
+        ('ix_invoice_date', 'invoice', 'date'),
+        ('ix_invoice_item_invoice_id', 'invoice_item', 'invoice_id'),
+        ('ix_invoice_item_product_id', 'invoice_item', 'product_id'),
+    ]
+    for name, table, columns in indexes:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+    conn.execute(text('ANALYZE'))
+
+@migration(3, 'Invoice number sequence table')
+def add_invoice_sequence(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS invoice_sequence ('
+                      'name VARCHAR(50) NOT NULL PRIMARY KEY, next_value INTEGER NOT NULL)'))
+    conn.execute(text('INSERT INTO invoice_sequence (name, next_value) '
+                      'SELECT \'invoice\', COALESCE(MAX(invoice_number), 0) + 1 FROM invoice '
+                      'WHERE NOT EXISTS (SELECT 1 FROM invoice_sequence WHERE name = \'invoice\')'))
+
+@migration(4, 'Cross-worker cache version table')
+def add_cache_version(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS cache_version ('
+                      'name VARCHAR(50) NOT NULL PRIMARY KEY, version INTEGER NOT NULL)'))
+
+@migration(5, 'Change markers for Socket.IO delta sync')
+def add_sync_change_markers(conn):
+    for table in ('customer', 'transaction'):
+        existing = {c['name'] for c in inspect(conn).get_columns(table)}
+        if 'change_seq' not in existing:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0'))
+    # Existing rows share marker 1, so a client holding cursor "1" is up to date
+    conn.execute(text('UPDATE customer SET change_seq = 1 WHERE change_seq = 0'))
+    conn.execute(text('UPDATE "transaction" SET change_seq = 1 WHERE change_seq = 0'))
+    conn.execute(text('INSERT INTO cache_version (name, version) SELECT \'sync\', 1 '
+                      'WHERE NOT EXISTS (SELECT 1 FROM cache_version WHERE name = \'sync\')'))
+    conn.execute(text('CREATE TABLE IF NOT EXISTS sync_tombstone ('
+                      'id INTEGER NOT NULL PRIMARY KEY, entity VARCHAR(20) NOT NULL, '
+                      'row_id INTEGER NOT NULL, change_seq INTEGER NOT NULL)'))
+    indexes = [
+        ('ix_customer_change_seq', 'customer', 'change_seq, id'),
+        ('ix_transaction_change_seq', '"transaction"', 'change_seq, id'),
+        ('ix_transaction_customer_change_seq', '"transaction"', 'customer_id, change_seq, id'),
+        ('ix_sync_tombstone_entity_seq', 'sync_tombstone', 'entity, change_seq'),
+    ]
+    for name, table, columns in indexes:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+
+# Full-text search over customers and products. The FTS5 tables index the base
+# tables' columns (external content) and triggers keep them in step with every
+# write, including bulk imports that bypass the ORM.
+SEARCH_INDEXES = {
+    'customer_search': ('customer', ('name', 'email', 'phone', 'gstin')),
+    'product_search': ('product', ('name', 'hsn')),
+}
+
+def create_search_indexes(conn):
+    """Create and fill the FTS5 search tables and their sync triggers if missing."""
+    for index, (table, columns) in SEARCH_INDEXES.items():
+        if inspect(conn).has_table(index):
+            continue
+        listed = ', '.join(columns)
+        new = ', '.join(f'new.{c}' for c in columns)
+        old = ', '.join(f'old.{c}' for c in columns)
+        conn.execute(text(f"CREATE VIRTUAL TABLE {index} USING fts5({listed}, content='{table}', "
+                          f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+        conn.execute(text(f'CREATE TRIGGER {index}_ai AFTER INSERT ON {table} BEGIN '
+                          f'INSERT INTO {index} (rowid, {listed}) VALUES (new.id, {new}); END'))
+        conn.execute(text(f'CREATE TRIGGER {index}_ad AFTER DELETE ON {table} BEGIN '
+                          f"INSERT INTO {index} ({index}, rowid, {listed}) VALUES ('delete', old.id, {old}); END"))
+        conn.execute(text(f'CREATE TRIGGER {index}_au AFTER UPDATE OF {listed} ON {table} BEGIN '
+                          f"INSERT INTO {index} ({index}, rowid, {listed}) VALUES ('delete', old.id, {old}); "
+                          f'INSERT INTO {index} (rowid, {listed}) VALUES (new.id, {new}); END'))
+        conn.execute(text(f"INSERT INTO {index} ({index}) VALUES ('rebuild')"))
+
+def drop_search_indexes(conn):
+    for index in SEARCH_INDEXES:
+        for suffix in ('ai', 'ad', 'au'):
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {index}_{suffix}'))
+        conn.execute(text(f'DROP TABLE IF EXISTS {index}'))
+
+@migration(6, 'Full-text search indexes for customers and products')
+def add_search_indexes(conn):
+    create_search_indexes(conn)
+
+# Daily ledger totals, per customer (ledger_rollup) and over all customers
+# (ledger_daily_total). Triggers fold every insert, update and delete of an
+# invoice or transaction into both, so rows written outside the app's write
+# paths are counted as well. Both tables are clustered on their key, so a range
+# of days is one contiguous read.
+LEDGER_ROLLUP_COLUMNS = ('invoiced', 'invoice_count', 'credited', 'credit_count', 'paid', 'payment_count')
+LEDGER_ROLLUP_SOURCES = {
+    'invoice': ('{row}.total_amount', '1', '0', '0', '0', '0'),
+    'transaction': ('0', '0',
+                    "CASE {row}.type WHEN 'credit' THEN {row}.amount ELSE 0 END", "{row}.type = 'credit'",
+                    "CASE {row}.type WHEN 'payment' THEN {row}.amount ELSE 0 END", "{row}.type = 'payment'"),
+}
+LEDGER_ROLLUP_TABLES = {
+    'ledger_rollup': ('customer_id', 'day'),
+    'ledger_daily_total': ('day',),
+}
+
+def _ledger_rollup_select():
+    parts = []
+    for table, values in LEDGER_ROLLUP_SOURCES.items():
+        quoted = f'"{table}"'
+        deltas = ', '.join(f'{value.format(row=quoted)} AS {column}'
+                           for value, column in zip(values, LEDGER_ROLLUP_COLUMNS))
+        parts.append(f'SELECT customer_id, date(date) AS day, {deltas} FROM {quoted}')
+    totals = ', '.join(f'SUM({c}) AS {c}' for c in LEDGER_ROLLUP_COLUMNS)
+    return f'SELECT customer_id, day, {totals} FROM ({" UNION ALL ".join(parts)}) GROUP BY customer_id, day'
+
+# Per-customer totals of every day, recomputed from the invoice and transaction rows
+LEDGER_ROLLUP_SELECT = _ledger_rollup_select()
+
+def _rollup_upsert(table, row, values, sign=''):
+    key = LEDGER_ROLLUP_TABLES[table]
+    key_values = ', '.join(f'date({row}.date)' if c == 'day' else f'{row}.{c}' for c in key)
+    listed = ', '.join(key + LEDGER_ROLLUP_COLUMNS)
+    deltas = ', '.join(f'{sign}({value.format(row=row)})' for value in values)
+    totals = ', '.join(f'{c} = {c} + excluded.{c}' for c in LEDGER_ROLLUP_COLUMNS)
+    return (f'INSERT INTO {table} ({listed}) VALUES ({key_values}, {deltas}) '
+            f'ON CONFLICT ({", ".join(key)}) DO UPDATE SET {totals};')
+
+def _rollup_upserts(row, values, sign=''):
+    return ' '.join(_rollup_upsert(table, row, values, sign) for table in LEDGER_ROLLUP_TABLES)
+
+def create_ledger_rollup_tables(conn):
+    """Create the rollup tables and their sync triggers if missing; they start empty."""
+    totals = ('invoiced FLOAT NOT NULL, invoice_count INTEGER NOT NULL, '
+              'credited FLOAT NOT NULL, credit_count INTEGER NOT NULL, '
+              'paid FLOAT NOT NULL, payment_count INTEGER NOT NULL')
+    conn.execute(text('CREATE TABLE IF NOT EXISTS ledger_rollup ('
+                      'customer_id INTEGER NOT NULL REFERENCES customer (id), day DATE NOT NULL, '
+                      f'{totals}, PRIMARY KEY (customer_id, day)) WITHOUT ROWID'))
+    conn.execute(text('CREATE TABLE IF NOT EXISTS ledger_daily_total ('
+                      f'day DATE NOT NULL, {totals}, PRIMARY KEY (day)) WITHOUT ROWID'))
+    create_ledger_rollup_triggers(conn)
+
+def create_ledger_rollup_triggers(conn):
+    for table, values in LEDGER_ROLLUP_SOURCES.items():
+        watched = 'customer_id, date, total_amount' if table == 'invoice' else 'customer_id, date, type, amount'
+        conn.execute(text(f'CREATE TRIGGER IF NOT EXISTS ledger_rollup_{table}_ai AFTER INSERT ON "{table}" '
+                          f'BEGIN {_rollup_upserts("new", values)} END'))
+        conn.execute(text(f'CREATE TRIGGER IF NOT EXISTS ledger_rollup_{table}_ad AFTER DELETE ON "{table}" '
+                          f'BEGIN {_rollup_upserts("old", values, "-")} END'))
+        conn.execute(text(f'CREATE TRIGGER IF NOT EXISTS ledger_rollup_{table}_au AFTER UPDATE OF {watched} '
+                          f'ON "{table}" BEGIN {_rollup_upserts("old", values, "-")} '
+                          f'{_rollup_upserts("new", values)} END'))
+
+def drop_ledger_rollup_triggers(conn):
+    for table in LEDGER_ROLLUP_SOURCES:
+        for suffix in ('ai', 'ad', 'au'):
+            conn.execute(text(f'DROP TRIGGER IF EXISTS ledger_rollup_{table}_{suffix}'))
+
+def fill_ledger_rollups(conn, since=None):
+    """Replace the contents of the rollup tables with totals recomputed from the ledger.
+
+    With ``since`` (a date) earlier days are kept: their rows were archived, so
+    the rollups are all that is left of them.
+    """
+    listed = ', '.join(LEDGER_ROLLUP_COLUMNS)
+    totals = ', '.join(f'SUM({c})' for c in LEDGER_ROLLUP_COLUMNS)
+    where, params = ('WHERE day >= :since', {'since': since.isoformat()}) if since else ('', {})
+    conn.execute(text(f'DELETE FROM ledger_rollup {where}'), params)
+    conn.execute(text(f'INSERT INTO ledger_rollup (customer_id, day, {listed}) '
+                      f'SELECT * FROM ({LEDGER_ROLLUP_SELECT}) {where}'), params)
+    conn.execute(text(f'DELETE FROM ledger_daily_total {where}'), params)
+    conn.execute(text(f'INSERT INTO ledger_daily_total (day, {listed}) '
+                      f'SELECT day, {totals} FROM ledger_rollup {where} GROUP BY day'), params)
+
+@migration(7, 'Daily ledger rollups per customer and overall')
+def add_ledger_rollups(conn):
+    create_ledger_rollup_tables(conn)
+    fill_ledger_rollups(conn)
+
+@migration(8, 'Per-customer transaction date index for statements')
+def add_transaction_customer_date_index(conn):
+    # Customer statements read a customer's transactions in date order a page at a time
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_transaction_customer_date '
+                      'ON "transaction" (customer_id, date)'))
+
+# Monthly GST totals per HSN code, rate and B2B/B2C class (whether the customer
+# has a GSTIN), kept in step by triggers on invoice items and on the invoice and
+# customer columns the key depends on. An item counts once its invoice exists
+# and stops counting when either is deleted, whichever goes first.
+GST_SUMMARY_KEY = ('month', 'hsn', 'gst_percent', 'b2b')
+GST_SUMMARY_COLUMNS = ('item_count', 'quantity', 'taxable_value', 'cgst', 'sgst')
+
+def _gst_summary_select(item='invoice_item', invoice='invoice', customer='customer', where=None, sign=''):
+    """Summary deltas of the items matched by ``where``; each of ``item``, ``invoice`` and
+    ``customer`` is either its table or a trigger's ``old``/``new`` row."""
+    taxable = f'{item}.quantity * {item}.rate * (1 - {item}.discount_percent / 100.0)'
+    keys = (f"date({invoice}.date, 'start of month')", f'{item}.hsn', f'{item}.gst_percent',
+            f"coalesce({customer}.gstin, '') != ''")
+    values = ('COUNT(*)', f'SUM({item}.quantity)', f'SUM({taxable})',
+              f'SUM({taxable} * {item}.gst_percent / 200.0)', f'SUM({taxable} * {item}.gst_percent / 200.0)')
+    tables = [name for name in ('invoice_item', 'invoice', 'customer') if name in (item, invoice, customer)]
+    filters = [f'{invoice}.id = {item}.invoice_id', f'{customer}.id = {invoice}.customer_id']
+    if where:
+        filters.append(where)
+    listed = ', '.join(f'{value} AS {column}' for value, column in zip(keys, GST_SUMMARY_KEY))
+    listed += ', ' + ', '.join(f'{sign}{value} AS {column}' for value, column in zip(values, GST_SUMMARY_COLUMNS))
+    return (f'SELECT {listed} FROM {", ".join(tables)} WHERE {" AND ".join(filters)} '
+            f'GROUP BY {", ".join(map(str, range(1, len(GST_SUMMARY_KEY) + 1)))}')
+
+# Summary rows recomputed from the invoice items
+GST_SUMMARY_SELECT = _gst_summary_select()
+
+def _gst_summary_upsert(sign='', **rows):
+    listed = ', '.join(GST_SUMMARY_KEY + GST_SUMMARY_COLUMNS)
+    totals = ', '.join(f'{c} = {c} + excluded.{c}' for c in GST_SUMMARY_COLUMNS)
+    return (f'INSERT INTO gst_summary ({listed}) {_gst_summary_select(sign=sign, **rows)} '
+            f'ON CONFLICT ({", ".join(GST_SUMMARY_KEY)}) DO UPDATE SET {totals};')
+
+GST_SUMMARY_TRIGGERS = {
+    'invoice_item_ai': ('AFTER INSERT ON invoice_item',
+                        (_gst_summary_upsert(item='new'),)),
+    'invoice_item_ad': ('AFTER DELETE ON invoice_item',
+                        (_gst_summary_upsert('-', item='old'),)),
+    'invoice_item_au': ('AFTER UPDATE OF invoice_id, hsn, gst_percent, quantity, rate, discount_percent '
+                        'ON invoice_item',
+                        (_gst_summary_upsert('-', item='old'), _gst_summary_upsert(item='new'))),
+    'invoice_au': ('AFTER UPDATE OF date, customer_id ON invoice',
+                   (_gst_summary_upsert('-', invoice='old'), _gst_summary_upsert(invoice='new'))),
+    'invoice_bd': ('BEFORE DELETE ON invoice',
+                   (_gst_summary_upsert('-', invoice='old'),)),
+    'customer_au': ("AFTER UPDATE OF gstin ON customer "
+                    "WHEN (coalesce(old.gstin, '') != '') != (coalesce(new.gstin, '') != '')",
+                    (_gst_summary_upsert('-', customer='old'), _gst_summary_upsert(customer='new'))),
+}
+
+def create_gst_summary_table(conn):
+    """Create the GST summary table and its sync triggers if missing; it starts empty."""
+    conn.execute(text('CREATE TABLE IF NOT EXISTS gst_summary ('
+                      'month DATE NOT NULL, hsn VARCHAR(20) NOT NULL, gst_percent FLOAT NOT NULL, '
+                      'b2b BOOLEAN NOT NULL, item_count INTEGER NOT NULL, quantity FLOAT NOT NULL, '
+                      'taxable_value FLOAT NOT NULL, cgst FLOAT NOT NULL, sgst FLOAT NOT NULL, '
+                      'PRIMARY KEY (month, hsn, gst_percent, b2b)) WITHOUT ROWID'))
+    create_gst_summary_triggers(conn)
+
+def create_gst_summary_triggers(conn):
+    for name, (event, statements) in GST_SUMMARY_TRIGGERS.items():
+        conn.execute(text(f'CREATE TRIGGER IF NOT EXISTS gst_summary_{name} {event} '
+                          f'BEGIN {" ".join(statements)} END'))
+
+def drop_gst_summary_triggers(conn):
+    for name in GST_SUMMARY_TRIGGERS:
+        conn.execute(text(f'DROP TRIGGER IF EXISTS gst_summary_{name}'))
+
+def fill_gst_summary(conn, since=None):
+    """Replace the contents of the GST summary with totals recomputed from the invoice items.
+
+    With ``since`` (the first day of a month) earlier, archived months are kept.
+    """
+    where, params = ('WHERE month >= :since', {'since': since.isoformat()}) if since else ('', {})
+    conn.execute(text(f'DELETE FROM gst_summary {where}'), params)
+    conn.execute(text(f'INSERT INTO gst_summary ({", ".join(GST_SUMMARY_KEY + GST_SUMMARY_COLUMNS)}) '
+                      f'SELECT * FROM ({GST_SUMMARY_SELECT}) {where}'), params)
+
+@migration(9, 'Monthly HSN-wise GST summary')
+def add_gst_summary(conn):
+    create_gst_summary_table(conn)
+    fill_gst_summary(conn)
+
+# Settled financial years are moved out to one archive file each (see
+# archive_financial_year in app.py). archived_year records them; ledger_opening
+# carries every customer's archived totals forward, as of the first day kept.
+@migration(10, 'Financial-year archive registry and carried-forward balances')
+def add_financial_year_archives(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS archived_year ('
+                      'financial_year INTEGER NOT NULL, filename VARCHAR(200) NOT NULL, '
+                      'start DATE NOT NULL, "end" DATE NOT NULL, invoice_count INTEGER NOT NULL, '
+                      'item_count INTEGER NOT NULL, transaction_count INTEGER NOT NULL, '
+                      'first_invoice_id INTEGER, last_invoice_id INTEGER, archived_at DATETIME NOT NULL, '
+                      'PRIMARY KEY (financial_year))'))
+    conn.execute(text('CREATE TABLE IF NOT EXISTS ledger_opening ('
+                      'customer_id INTEGER NOT NULL REFERENCES customer (id), as_of DATE NOT NULL, '
+                      'invoiced FLOAT NOT NULL, credited FLOAT NOT NULL, paid FLOAT NOT NULL, '
+                      'PRIMARY KEY (customer_id))'))
+
+@migration(11, 'Customer of each sync tombstone, for transaction deletions')
+def add_sync_tombstone_customer(conn):
+    existing = {c['name'] for c in inspect(conn).get_columns('sync_tombstone')}
+    if 'customer_id' not in existing:
+        conn.execute(text('ALTER TABLE sync_tombstone ADD COLUMN customer_id INTEGER'))
@@ -0,0 +1,168 @@
+"""Opt-in per-request profiling.
+
+With ``PROFILING`` on, a sampled share of requests (``PROFILING_SAMPLE_RATE``)
+records the SQL statement count and database time, template render time and
+total handler time. Each sampled response carries them in a ``Server-Timing``
+header (visible in the browser's network panel) and one JSON line goes to the
+``cms.profile`` logger. Statements slower than ``SLOW_QUERY_MS`` in a sampled
+request are written to the ``cms.slow_query`` logger with the URL rule instead
+of the URL and with literal values stripped, so neither log holds customer data.
+
+Requests that are not sampled only pay for a dictionary lookup per statement.
+"""
+import json
+import logging
+import os
+import random
+import re
+import time
+from logging.handlers import RotatingFileHandler
+
+from flask import g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+
+request_log = logging.getLogger('cms.profile')
+slow_query_log = logging.getLogger('cms.slow_query')
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def redact_sql(statement):
+    """Collapse whitespace and replace inline string and number literals with ``?``."""
+    return LITERALS.sub('?', ' '.join(statement.split()))
+
+
+def current_profile():
+    """The profile of the request being handled, if it was sampled."""
+    return g.get('_profile') if has_request_context() else None
+
+
+class RequestProfile:
+    """Timings collected for one request; times are in seconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.templates = 0
+        self.template_time = 0.0
+        self.slow_queries = 0
+
+    def server_timing(self, total):
+        handler = max(0.0, total - self.db_time - self.template_time)
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.2f};desc="{self.templates} templates"',
+            f'app;dur={handler * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ))
+
+
+class ProfiledTemplate(Template):
+    """Jinja template that adds its render time, less SQL run while rendering, to the profile."""
+
+    def render(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().render(*args, **kwargs)
+        db_time = profile.db_time
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            profile.template_time += elapsed - (profile.db_time - db_time)
+            profile.templates += 1
+
+
+class RequestProfiler:
+    """Hooks the app's request cycle, engine and Jinja environment; see the module docstring."""
+
+    def __init__(self, app=None, engine=None):
+        if app is not None:
+            self.init_app(app, engine)
+
+    def init_app(self, app, engine):
+        self.app = app
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.jinja_env.template_class = ProfiledTemplate
+        self.instrument(engine)
+        if app.config['PROFILING']:
+            self._configure_logs(app.config['SLOW_QUERY_LOG'])
+
+    def instrument(self, engine):
+        """Time statements run on ``engine`` too, e.g. a read-only reporting engine."""
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._failed_execute)
+
+    @staticmethod
+    def _configure_logs(path):
+        # Leave loggers alone when the deployment already routes them
+        if not request_log.handlers:
+            request_log.addHandler(logging.StreamHandler())
+            request_log.setLevel(logging.INFO)
+        if not slow_query_log.handlers:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=5)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_log.addHandler(handler)
+            slow_query_log.setLevel(logging.INFO)
+
+    def _start(self):
+        config = self.app.config
+        if config['PROFILING'] and random.random() < config['PROFILING_SAMPLE_RATE']:
+            g._profile = RequestProfile()
+
+    def _finish(self, response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        total = time.perf_counter() - profile.started
+        response.headers['Server-Timing'] = profile.server_timing(total)
+        request_log.info(json.dumps({
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(profile.db_time * 1000, 2),
+            'queries': profile.queries,
+            'template_ms': round(profile.template_time * 1000, 2),
+            'templates': profile.templates,
+            'slow_queries': profile.slow_queries,
+        }))
+        return response
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_profile() is not None:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _failed_execute(context):
+        started = context.connection.info.get('profile_started') if context.connection else None
+        if started:
+            started.pop()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile()
+        started = conn.info.get('profile_started')
+        if profile is None or not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        profile.queries += 1
+        profile.db_time += elapsed
+        if elapsed * 1000 >= self.app.config['SLOW_QUERY_MS']:
+            profile.slow_queries += 1
+            slow_query_log.warning(json.dumps({
+                'route': request.url_rule.rule if request.url_rule else None,
+                'method': request.method,
+                'ms': round(elapsed * 1000, 2),
+                'statement': redact_sql(statement),
+                # Values are never logged, only how many were bound
+                'parameters': len(parameters) if parameters is not None else 0,
+                'executemany': executemany,
+            }))
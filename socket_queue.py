@@ -0,0 +1,76 @@
+"""SQLite-backed Socket.IO message queue.
+
+Lets several workers on one host fan Socket.IO events out to each other without
+running Redis: every worker appends emits to a shared SQLite file and tails it
+from a background task. Point ``SOCKETIO_MESSAGE_QUEUE`` at ``sqlite:///path``
+to use it; ``redis://`` and other Kombu URLs go to python-socketio's own managers.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import socketio
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS socketio_message ('
+          'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+          'payload TEXT NOT NULL, created_at REAL NOT NULL)')
+
+
+def path_from_url(url):
+    """Return the file path of a ``sqlite:///relative`` or ``sqlite:////absolute`` URL."""
+    if not url.startswith('sqlite:///'):
+        raise ValueError(f'Not a SQLite message queue URL: {url}')
+    return url[len('sqlite:///'):]
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """Socket.IO client manager that publishes through a shared SQLite file.
+
+    Messages older than ``retention`` seconds are pruned by publishers, so the
+    file stays small; a worker that stalls longer than that misses the events.
+    """
+    name = 'sqlite'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=0.05, retention=60):
+        self.path = path_from_url(url)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(SCHEMA)
+        # Only messages published after this manager was created are delivered
+        self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_message').fetchone()[0]
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA busy_timeout = 5000')
+            self._local.conn = conn
+        return conn
+
+    def _publish(self, data):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('INSERT INTO socketio_message (channel, payload, created_at) VALUES (?, ?, ?)',
+                     (self.channel, json.dumps(data), now))
+        conn.execute('DELETE FROM socketio_message WHERE created_at < ?', (now - self.retention,))
+
+    def _listen(self):
+        conn = self._connect()
+        last_id = self._last_id
+        while True:
+            rows = conn.execute('SELECT id, payload FROM socketio_message WHERE id > ? AND channel = ? '
+                                'ORDER BY id', (last_id, self.channel)).fetchall()
+            for last_id, payload in rows:
+                yield json.loads(payload)
+            if not rows:
+                time.sleep(self.poll_interval)
@@ -3,9 +3,47 @@
 // Initialize Socket.IO
 const socket = io();
 
+// Delta sync streams, keyed by name. Each remembers the cursor of the last
+// change it applied so reconnects only fetch what changed in between.
+const syncStreams = {};
+
+function requestSync(name) {
+    const stream = syncStreams[name];
+    socket.emit(stream.event, Object.assign({}, stream.params, { cursor: stream.cursor }));
+}
+
+function applySyncReply(name, data, applyRows) {
+    const stream = syncStreams[name];
+    if (!stream) return;
+    if (!data.unchanged) {
+        applyRows(data);
+    }
+    stream.cursor = data.cursor;
+    if (data.has_more) {
+        requestSync(name);
+    }
+}
+
+// Join the rooms for this page's views, and for the customer on view_customer
+// pages, so the server only pushes updates this page displays. A page names
+// its views with data-sync-stream (synced tables) or data-live-view (tables
+// that only take pushes).
+function subscribe() {
+    // Streams scoped to one customer ride on that customer's room instead
+    const views = new Set(Object.keys(syncStreams).filter(name => !syncStreams[name].params.customer_id));
+    document.querySelectorAll('[data-live-view]').forEach(element => views.add(element.dataset.liveView));
+    const params = { views: Array.from(views) };
+    if (window.location.pathname.includes('view_customer')) {
+        params.customer_id = window.location.pathname.split('/').pop();
+    }
+    socket.emit('subscribe', params);
+}
+
 // Socket.IO event handlers
 socket.on('connect', () => {
     console.log('Connected to server');
+    subscribe();
+    Object.keys(syncStreams).forEach(requestSync);
 });
 
 socket.on('connection_response', (data) => {
@@ -29,77 +67,134 @@ socket.on('transaction_added', (transaction) => {
     showNotification('New transaction added', 'success');
 });
 
+// Background jobs report to every page of the user who queued them
+socket.on('job_updated', (job) => {
+    if (job.status === 'done') {
+        showNotification(`Job #${job.id} finished. <a href="/jobs">Open jobs</a>`, 'success');
+    } else if (job.status === 'failed') {
+        showNotification(`Job #${job.id} failed. <a href="/jobs">Open jobs</a>`, 'danger');
+    }
+});
+
 socket.on('customers_data', (data) => {
-    console.log('Received customers data:', data);
-    updateCustomersTable(data.customers);
+    applySyncReply('customers', data, (data) => {
+        updateCustomersTable(data.customers, data.reset, data.deleted);
+    });
 });
 
 socket.on('transactions_data', (data) => {
-    console.log('Received transactions data:', data);
-    updateTransactionsTable(data.transactions);
+    applySyncReply('transactions', data, (data) => {
+        updateTransactionsTable(data.transactions, data.reset, true, data.deleted);
+    });
 });
 
-// Update customers table with new data
-function updateCustomersTable(customers) {
+// Upsert customers into the customers table; rows are keyed by customer id
+function updateCustomersTable(customers, reset = false, deleted = []) {
+    if (!$.fn.DataTable.isDataTable('#customersTable')) return;
     const table = $('#customersTable').DataTable();
-    if (Array.isArray(customers)) {
+    if (reset) {
         table.clear();
-        customers.forEach(customer => {
-            table.row.add([
-                customer.name,
-                customer.email,
-                customer.phone,
-                customer.gstin || '-',
-                formatCurrency(customer.credit_limit),
-                formatCurrency(customer.outstanding_balance),
-                createActionButtons(customer.id)
-            ]);
-        });
-    } else {
-        // Single customer update
-        const row = table.row((idx, data) => data[0] === customers.name);
+    }
+    deleted.forEach(id => table.row('#customer-' + id).remove());
+    (Array.isArray(customers) ? customers : [customers]).forEach(customer => {
+        const data = [
+            customer.name,
+            customer.email,
+            customer.phone,
+            customer.gstin || '-',
+            formatCurrency(customer.credit_limit),
+            formatCurrency(customer.outstanding_balance),
+            createActionButtons(customer.id)
+        ];
+        const row = table.row('#customer-' + customer.id);
         if (row.length) {
-            row.data([
-                customers.name,
-                customers.email,
-                customers.phone,
-                customers.gstin || '-',
-                formatCurrency(customers.credit_limit),
-                formatCurrency(customers.outstanding_balance),
-                createActionButtons(customers.id)
-            ]);
+            row.data(data);
+        } else {
+            table.row.add(data).node().id = 'customer-' + customer.id;
         }
-    }
-    table.draw();
+    });
+    table.draw(false);
 }
 
-// Update transactions table with new data
-function updateTransactionsTable(transactions) {
-    const table = $('#transactionsTable').DataTable();
-    if (Array.isArray(transactions)) {
-        table.clear();
+// Cells for the columns a transactions table lists in data-transaction-columns
+const transactionCells = {
+    date: t => escapeHtml(t.date),
+    customer: t => escapeHtml(t.customer_name || '-'),
+    type: t => t.type === 'credit' ? '<span class="badge bg-danger">Credit</span>' :
+        t.type === 'payment' ? '<span class="badge bg-success">Payment</span>' :
+        `<span class="badge bg-secondary">${escapeHtml(t.type.charAt(0).toUpperCase() + t.type.slice(1))}</span>`,
+    amount: t => formatCurrency(t.amount),
+    mode: t => escapeHtml(t.payment_mode || '-'),
+    description: t => escapeHtml(t.description),
+    status: t => t.type === 'payment' ?
+        '<span class="badge bg-success">Completed</span>' :
+        '<span class="badge bg-warning text-dark">Pending</span>',
+    actions: t => `
+        <a href="/view_customer/${t.customer_id}" class="btn btn-info btn-sm" title="View Customer">
+            <i class="fas fa-eye"></i>
+        </a>
+    `
+};
+
+// Upsert transactions into the page's transactions tables, newest first; rows
+// are keyed by transaction id. Pushes go to every such table, sync replies
+// (``synced``) only to the tables of the transactions stream, and rows in
+// ``deleted`` are removed.
+function updateTransactionsTable(transactions, reset = false, synced = false, deleted = []) {
+    const selector = synced ? 'table[data-sync-stream="transactions"]' : 'table[data-transaction-columns]';
+    transactions = Array.isArray(transactions) ? transactions : [transactions];
+    document.querySelectorAll(selector).forEach(element => {
+        const columns = (element.dataset.transactionColumns || 'date,type,amount,description').split(',');
+        const cells = transaction => columns.map(column => transactionCells[column](transaction));
+        if ($.fn.DataTable.isDataTable(element)) {
+            const table = $(element).DataTable();
+            if (reset) {
+                table.clear();
+            }
+            deleted.forEach(id => table.row('#transaction-' + id).remove());
+            transactions.forEach(transaction => {
+                const row = table.row('#transaction-' + transaction.id);
+                if (row.length) {
+                    row.data(cells(transaction));
+                } else {
+                    table.row.add(cells(transaction)).node().id = 'transaction-' + transaction.id;
+                }
+            });
+            table.draw(false);
+            return;
+        }
+        const body = element.tBodies[0];
+        if (reset) {
+            body.innerHTML = '';
+        }
+        deleted.forEach(id => {
+            const row = document.getElementById('transaction-' + id);
+            if (row && body.contains(row)) {
+                row.remove();
+            }
+        });
         transactions.forEach(transaction => {
-            table.row.add([
-                transaction.date,
-                transaction.type === 'credit' ? 
-                    '<span class="badge bg-danger">Credit</span>' : 
-                    '<span class="badge bg-success">Payment</span>',
-                formatCurrency(transaction.amount),
-                transaction.description
-            ]);
+            const html = cells(transaction).map(cell => `<td>${cell}</td>`).join('');
+            let row = document.getElementById('transaction-' + transaction.id);
+            if (row && body.contains(row)) {
+                row.innerHTML = html;
+            } else {
+                row = body.insertRow(0);
+                row.id = 'transaction-' + transaction.id;
+                row.innerHTML = html;
+            }
         });
-    } else {
-        // Single transaction update
-        table.row.add([
-            transaction.date,
-            transaction.type === 'credit' ? 
-                '<span class="badge bg-danger">Credit</span>' : 
-                '<span class="badge bg-success">Payment</span>',
-            formatCurrency(transaction.amount),
-            transaction.description
-        ]);
-    }
-    table.draw();
+        const limit = parseInt(element.dataset.rowLimit, 10);
+        while (limit && body.rows.length > limit) {
+            body.deleteRow(-1);
+        }
+    });
+}
+
+function escapeHtml(value) {
+    const span = document.createElement('span');
+    span.textContent = value == null ? '' : String(value);
+    return span.innerHTML;
 }
 
 // Create action buttons for customer table
@@ -275,6 +370,86 @@ function initPopovers() {
     });
 }
 
+// Typeahead pickers. <input data-typeahead="/search/customers" data-target="#customer_id">
+// asks the search API for matches as the user types and stores the chosen
+// row's id in the target (hidden) input. Until a match is chosen the text input
+// reports itself invalid, so the form cannot be submitted with free text.
+function typeaheadLabel(row) {
+    if (row.hsn !== undefined) {
+        return `${row.name} (HSN ${row.hsn}, GST ${row.gst_percent}%)`;
+    }
+    return `${row.name} (${row.email}) - Balance ${formatCurrency(row.outstanding_balance)}`;
+}
+
+function initTypeahead(input, options = {}) {
+    const $input = $(input);
+    const $target = options.target ? $(options.target) : $($input.data('target'));
+    const $menu = $('<div class="list-group position-absolute w-100 shadow-sm" style="z-index: 1050"></div>').hide();
+    $input.parent().addClass('position-relative').append($menu);
+    let timer = null;
+    let latest = 0;
+    let rows = [];
+    let active = -1;
+
+    const unchosen = 'Select a match from the list';
+    input.setCustomValidity($target.val() || !$input.val() ? '' : unchosen);
+
+    function choose(row) {
+        $input.val(row.name);
+        input.setCustomValidity('');
+        $menu.hide();
+        $input.trigger('typeahead:select', [row]);
+        $target.val(row.id).trigger('change');
+    }
+
+    function highlight(index) {
+        active = index;
+        $menu.children().removeClass('active').eq(index).addClass('active');
+    }
+
+    $input.on('input', function() {
+        $target.val('').trigger('change');
+        input.setCustomValidity($input.val() ? unchosen : '');
+        clearTimeout(timer);
+        const q = $input.val().trim();
+        if (!q) {
+            $menu.hide();
+            return;
+        }
+        timer = setTimeout(() => {
+            const request = ++latest;
+            $.getJSON($input.data('typeahead'), { q: q, limit: 10 }, function(results) {
+                if (request !== latest) return;  // a newer query is on its way
+                rows = results;
+                $menu.empty();
+                rows.forEach(row => {
+                    $('<button type="button" class="list-group-item list-group-item-action"></button>')
+                        .text(typeaheadLabel(row))
+                        .on('mousedown', e => { e.preventDefault(); choose(row); })
+                        .appendTo($menu);
+                });
+                $menu.toggle(rows.length > 0);
+                highlight(rows.length ? 0 : -1);
+            });
+        }, 150);
+    });
+
+    $input.on('keydown', function(e) {
+        if (!$menu.is(':visible') || !rows.length) return;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            highlight((active + (e.key === 'ArrowDown' ? 1 : rows.length - 1)) % rows.length);
+        } else if (e.key === 'Enter' && active >= 0) {
+            e.preventDefault();
+            choose(rows[active]);
+        } else if (e.key === 'Escape') {
+            $menu.hide();
+        }
+    });
+
+    $input.on('blur', () => $menu.hide());
+}
+
 // Document ready handler
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize tooltips and popovers
@@ -304,6 +479,8 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    document.querySelectorAll('[data-typeahead][data-target]').forEach(input => initTypeahead(input));
+
     // Auto-dismiss alerts
     const alerts = document.querySelectorAll('.alert:not(.alert-permanent)');
     alerts.forEach(alert => {
@@ -313,10 +490,20 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 5000);
     });
 
-    // Request initial data
-    socket.emit('get_customers');
-    if (window.location.pathname.includes('view_customer')) {
-        const customerId = window.location.pathname.split('/').pop();
-        socket.emit('get_transactions', { customer_id: customerId });
+    // Register delta sync streams for server-rendered tables. The page's cursor
+    // marks the data it was rendered with, so the first sync is usually "unchanged".
+    document.querySelectorAll('[data-sync-stream]').forEach(element => {
+        const name = element.dataset.syncStream;
+        syncStreams[name] = {
+            event: 'get_' + name,
+            params: element.dataset.syncCustomer ? { customer_id: element.dataset.syncCustomer } : {},
+            cursor: element.dataset.syncCursor || null
+        };
+        if (socket.connected) {
+            requestSync(name);
+        }
+    });
+    if (socket.connected) {
+        subscribe();
     }
 }); 
\ No newline at end of file
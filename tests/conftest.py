@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+# Select the in-memory testing profile before app.py builds its engine, so the
+# suite never touches database/cms.db.
+os.environ['FLASK_CONFIG'] = 'testing'
+
+
+@pytest.fixture
+def query_counter():
+    """A QueryCounter to use as ``with query_counter: ...``; see tests/query_budget.py."""
+    from query_budget import QueryCounter
+    return QueryCounter()
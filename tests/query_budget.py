@@ -0,0 +1,61 @@
+"""Count the SQL statements the app sends to the database.
+
+    with assert_max_queries(3):
+        client.get('/customers')
+
+``assert_max_queries`` also works as a test decorator, and the ``query_counter``
+fixture in conftest.py hands pytest-style tests a ready ``QueryCounter``.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import app, db, read_engines
+
+
+class QueryCounter:
+    """Record every statement executed on the app's engines while active.
+
+    By default that is the primary engine plus the read-only engines views
+    route their reads to with ``reads_from``.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.engines = []
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        if self.engine is None:
+            with app.app_context():
+                self.engines = [db.engine, *read_engines.values()]
+        else:
+            self.engines = [self.engine]
+        self.statements.clear()
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._record)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def report(self):
+        return '\n'.join(f'{n}. {" ".join(statement.split())}'
+                         for n, statement in enumerate(self.statements, start=1))
+
+
+@contextmanager
+def assert_max_queries(budget, label='block'):
+    """Fail if the wrapped block runs more than ``budget`` statements, listing them."""
+    with QueryCounter() as counter:
+        yield counter
+    if len(counter) > budget:
+        raise AssertionError(f'{label} ran {len(counter)} SQL statements, budget is {budget}:\n'
+                             f'{counter.report()}')
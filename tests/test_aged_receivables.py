@@ -0,0 +1,99 @@
+import csv
+import io
+import unittest
+from datetime import datetime, timedelta
+
+from app import app, db, User, Customer, Invoice, Transaction, rebuild_customer_balances
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+AS_OF = datetime(2024, 6, 30)
+
+class TestAgedReceivables(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(username='staff', password='x', role='staff')
+        self.dealer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street')
+        self.retail = Customer(name='Retail', email='retail@example.com', phone='2', address='Road')
+        self.settled = Customer(name='Settled', email='settled@example.com', phone='3', address='Lane')
+        db.session.add_all([self.user, self.dealer, self.retail, self.settled])
+        db.session.commit()
+
+        self.invoice(self.dealer, 1000, days_ago=100)
+        self.transaction(self.dealer, 'credit', 200, days_ago=40)
+        self.invoice(self.dealer, 500, days_ago=10)
+        self.transaction(self.dealer, 'payment', 900, days_ago=5)
+        self.invoice(self.retail, 300, days_ago=200)
+        self.invoice(self.settled, 100, days_ago=20)
+        self.transaction(self.settled, 'payment', 100, days_ago=1)
+        # After the as-of date: must not count
+        self.invoice(self.retail, 50, days_ago=-3)
+        self.transaction(self.dealer, 'payment', 800, days_ago=-2)
+        rebuild_customer_balances()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = self.user.id
+            sess['user_role'] = 'staff'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def invoice(self, customer, amount, days_ago):
+        number = Invoice.query.count() + 1
+        db.session.add(Invoice(invoice_number=number, customer_id=customer.id, payment_mode='Credit',
+                               total_amount=amount, created_by=self.user.id,
+                               date=AS_OF + timedelta(hours=12) - timedelta(days=days_ago)))
+        db.session.commit()
+
+    def transaction(self, customer, type, amount, days_ago):
+        db.session.add(Transaction(customer_id=customer.id, type=type, amount=amount, description=type,
+                                   date=AS_OF + timedelta(hours=12) - timedelta(days=days_ago)))
+        db.session.commit()
+
+    def export(self, query=''):
+        response = self.app.get(f'/export/aged_receivables?as_of=2024-06-30{query}')
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+    def test_payments_settle_the_oldest_debits_first(self):
+        header, *rows = self.export()
+        self.assertEqual(header[3:], ['Outstanding', '0-30 Days', '31-60 Days', '61-90 Days',
+                                      '91-120 Days', '120+ Days'])
+        by_name = {row[0]: [float(value) for value in row[3:]] for row in rows}
+        # 1700 owed less 900 paid: the 500 and 200 are open, 100 of the oldest invoice is left
+        self.assertEqual(by_name['Dealer'], [800, 500, 200, 0, 100, 0])
+        self.assertEqual(by_name['Retail'], [300, 0, 0, 0, 0, 300])
+        self.assertNotIn('Settled', by_name)
+
+    def test_as_of_leaves_out_later_entries(self):
+        self.assertEqual([row[0] for row in self.export('&sort=name&order=asc')[1:]], ['Dealer', 'Retail'])
+        body = self.app.get('/aged_receivables').get_data(as_text=True)
+        # By today the dealer's later payment has cleared everything and Retail owes 50 more
+        self.assertNotIn('>Dealer<', body)
+        self.assertIn('₹350.00', body)
+
+    def test_sorts_and_pages_in_sql(self):
+        response = self.app.get('/aged_receivables?as_of=2024-06-30&sort=days_120_plus&page_size=1')
+        body = response.get_data(as_text=True)
+        self.assertIn('>Retail<', body)
+        self.assertIn('Showing 1 of 2 customers', body)
+        self.assertIn('page=2', body)
+        body = self.app.get('/aged_receivables?as_of=2024-06-30&sort=days_120_plus&page_size=1&page=2') \
+            .get_data(as_text=True)
+        self.assertIn('>Dealer<', body)
+        self.assertNotIn('page=3', body)
+        self.assertEqual(self.app.get('/aged_receivables?sort=email').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import date, datetime
+
+from app import (app, db, socketio, User, Customer, Product, Invoice, InvoiceItem, Transaction, ArchivedYear, LedgerOpening,
+                 catalog_cache, dashboard_stats, invoice_render_cache, archive_financial_year, financial_year,
+                 ledger_totals, rebuild_customer_balances, rebuild_gst_summary, rebuild_ledger_rollups,
+                 view_invoice, print_receipt, print_invoice_a4)
+from query_budget import QueryCounter
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestFinancialYearArchive(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.saved_config = {key: app.config[key] for key in ('ARCHIVE_DIR', 'ARCHIVE_KEEP_YEARS')}
+        self.directory = tempfile.mkdtemp()
+        app.config.update(ARCHIVE_DIR=self.directory, ARCHIVE_KEEP_YEARS=1)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+        dashboard_stats.invalidate()
+        invoice_render_cache.clear()
+
+        admin = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street',
+                            credit_limit=100000)
+        product = Product(name='Cotton Towel', price=100, hsn='6302', gst_percent=12)
+        db.session.add_all([admin, customer, product])
+        db.session.commit()
+        self.customer_id = customer.id
+
+        # Financial year 2023-24, then a later one that stays
+        old = Invoice(invoice_number=7, customer_id=customer.id, date=datetime(2023, 6, 1, 10),
+                      total_amount=500, payment_mode='Credit', created_by=admin.id)
+        db.session.add_all([
+            old,
+            Transaction(customer_id=customer.id, type='payment', amount=300, description='Cheque',
+                        date=datetime(2024, 3, 31, 18)),
+            Transaction(customer_id=customer.id, type='credit', amount=40, description='Freight',
+                        date=datetime(2024, 1, 5, 9)),
+            Invoice(invoice_number=8, customer_id=customer.id, date=datetime(2025, 5, 1, 10),
+                    total_amount=200, payment_mode='Credit', created_by=admin.id),
+            Transaction(customer_id=customer.id, type='payment', amount=100, description='Cash',
+                        date=datetime(2025, 5, 2, 10)),
+        ])
+        db.session.flush()
+        db.session.add(InvoiceItem(invoice_id=old.id, product_id=product.id, quantity=4, rate=100, hsn='6302',
+                                   gst_percent=12, amount=448))
+        db.session.commit()
+        self.old_invoice_id = old.id
+        rebuild_customer_balances()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+        app.config.update(self.saved_config)
+
+    def test_archiving_moves_the_year_out_and_carries_its_totals(self):
+        archived = archive_financial_year(2023)
+        self.assertEqual((archived.invoice_count, archived.item_count, archived.transaction_count), (1, 1, 2))
+        self.assertEqual(archived.end, date(2024, 4, 1))
+        self.assertEqual([invoice.invoice_number for invoice in Invoice.query], [8])
+        self.assertEqual(InvoiceItem.query.count(), 0)
+        self.assertEqual(Transaction.query.count(), 1)
+
+        archive = sqlite3.connect(os.path.join(self.directory, 'cms-fy2023.db'))
+        try:
+            self.assertEqual(archive.execute('SELECT invoice_number FROM invoice').fetchall(), [(7,)])
+            self.assertEqual(archive.execute('SELECT product_name FROM invoice_item').fetchall(),
+                             [('Cotton Towel',)])
+            self.assertEqual(archive.execute('SELECT COUNT(*) FROM "transaction"').fetchone(), (2,))
+        finally:
+            archive.close()
+
+        opening = db.session.get(LedgerOpening, self.customer_id)
+        self.assertEqual((opening.as_of, opening.invoiced, opening.credited, opening.paid),
+                         (date(2024, 4, 1), 500, 40, 300))
+        self.assertAlmostEqual(db.session.get(Customer, self.customer_id).outstanding_balance, 340)
+        # The rollups still cover the archived days, and rebuilding leaves them alone
+        self.assertEqual(ledger_totals(end=datetime(2024, 4, 1)).invoiced, 500)
+        self.assertEqual(rebuild_customer_balances(fix=False), [])
+        self.assertEqual(rebuild_ledger_rollups(), [])
+        self.assertEqual(rebuild_gst_summary(), [])
+        self.assertEqual(ledger_totals(end=datetime(2024, 4, 1)).invoiced, 500)
+
+    def test_archived_invoice_still_opens_and_prints(self):
+        archive_financial_year(2023)
+        with QueryCounter() as counter:
+            body = self.app.get(f'/invoice/{self.old_invoice_id}').get_data(as_text=True)
+        self.assertLessEqual(len(counter), view_invoice.archived_query_budget, counter.report())
+        self.assertIn('Archived 2023-24', body)
+        self.assertIn('Cotton Towel', body)
+        self.assertNotIn('Delete', body)
+        for path, view in (('print_a4', print_invoice_a4), ('print_receipt', print_receipt)):
+            invoice_render_cache.clear()
+            with QueryCounter() as counter:
+                response = self.app.get(f'/invoice/{self.old_invoice_id}/{path}')
+            self.assertLessEqual(len(counter), view.archived_query_budget, counter.report())
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Cotton Towel', response.get_data(as_text=True))
+
+        response = self.app.get('/archives?year=2023&invoice_number=7')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith(f'/invoice/{self.old_invoice_id}'))
+        self.assertIn('is not in the 2023-24 archive',
+                      self.app.get('/archives?year=2023&invoice_number=99', follow_redirects=True)
+                      .get_data(as_text=True))
+        self.assertEqual(self.app.get('/invoice/9999').status_code, 404)
+
+    def test_new_invoice_reusing_an_archived_id_is_not_served_from_the_cache(self):
+        self.app.post('/delete_invoice/%d' % Invoice.query.filter_by(invoice_number=8).one().id)
+        self.assertIn('Cotton Towel', self.app.get(f'/invoice/{self.old_invoice_id}').get_data(as_text=True))
+        archive_financial_year(2023)
+
+        other = Customer(name='Retailer', email='retail@example.com', phone='2', address='Market')
+        db.session.add(other)
+        db.session.flush()
+        invoice = Invoice(invoice_number=9, customer_id=other.id, date=datetime(2025, 6, 1, 10),
+                          total_amount=120, payment_mode='Cash', created_by=1)
+        db.session.add(invoice)
+        db.session.commit()
+        self.assertEqual(invoice.id, self.old_invoice_id)
+
+        body = self.app.get(f'/invoice/{invoice.id}').get_data(as_text=True)
+        self.assertIn('Retailer', body)
+        self.assertNotIn('Cotton Towel', body)
+
+    def test_archived_transactions_leave_synced_tables(self):
+        archived_ids = sorted(t.id for t in Transaction.query.filter(Transaction.date < datetime(2024, 4, 1)))
+        socket = socketio.test_client(app, flask_test_client=self.app)
+        try:
+            socket.emit('get_transactions', {'customer_id': self.customer_id})
+            cursor = socket.get_received()[-1]['args'][0]['cursor']
+            archive_financial_year(2023)
+            socket.emit('get_transactions', {'customer_id': self.customer_id, 'cursor': cursor})
+            reply = socket.get_received()[-1]['args'][0]
+        finally:
+            socket.disconnect()
+        self.assertEqual(reply['transactions'], [])
+        self.assertEqual(sorted(reply['deleted']), archived_ids)
+
+    def test_statement_starts_from_the_carried_balance(self):
+        archive_financial_year(2023)
+        body = self.app.get(f'/customer/{self.customer_id}/statement').get_data(as_text=True)
+        self.assertIn('Entries before 01-04-2024 are archived', body)
+        self.assertIn('₹240.00', body)  # 500 + 40 - 300 brought forward
+        self.assertIn('₹340.00', body)
+        rows = self.app.get(f'/export/statement?customer_id={self.customer_id}').get_data(as_text=True).splitlines()
+        self.assertEqual(rows[1], '2024-04-01,opening,,Opening balance,,,240.0')
+
+    def test_only_settled_years_are_archived_oldest_first(self):
+        current = financial_year(datetime.utcnow())
+        with self.assertRaisesRegex(ValueError, 'not settled yet'):
+            archive_financial_year(current - 1)
+        with self.assertRaisesRegex(ValueError, 'Archive 2023-24 first'):
+            archive_financial_year(2024)
+        archive_financial_year(2023)
+        with self.assertRaisesRegex(ValueError, 'already archived'):
+            archive_financial_year(2023)
+        self.assertEqual(ArchivedYear.query.count(), 1)
+
+        # The archived period is closed for new entries
+        response = self.app.post('/add_payment', data={'customer_id': self.customer_id, 'amount': 10,
+                                                       'payment_mode': 'Cash', 'date': '2024-02-01'},
+                                 follow_redirects=True)
+        self.assertIn('2023-24 is archived', response.get_data(as_text=True))
+        self.assertEqual(Transaction.query.count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
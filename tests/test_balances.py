@@ -0,0 +1,96 @@
+import json
+import unittest
+from datetime import datetime
+from app import app, db, User, Customer, Invoice, Transaction, Product, rebuild_customer_balances, catalog_cache
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestCustomerBalances(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1',
+                            address='Street', credit_limit=100000)
+        product = Product(name='Cement', hsn='2523', gst_percent=18, price=100)
+        db.session.add_all([admin, customer, product])
+        db.session.commit()
+        self.customer_id = customer.id
+        self.product_id = product.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def customer(self):
+        db.session.expire_all()
+        return Customer.query.get(self.customer_id)
+
+    def create_invoice(self):
+        self.app.post('/create_invoice', data={
+            'customer_id': self.customer_id,
+            'date': '2024-04-01',
+            'payment_mode': 'Credit',
+            'items': json.dumps([{'product_id': self.product_id, 'quantity': 2, 'rate': 100}])
+        })
+        return Invoice.query.order_by(Invoice.id.desc()).first()
+
+    def test_writes_maintain_stored_balance(self):
+        invoice = self.create_invoice()
+        self.assertAlmostEqual(self.customer().invoiced_total, 236.0)
+
+        self.app.post('/add_transaction', data={
+            'customer_id': self.customer_id, 'type': 'credit', 'amount': 50,
+            'description': 'Opening', 'date': '2024-04-02T10:00'
+        })
+        self.app.post('/add_payment', data={
+            'customer_id': self.customer_id, 'amount': 100,
+            'payment_mode': 'Cash', 'date': '2024-04-03'
+        })
+        customer = self.customer()
+        self.assertAlmostEqual(customer.credited_total, 50.0)
+        self.assertAlmostEqual(customer.paid_total, 100.0)
+        self.assertAlmostEqual(customer.outstanding_balance, 186.0)
+
+        self.app.post(f'/delete_invoice/{invoice.id}')
+        self.assertAlmostEqual(self.customer().outstanding_balance, -50.0)
+        self.assertEqual(rebuild_customer_balances(fix=False), [])
+
+    def test_rebuild_detects_and_fixes_drift(self):
+        db.session.add(Transaction(customer_id=self.customer_id, type='payment', amount=40,
+                                   description='Imported', date=datetime(2024, 4, 1)))
+        db.session.commit()
+
+        drift = rebuild_customer_balances(fix=False)
+        self.assertEqual(drift, [(self.customer_id, 'paid_total', 0.0, 40.0)])
+        self.assertEqual(len(rebuild_customer_balances()), 1)
+        self.assertEqual(rebuild_customer_balances(fix=False), [])
+        self.assertAlmostEqual(self.customer().outstanding_balance, -40.0)
+
+    def test_credit_report_sorts_in_sql(self):
+        other = Customer(name='Retail', email='retail@example.com', phone='2',
+                         address='Road', invoiced_total=500)
+        db.session.add(other)
+        db.session.commit()
+        ordered = Customer.query.order_by(Customer.outstanding_balance.desc()).all()
+        self.assertEqual([c.name for c in ordered], ['Retail', 'Dealer'])
+        response = self.app.get('/credit_report')
+        self.assertEqual(response.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
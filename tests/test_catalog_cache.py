@@ -0,0 +1,61 @@
+import unittest
+from app import app, db, User, Product, catalog_cache, bump_cache_version
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestCatalogCache(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        db.session.add_all([admin, Product(name='Cement', hsn='2523', gst_percent=28, price=350)])
+        db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_unchanged_catalog_is_served_from_the_snapshot(self):
+        first = catalog_cache.get()
+        misses = catalog_cache.misses
+        self.assertIs(catalog_cache.get(), first)
+        self.assertEqual(catalog_cache.misses, misses)
+        self.assertEqual([p._asdict() for p in first.products],
+                         [{'id': 1, 'name': 'Cement', 'hsn': '2523', 'gst_percent': 28.0, 'price': 350.0}])
+
+    def test_product_writes_bump_the_version(self):
+        version = catalog_cache.get().version
+        self.app.post('/add_product', data={'name': 'Steel', 'hsn': '7214', 'gst_percent': 18, 'price': 60})
+        snapshot = catalog_cache.get()
+        self.assertEqual(snapshot.version, version + 1)
+        self.assertEqual([p.name for p in snapshot.products], ['Cement', 'Steel'])
+
+        self.app.post('/edit_product/2', data={'name': 'TMT Steel', 'hsn': '7214', 'gst_percent': 18, 'price': 65})
+        self.assertEqual(catalog_cache.get().by_id[2].name, 'TMT Steel')
+
+        self.app.post('/delete_product/2')
+        self.assertNotIn(2, catalog_cache.get().by_id)
+
+    def test_version_bumped_by_another_worker_is_picked_up(self):
+        catalog_cache.get()
+        db.session.add(Product(name='Sand', hsn='2505', gst_percent=5, price=40))
+        bump_cache_version('catalog')
+        db.session.commit()
+        self.assertIn('Sand', [p.name for p in catalog_cache.get().products])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import unittest
+from sqlalchemy import event
+from app import app, db, User, Customer, Product, Invoice, InvoiceItem, catalog_cache
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestCreateInvoice(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+
+        user = User(username='staff', password='x', role='staff')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street')
+        db.session.add_all([user, customer])
+        db.session.add_all(Product(name=f'P{i}', hsn=f'HSN{i}', gst_percent=18, price=100) for i in range(50))
+        db.session.commit()
+        self.customer_id = customer.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['user_role'] = 'staff'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post_invoice(self, items):
+        return self.app.post('/create_invoice', data={
+            'customer_id': self.customer_id,
+            'date': '2024-06-01',
+            'payment_mode': 'Credit',
+            'items': json.dumps(items)
+        })
+
+    def test_statement_count_does_not_grow_with_line_count(self):
+        catalog_cache.get()  # warm the catalog so both posts only revalidate it
+        counts = []
+        for lines in (1, 50):
+            statements = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                response = self.post_invoice([{'product_id': i + 1, 'quantity': 1, 'rate': 100}
+                                              for i in range(lines)])
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            self.assertEqual(response.status_code, 302)
+            counts.append(len(statements))
+        self.assertEqual(counts[0], counts[1])
+
+        invoice = Invoice.query.order_by(Invoice.id.desc()).first()
+        items = InvoiceItem.query.filter_by(invoice_id=invoice.id).order_by(InvoiceItem.id).all()
+        self.assertEqual(len(items), 50)
+        self.assertEqual((items[0].hsn, items[0].gst_percent, items[0].amount), ('HSN0', 18, 118))
+        self.assertAlmostEqual(invoice.total_amount, 50 * 118)
+
+    def test_unknown_products_are_rejected_before_writing(self):
+        response = self.post_invoice([{'product_id': 1, 'quantity': 1, 'rate': 100},
+                                      {'product_id': 999, 'quantity': 1, 'rate': 100}])
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith('/create_invoice'))
+        self.assertEqual(Invoice.query.count(), 0)
+        self.assertEqual(InvoiceItem.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
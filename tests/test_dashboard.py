@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+from datetime import datetime
+from app import app, db, User, Customer, dashboard_stats
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestDashboardStats(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        dashboard_stats.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1',
+                            address='Street', credit_limit=100000)
+        db.session.add_all([admin, customer])
+        db.session.commit()
+        self.customer_id = customer.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_repeat_visits_hit_the_snapshot(self):
+        before = dashboard_stats.stats()
+        self.assertEqual(self.app.get('/').status_code, 200)
+        self.assertEqual(self.app.get('/').status_code, 200)
+        after = self.app.get('/cache_stats').get_json()['dashboard']
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_writes_patch_the_snapshot(self):
+        dashboard_stats.get()
+        now = datetime.utcnow()
+        self.app.post('/add_transaction', data={
+            'customer_id': self.customer_id, 'type': 'credit', 'amount': 300,
+            'description': 'Goods', 'date': now.strftime('%Y-%m-%dT%H:%M')
+        })
+        self.app.post('/add_payment', data={
+            'customer_id': self.customer_id, 'amount': 120,
+            'payment_mode': 'Cash', 'date': now.strftime('%Y-%m-%d')
+        })
+        misses = dashboard_stats.misses
+        snapshot = dashboard_stats.get()
+        self.assertEqual(dashboard_stats.misses, misses)
+        self.assertAlmostEqual(snapshot['total_credit'], 180.0)
+        self.assertAlmostEqual(snapshot['pending_payments'], 300.0)
+        self.assertAlmostEqual(snapshot['today_payments'], 120.0)
+        self.assertEqual([t.type for t in snapshot['recent_transactions']], ['credit', 'payment'])
+        self.assertEqual(snapshot['recent_transactions'][0].customer_name, 'Dealer')
+
+        # The patched snapshot must agree with a fresh load from the database.
+        dashboard_stats.invalidate()
+        fresh = dashboard_stats.get()
+        for key in ('total_customers', 'total_credit', 'today_payments', 'pending_payments'):
+            self.assertAlmostEqual(fresh[key], snapshot[key])
+
+    def test_reload_overtaken_by_a_write_is_not_kept(self):
+        load = dashboard_stats._load
+
+        def load_then_write():
+            snapshot = load()
+            # A payment commits and patches while the reload is still in flight
+            self.app.post('/add_payment', data={
+                'customer_id': self.customer_id, 'amount': 75,
+                'payment_mode': 'Cash', 'date': datetime.utcnow().strftime('%Y-%m-%d')
+            })
+            return snapshot
+
+        with mock.patch.object(dashboard_stats, '_load', side_effect=load_then_write):
+            self.assertAlmostEqual(dashboard_stats.get()['today_payments'], 0.0)
+        snapshot = dashboard_stats.get()
+        self.assertAlmostEqual(snapshot['today_payments'], 75.0)
+        self.assertEqual([t.amount for t in snapshot['recent_transactions']], [75.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
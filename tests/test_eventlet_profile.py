@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import eventlet
+from flask import Flask
+from sqlalchemy import create_engine, event, text
+
+from app import app, configure_database, apply_sqlite_pragmas, CooperativeConnection
+
+class TestCooperativeBusyWait(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved_pragmas = app.config['SQLITE_PRAGMAS']
+        app.config['SQLITE_PRAGMAS'] = {'journal_mode': 'WAL', 'busy_timeout': 5000}
+
+        # The engine options the eventlet profile picks for a database file
+        profile = Flask(__name__)
+        profile.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, 'cms.db'),
+                              SOCKETIO_ASYNC_MODE='eventlet', DB_POOL_SIZE=2, DB_MAX_OVERFLOW=0,
+                              DB_POOL_TIMEOUT=1)
+        configure_database(profile)
+        self.engine = create_engine(profile.config['SQLALCHEMY_DATABASE_URI'],
+                                    **profile.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        event.listen(self.engine, 'connect', apply_sqlite_pragmas)
+        with self.engine.begin() as connection:
+            connection.execute(text('CREATE TABLE entry (writer TEXT)'))
+
+    def tearDown(self):
+        self.engine.dispose()
+        app.config['SQLITE_PRAGMAS'] = self.saved_pragmas
+        shutil.rmtree(self.directory)
+
+    def test_contending_writers_both_commit(self):
+        with self.engine.connect() as connection:
+            self.assertIsInstance(connection.connection.dbapi_connection, CooperativeConnection)
+            self.assertEqual(connection.exec_driver_sql('PRAGMA busy_timeout').scalar(),
+                             CooperativeConnection.BUSY_SLICE_MS)
+
+        def holder():
+            with self.engine.begin() as connection:
+                connection.execute(text("INSERT INTO entry VALUES ('holder')"))
+                eventlet.sleep(0.3)  # other green threads run while the write lock is held
+
+        def waiter():
+            started = time.monotonic()
+            with self.engine.begin() as connection:
+                connection.execute(text("INSERT INTO entry VALUES ('waiter')"))
+            return time.monotonic() - started
+
+        pool = eventlet.GreenPool()
+        pool.spawn(holder)
+        waited = pool.spawn(waiter)
+        pool.waitall()
+
+        # SQLite's own 5 s wait would have blocked the holder from ever committing
+        self.assertGreater(waited.wait(), 0.2)
+        with self.engine.connect() as connection:
+            self.assertEqual(sorted(connection.execute(text('SELECT writer FROM entry')).scalars()),
+                             ['holder', 'waiter'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import csv
+import io
+import unittest
+from datetime import datetime
+from app import app, db, User, Customer, Product, Invoice, InvoiceItem, Transaction
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestExports(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(username='staff', password='x', role='staff')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1',
+                            address='Street', gstin='29ABCDE1234F1Z5')
+        product = Product(name='Cement', hsn='2523', gst_percent=18, price=100)
+        db.session.add_all([user, customer, product])
+        db.session.commit()
+        invoice = Invoice(invoice_number=1, customer_id=customer.id, date=datetime(2024, 6, 1),
+                          payment_mode='Credit', total_amount=236, created_by=user.id)
+        db.session.add(invoice)
+        db.session.flush()
+        db.session.add(InvoiceItem(invoice_id=invoice.id, product_id=product.id, quantity=2, rate=100,
+                                   hsn='2523', gst_percent=18, amount=236))
+        db.session.add_all([
+            Transaction(customer_id=customer.id, type='payment', amount=100, description='Cash',
+                        date=datetime(2024, 6, 2), payment_mode='Cash'),
+            Transaction(customer_id=customer.id, type='credit', amount=50, description='Old dues',
+                        date=datetime(2024, 5, 1))
+        ])
+        db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['user_role'] = 'staff'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def read_csv(self, url):
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+    def test_report_export_honours_filters(self):
+        rows = self.read_csv('/export/reports?start_date=2024-06-01')
+        self.assertEqual(rows[0][:3], ['Date', 'Customer', 'Type'])
+        self.assertEqual([r[5] for r in rows[1:]], ['Cash'])
+
+    def test_invoice_export_includes_gst_columns(self):
+        header, row = self.read_csv('/export/invoices')
+        item = dict(zip(header, row))
+        self.assertEqual(item['HSN'], '2523')
+        self.assertEqual(item['GSTIN'], '29ABCDE1234F1Z5')
+        self.assertEqual(item['Taxable'], '200.0')
+        self.assertEqual(item['CGST'], '18.0')
+        self.assertEqual(item['SGST'], '18.0')
+
+    def test_payment_export_only_lists_payments(self):
+        rows = self.read_csv('/export/payments')
+        self.assertEqual([r[2] for r in rows[1:]], ['payment'])
+
+    def test_xlsx_export(self):
+        response = self.app.get('/export/payments?format=xlsx')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_data().startswith(b'PK'))
+        self.assertEqual(self.app.get('/export/payments?format=pdf').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
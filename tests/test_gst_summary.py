@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import unittest
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+import migrations
+from app import (app, db, User, Customer, Invoice, InvoiceItem, Product, GstSummary, catalog_cache,
+                 dashboard_stats, rebuild_gst_summary)
+from query_budget import QueryCounter
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestGstSummary(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+        dashboard_stats.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        dealer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street',
+                          gstin='29ABCDE1234F1Z5', credit_limit=100000)
+        retail = Customer(name='Retail', email='retail@example.com', phone='2', address='Road',
+                          credit_limit=100000)
+        cement = Product(name='Cement', hsn='2523', gst_percent=28, price=100)
+        steel = Product(name='Steel', hsn='7214', gst_percent=18, price=50)
+        db.session.add_all([admin, dealer, retail, cement, steel])
+        db.session.commit()
+        self.dealer_id, self.retail_id = dealer.id, retail.id
+        self.cement_id, self.steel_id = cement.id, steel.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_invoice(self, customer_id, day, items):
+        self.app.post('/create_invoice', data={
+            'customer_id': customer_id, 'date': day, 'payment_mode': 'Credit',
+            'items': json.dumps([{'product_id': product_id, 'quantity': quantity, 'rate': rate}
+                                 for product_id, quantity, rate in items])
+        })
+
+    def summary(self):
+        db.session.expire_all()
+        return {(row.month, row.hsn, row.gst_percent, row.b2b): (row.item_count, row.taxable_value, row.cgst)
+                for row in GstSummary.query.filter(GstSummary.item_count != 0)}
+
+    def test_invoice_writes_keep_the_summary_in_step(self):
+        self.create_invoice(self.dealer_id, '2024-04-05', [(self.cement_id, 10, 100), (self.steel_id, 4, 50)])
+        self.create_invoice(self.retail_id, '2024-04-20', [(self.cement_id, 2, 100)])
+        self.create_invoice(self.retail_id, '2024-05-02', [(self.cement_id, 1, 100)])
+        self.assertEqual(self.summary(), {
+            (date(2024, 4, 1), '2523', 28.0, True): (1, 1000.0, 140.0),
+            (date(2024, 4, 1), '7214', 18.0, True): (1, 200.0, 18.0),
+            (date(2024, 4, 1), '2523', 28.0, False): (1, 200.0, 28.0),
+            (date(2024, 5, 1), '2523', 28.0, False): (1, 100.0, 14.0),
+        })
+
+        invoice = Invoice.query.filter_by(customer_id=self.retail_id).order_by(Invoice.id).first()
+        self.app.post(f'/delete_invoice/{invoice.id}')
+        self.assertNotIn((date(2024, 4, 1), '2523', 28.0, False), self.summary())
+        self.assertEqual(rebuild_gst_summary(fix=False), [])
+
+    def test_key_changes_move_items_between_rows(self):
+        self.create_invoice(self.retail_id, '2024-04-20', [(self.cement_id, 2, 100)])
+        customer = db.session.get(Customer, self.retail_id)
+        customer.gstin = '29RETAIL1234F1Z5'
+        db.session.commit()
+        self.assertEqual(self.summary(), {(date(2024, 4, 1), '2523', 28.0, True): (1, 200.0, 28.0)})
+
+        invoice = Invoice.query.one()
+        invoice.date = datetime(2024, 6, 1)
+        db.session.commit()
+        self.assertEqual(self.summary(), {(date(2024, 6, 1), '2523', 28.0, True): (1, 200.0, 28.0)})
+
+        # Deleting the invoice row first takes its items out as well
+        db.session.execute(text('DELETE FROM invoice'))
+        db.session.commit()
+        self.assertEqual(self.summary(), {})
+        db.session.execute(text('DELETE FROM invoice_item'))
+        db.session.commit()
+        self.assertEqual(self.summary(), {})
+        self.assertEqual(rebuild_gst_summary(fix=False), [])
+
+    def test_month_summary_and_export(self):
+        self.create_invoice(self.dealer_id, '2024-04-05', [(self.cement_id, 10, 100), (self.steel_id, 4, 50)])
+        self.create_invoice(self.retail_id, '2024-04-20', [(self.cement_id, 2, 100)])
+
+        with QueryCounter() as queries:
+            response = self.app.get('/gst_summary?month=2024-04')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        html = response.get_data(as_text=True)
+        self.assertIn('₹1200.00', html)  # cement taxable value, B2B and B2C together
+        self.assertIn('₹168.00', html)  # cement CGST
+
+        response = self.app.get('/export/gst_summary?month=2024-04')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[1], ['2024-04', '2523', '28.0', '2', '12.0', '1200.0', '168.0', '168.0', '336.0',
+                                   '1000.0', '280.0', '200.0', '56.0'])
+        self.assertEqual(rows[2][:3], ['2024-04', '7214', '18.0'])
+        self.assertEqual(self.app.get('/gst_summary?month=April').status_code, 400)
+
+    def test_rebuild_detects_and_fixes_drift(self):
+        self.create_invoice(self.dealer_id, '2024-04-05', [(self.steel_id, 4, 50)])
+        db.session.execute(text('UPDATE gst_summary SET cgst = 0'))
+        db.session.commit()
+
+        drift = rebuild_gst_summary(fix=False)
+        self.assertEqual(drift, [(date(2024, 4, 1), '7214', 18.0, True, 'cgst', 0.0, 18.0)])
+        result = app.test_cli_runner().invoke(args=['rebuild-gst-summary', '--verify'])
+        self.assertEqual(result.exit_code, 1)
+        result = app.test_cli_runner().invoke(args=['rebuild-gst-summary'])
+        self.assertIn('Fixed 1 drifted', result.output)
+        self.assertEqual(rebuild_gst_summary(fix=False), [])
+
+    def test_upgrade_backfills_existing_items(self):
+        self.create_invoice(self.retail_id, '2024-04-20', [(self.cement_id, 2, 100), (self.cement_id, 1, 100)])
+        migrations.stamp(db.engine, version=8)
+        with db.engine.begin() as conn:
+            conn.execute(text('DELETE FROM schema_version WHERE version > 8'))
+            migrations.drop_gst_summary_triggers(conn)
+            conn.execute(text('DROP TABLE gst_summary'))
+        self.assertEqual([number for number, _ in migrations.upgrade(db.engine, target=9)], [9])
+        self.assertEqual(self.summary(), {(date(2024, 4, 1), '2523', 28.0, False): (2, 300.0, 42.0)})
+
+        db.session.add(InvoiceItem(invoice_id=Invoice.query.one().id, product_id=self.cement_id, quantity=1,
+                                   rate=100, hsn='2523', gst_percent=28, amount=128))
+        db.session.commit()
+        self.assertEqual(self.summary()[(date(2024, 4, 1), '2523', 28.0, False)][0], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from datetime import datetime
+from sqlalchemy import event
+from app import app, db, User, Customer, Invoice, InvoiceSequence, InvoiceNumberAllocator, invoice_numbers
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestInvoiceNumbers(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(username='staff', password='x', role='staff')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street')
+        db.session.add_all([user, customer])
+        db.session.commit()
+        # An invoice numbered before the sequence table existed
+        db.session.add(Invoice(invoice_number=41, customer_id=customer.id, date=datetime(2024, 3, 1),
+                               payment_mode='Cash', created_by=user.id))
+        db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['user_role'] = 'staff'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sequence_continues_after_existing_invoices(self):
+        today = datetime(2024, 6, 1)
+        self.assertEqual(invoice_numbers.peek(today), 42)
+        self.assertEqual(invoice_numbers.peek(today), 42)  # previews do not reserve
+        self.assertEqual(invoice_numbers.allocate(today), 42)
+        self.assertEqual(invoice_numbers.allocate(today), 43)
+        db.session.commit()
+        self.assertEqual(InvoiceSequence.query.get('invoice').next_value, 44)
+        self.assertEqual(self.app.get('/invoice_number_preview?date=2024-06-01').get_json(),
+                         {'next_invoice_number': 44})
+
+    def test_rolled_back_invoice_returns_its_number(self):
+        today = datetime(2024, 6, 1)
+        self.assertEqual(invoice_numbers.allocate(today), 42)
+        db.session.rollback()
+        self.assertEqual(invoice_numbers.allocate(today), 42)
+
+    def test_financial_year_scope(self):
+        allocator = InvoiceNumberAllocator(scope='financial_year')
+        self.assertEqual(allocator.allocate(datetime(2024, 4, 1)), 202400001)
+        self.assertEqual(allocator.allocate(datetime(2025, 3, 31)), 202400002)
+        self.assertEqual(allocator.allocate(datetime(2025, 4, 1)), 202500001)
+
+    def test_block_reservation_avoids_a_write_per_invoice(self):
+        allocator = InvoiceNumberAllocator(block_size=10)
+        updates = []
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE invoice_sequence'):
+                updates.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_updates)
+        try:
+            numbers = [allocator.allocate(datetime(2024, 6, 1)) for _ in range(12)]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_updates)
+        self.assertEqual(numbers, list(range(42, 54)))
+        self.assertEqual(len(updates), 2)
+        # Another worker continues after the reserved blocks
+        self.assertEqual(InvoiceNumberAllocator().allocate(datetime(2024, 6, 1)), 62)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+import time
+import unittest
+import os
+
+import jobs
+from app import (app, db, socketio, User, Customer, Product, catalog_cache, dashboard_stats, job_queue,
+                 job_worker, live_updates)
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestBackgroundJobs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app.config.from_object(TestConfig)
+        self.jobs_config = app.config['JOBS_DB'], app.config['JOBS_RESULT_DIR']
+        app.config['JOBS_DB'] = os.path.join(self.directory, 'jobs.db')
+        app.config['JOBS_RESULT_DIR'] = os.path.join(self.directory, 'results')
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+        dashboard_stats.invalidate()
+        # Send live updates at once so no delayed flush outlives the test
+        self.window = live_updates.window
+        live_updates.window = 0
+
+        admin = User(username='admin', password='x', role='admin')
+        staff = User(username='staff', password='x', role='staff')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street',
+                            credit_limit=100000)
+        product = Product(name='Cement', hsn='2523', gst_percent=18, price=100)
+        db.session.add_all([admin, staff, customer, product])
+        db.session.commit()
+        self.admin_id, self.staff_id = admin.id, staff.id
+        self.customer_id, self.product_id = customer.id, product.id
+        self.login(self.app, admin)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        app.config['JOBS_DB'], app.config['JOBS_RESULT_DIR'] = self.jobs_config
+        live_updates.window = self.window
+        shutil.rmtree(self.directory)
+
+    def login(self, client, user):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['username'] = user.username
+            sess['user_role'] = user.role
+
+    def submit(self, type, params, client=None):
+        return (client or self.app).post('/jobs', json={'type': type, 'params': params})
+
+    def create_invoice(self, day):
+        self.app.post('/create_invoice', data={
+            'customer_id': self.customer_id, 'date': day, 'payment_mode': 'Credit',
+            'items': json.dumps([{'product_id': self.product_id, 'quantity': 2, 'rate': 100}])
+        })
+
+    def test_export_runs_in_the_worker_and_downloads(self):
+        self.app.post('/add_payment', data={'customer_id': self.customer_id, 'amount': 100,
+                                            'payment_mode': 'Cash', 'date': '2024-04-01'})
+        response = self.submit('export', {'dataset': 'reports'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['id']
+        self.assertEqual(response.headers['Location'], f'/jobs/{job_id}')
+        self.assertEqual(self.app.get(f'/jobs/{job_id}').get_json()['status'], 'queued')
+        self.assertEqual(self.app.get(f'/jobs/{job_id}/result').status_code, 404)
+
+        sock = socketio.test_client(app, flask_test_client=self.app)
+        sock.get_received()
+        self.assertTrue(job_worker().run_once())
+        self.assertFalse(job_worker().run_once())
+        updates = [event['args'][0] for event in sock.get_received() if event['name'] == 'job_updated']
+        self.assertEqual([update['status'] for update in updates][::len(updates) - 1], ['running', 'done'])
+        sock.disconnect()
+
+        status = self.app.get(f'/jobs/{job_id}').get_json()
+        self.assertEqual((status['status'], status['progress'], status['message']), ('done', 1.0, '1 rows'))
+        response = self.app.get(f'/jobs/{job_id}/result')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[0][:3], ['Date', 'Customer', 'Type'])
+        self.assertEqual(rows[1][1:4], ['Dealer', 'payment', '100.0'])
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+
+    def test_print_job_renders_every_matching_invoice(self):
+        self.create_invoice('2024-04-01')
+        self.create_invoice('2024-04-02')
+        self.create_invoice('2024-05-01')
+        job_id = self.submit('print_invoices', {'start_date': '2024-04-01', 'end_date': '2024-04-30'}) \
+            .get_json()['id']
+        job_worker().run_once()
+        self.assertEqual(self.app.get(f'/jobs/{job_id}').get_json()['message'], '2 invoices')
+        html = self.app.get(f'/jobs/{job_id}/result').get_data(as_text=True)
+        self.assertEqual(html.count('class="invoice-box"'), 2)
+        self.assertIn('Print 2 Invoices', html)
+
+    def test_concurrency_is_bounded_per_type_and_stale_jobs_are_requeued(self):
+        queue = job_queue()
+        first = queue.enqueue('export', {})
+        second = queue.enqueue('export', {})
+        printing = queue.enqueue('print_invoices', {})
+        limits = {'export': 1, 'print_invoices': 1}
+        self.assertEqual(queue.claim('a', limits).id, first)
+        self.assertEqual(queue.claim('b', limits).id, printing)
+        self.assertIsNone(queue.claim('c', limits))
+
+        # A worker that stops heartbeating loses its job to the next one
+        queue._execute('UPDATE job SET heartbeat_at = ? WHERE id = ?', (time.time() - 3600, first))
+        job = queue.claim('c', limits)
+        self.assertEqual((job.id, job.worker, job.attempts), (first, 'c', 2))
+        self.assertEqual(queue.get(second).status, 'queued')
+
+    def test_cancel_stops_queued_and_running_jobs(self):
+        job_id = self.submit('export', {'dataset': 'reports'}).get_json()['id']
+        self.assertEqual(self.app.post(f'/jobs/{job_id}/cancel', json={}).get_json()['status'], 'cancelled')
+        self.assertFalse(job_worker().run_once())
+
+        queue = job_queue()
+        def slow(job, progress):
+            progress(0.5)
+            queue.cancel(job.id)
+            progress(0.6)
+            self.fail('progress() should have raised JobCancelled')
+        job_id = queue.enqueue('slow', {})
+        jobs.Worker(queue, {'slow': slow}, {}).run_once()
+        job = queue.get(job_id)
+        self.assertEqual((job.status, job.message), ('cancelled', 'Cancelled'))
+
+    def test_failures_and_permissions(self):
+        job_id = self.submit('export', {'dataset': 'statement'}).get_json()['id']
+        job_worker().run_once()
+        status = self.app.get(f'/jobs/{job_id}').get_json()
+        self.assertEqual(status['status'], 'failed')
+        self.assertIn('A customer is required.', status['error'])
+
+        self.assertEqual(self.submit('nonsense', {}).status_code, 400)
+        staff = app.test_client()
+        self.login(staff, db.session.get(User, self.staff_id))
+        self.assertEqual(self.submit('rebuild', {}, client=staff).status_code, 403)
+        self.assertEqual(staff.get(f'/jobs/{job_id}').status_code, 404)
+        self.assertEqual(staff.post(f'/jobs/{job_id}/cancel').status_code, 404)
+
+        response = self.app.post('/jobs', data={'type': 'rebuild', 'targets': ['balances', 'gst_summary']})
+        self.assertEqual(response.status_code, 302)
+        job_worker().run_once()
+        job = job_queue().list(self.admin_id)[0]
+        self.assertEqual((job.status, job.message), ('done', 'balances: 0 fixed; gst_summary: 0 fixed'))
+        self.assertIn('Rebuild derived tables', self.app.get('/jobs').get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import re
+import tempfile
+import unittest
+from app import app, db, socketio, live_updates, User, Customer
+from socket_queue import SQLiteQueueManager
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestLiveUpdates(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.window = live_updates.window
+        live_updates.flush()
+
+        admin = User(username='admin', password='x', role='admin')
+        db.session.add(admin)
+        db.session.add_all([Customer(name=f'Customer {i}', email=f'c{i}@example.com', phone='1',
+                                     address='Street') for i in (1, 2)])
+        db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['user_role'] = 'admin'
+        self.sockets = []
+
+    def tearDown(self):
+        live_updates.window = self.window
+        for client in self.sockets:
+            client.disconnect()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def subscriber(self, **subscription):
+        client = socketio.test_client(app, flask_test_client=self.app)
+        client.emit('subscribe', subscription)
+        client.get_received()
+        self.sockets.append(client)
+        return client
+
+    def events(self, client):
+        return [(message['name'], message['args'][0]) for message in client.get_received()]
+
+    def add_payment(self, customer_id, amount):
+        self.app.post('/add_payment', data={'customer_id': customer_id, 'amount': amount,
+                                            'payment_mode': 'Cash', 'date': '2024-06-01'})
+
+    def test_events_only_reach_subscribed_rooms(self):
+        live_updates.window = 0
+        first = self.subscriber(customer_id=1)
+        second = self.subscriber(customer_id=2)
+        listing = self.subscriber(views=['customers', 'bogus'])
+        anonymous = socketio.test_client(app)
+        anonymous.emit('subscribe', {'views': ['customers']})
+        self.sockets.append(anonymous)
+
+        self.add_payment(1, 40)
+        self.assertEqual([name for name, _ in self.events(first)], ['transaction_added', 'customer_updated'])
+        self.assertEqual(self.events(second), [])
+        self.assertEqual([(name, data['id']) for name, data in self.events(listing)], [('customer_updated', 1)])
+        self.assertEqual(anonymous.get_received(), [])
+
+    def test_dashboard_page_joins_the_transactions_view(self):
+        live_updates.window = 0
+        html = self.app.get('/').get_data(as_text=True)
+        # main.js subscribes to the views a page names in these attributes
+        views = re.findall(r'data-(?:live-view|sync-stream)="([^"]+)"', html)
+        self.assertIn('transactions', views)
+
+        dashboard = self.subscriber(views=views)
+        self.add_payment(1, 40)
+        added = [data for name, data in self.events(dashboard) if name == 'transaction_added']
+        self.assertEqual([(data['amount'], data['customer_name']) for data in added], [(40.0, 'Customer 1')])
+
+    def test_bursts_for_one_customer_are_coalesced(self):
+        live_updates.window = 60
+        listing = self.subscriber(views=['customers'])
+        for amount in (10, 20, 30):
+            self.add_payment(1, amount)
+        self.add_payment(2, 5)
+        self.assertEqual(self.events(listing), [])
+
+        emitted = live_updates.emitted
+        live_updates.flush()
+        updates = {data['id']: data['outstanding_balance'] for _, data in self.events(listing)}
+        self.assertEqual(updates, {1: -60, 2: -5})
+        # One emit per customer and room, not per payment
+        self.assertEqual(live_updates.emitted - emitted, 4)
+
+class TestSQLiteQueue(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.url = 'sqlite:///' + self.path
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_messages_fan_out_to_listeners_on_the_same_channel(self):
+        listener = SQLiteQueueManager(self.url, write_only=True, poll_interval=0)._listen()
+        publisher = SQLiteQueueManager(self.url, write_only=True)
+        other = SQLiteQueueManager(self.url, channel='other', write_only=True)
+
+        other._publish({'method': 'emit', 'event': 'ignored'})
+        publisher._publish({'method': 'emit', 'event': 'customer_updated', 'room': 'view:customers'})
+        self.assertEqual(next(listener), {'method': 'emit', 'event': 'customer_updated',
+                                          'room': 'view:customers'})
+
+    def test_old_messages_are_pruned(self):
+        publisher = SQLiteQueueManager(self.url, write_only=True, retention=-1)
+        publisher._publish({'method': 'emit', 'event': 'first'})
+        publisher._publish({'method': 'emit', 'event': 'second'})
+        count = publisher._connect().execute('SELECT COUNT(*) FROM socketio_message').fetchone()[0]
+        self.assertEqual(count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import app as app_module
+from app import app, db, socketio, User, metrics_registry, dashboard_stats
+import metrics
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+def sample(text, name, **labels):
+    """The value of one series in Prometheus text output, or None."""
+    wanted = ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    pattern = '^' + re.escape(name + (f'{{{wanted}}}' if wanted else '')) + r' (\S+)$'
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.registry.counter('jobs_total', 'Jobs.')
+        self.registry.gauge('queue_depth', 'Queue depth.')
+        self.registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+
+    def test_exposition_format(self):
+        self.registry.inc('jobs_total', kind='a "quoted"\nname')
+        self.registry.inc('jobs_total', 2, kind='plain')
+        for value in (0.05, 0.5, 0.7, 5):
+            self.registry.observe('latency_seconds', value, route='/x')
+        text = self.registry.render()
+        self.assertIn('# TYPE jobs_total counter', text)
+        self.assertIn('jobs_total{kind="a \\"quoted\\"\\nname"} 1', text)
+        self.assertIn('jobs_total{kind="plain"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/x",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/x",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="/x",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{route="/x"} 4', text)
+        self.assertEqual(sample(text, 'latency_seconds_sum', route='/x'), 6.25)
+        self.assertNotIn('queue_depth', text)
+
+    def test_store_sums_workers_and_drops_gauges_of_dead_ones(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            store = metrics.SQLiteMetricsStore(os.path.join(workdir, 'metrics.db'))
+            self.registry.inc('jobs_total', 3)
+            self.registry.set('queue_depth', 4)
+            self.registry.observe('latency_seconds', 0.5)
+            store.write(self.registry.snapshot())
+            # A worker that has exited: its pid is no longer running
+            dead_pid = 2 ** 22 + 1
+            while metrics.pid_alive(dead_pid):
+                dead_pid += 1
+            conn = sqlite3.connect(store.path)
+            with conn:
+                conn.execute('INSERT INTO metrics_snapshot VALUES (?, ?, ?, 0)', (
+                    f'{dead_pid}-1.0', dead_pid,
+                    '[["jobs_total", [], 2], ["queue_depth", [], 7], ["latency_seconds", [], [1, 0, 0, 0.05]]]'))
+            conn.close()
+            store.retention = 10 ** 10
+            text = self.registry.render(store.read())
+        self.assertEqual(sample(text, 'jobs_total'), 5)
+        self.assertEqual(sample(text, 'queue_depth'), 4)
+        self.assertEqual(sample(text, 'latency_seconds_count'), 2)
+        self.assertEqual(sample(text, 'latency_seconds_bucket', le='0.1'), 1)
+
+class TestMetricsEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        dashboard_stats.invalidate()
+        db.session.add(User(username='admin', password='x', role='admin'))
+        db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        app.config['METRICS_TOKEN'] = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def scrape(self):
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        return response.get_data(as_text=True)
+
+    def test_request_pool_and_cache_metrics(self):
+        before = sample(self.scrape(), 'cms_http_request_duration_seconds_count',
+                        endpoint='customers', method='GET') or 0
+        self.app.get('/customers')
+        self.app.get('/')
+        self.app.get('/no-such-page')
+        text = self.scrape()
+        self.assertEqual(sample(text, 'cms_http_request_duration_seconds_count',
+                                endpoint='customers', method='GET'), before + 1)
+        self.assertGreaterEqual(sample(text, 'cms_http_responses_total', endpoint='unmatched', status='404'), 1)
+        # The scrape itself is the only request in flight
+        self.assertEqual(sample(text, 'cms_http_requests_in_flight'), 1)
+        self.assertGreater(sample(text, 'cms_db_pool_checkouts_total'), 0)
+        self.assertIsNotNone(sample(text, 'cms_cache_hits_total', cache='dashboard'))
+        self.assertIsNotNone(sample(text, 'cms_cache_hit_ratio', cache='dashboard'))
+
+    def test_socket_connections_and_emits(self):
+        client = socketio.test_client(app, flask_test_client=self.app)
+        connected = sample(self.scrape(), 'cms_socketio_connected_clients')
+        emitted = sample(self.scrape(), 'cms_socketio_events_emitted_total', event='customers_data') or 0
+        client.emit('get_customers', {})
+        client.disconnect()
+        text = self.scrape()
+        self.assertEqual(sample(text, 'cms_socketio_connected_clients'), connected - 1)
+        self.assertEqual(sample(text, 'cms_socketio_events_emitted_total', event='customers_data'), emitted + 1)
+        self.assertGreaterEqual(sample(text, 'cms_socketio_events_emitted_total', event='connection_response'), 1)
+
+    def test_sqlite_busy_errors_are_counted(self):
+        before = sample(metrics_registry.render(), 'cms_db_sqlite_busy_total') or 0
+        app_module.count_sqlite_busy(SimpleNamespace(original_exception=sqlite3.OperationalError(
+            'database is locked')))
+        app_module.count_sqlite_busy(SimpleNamespace(original_exception=sqlite3.OperationalError(
+            'no such table: x')))
+        app_module.count_sqlite_busy(SimpleNamespace(original_exception=sqlite3.OperationalError(
+            'no such column: busy')))
+        app_module.count_sqlite_busy(SimpleNamespace(original_exception=sqlite3.ProgrammingError(
+            'database is locked')))
+        self.assertEqual(sample(metrics_registry.render(), 'cms_db_sqlite_busy_total'), before + 1)
+
+        # A real lock timeout, recognised by its error code
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'locked.db')
+            holder = sqlite3.connect(path, isolation_level=None)
+            waiter = sqlite3.connect(path, timeout=0, isolation_level=None)
+            try:
+                holder.execute('BEGIN IMMEDIATE')
+                with self.assertRaises(sqlite3.OperationalError) as raised:
+                    waiter.execute('BEGIN IMMEDIATE')
+            finally:
+                holder.close()
+                waiter.close()
+        app_module.count_sqlite_busy(SimpleNamespace(original_exception=raised.exception))
+        self.assertEqual(sample(metrics_registry.render(), 'cms_db_sqlite_busy_total'), before + 2)
+
+    def test_metrics_token(self):
+        app.config['METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.app.get('/metrics').status_code, 401)
+        response = self.app.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_without_a_token_are_local_only(self):
+        self.assertEqual(self.app.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code, 403)
+        self.assertEqual(self.app.get('/metrics', headers={'X-Forwarded-For': '203.0.113.9'}).status_code, 403)
+        self.assertEqual(self.app.get('/metrics').status_code, 200)
+
+    def test_publisher_starts_once_under_concurrent_requests(self):
+        class SlowCheckStore(metrics.SQLiteMetricsStore):
+            @property
+            def _publisher(self):
+                worker = self.__dict__.get('publisher')
+                time.sleep(0.01)  # widen the window between the check and the start
+                return worker
+
+            @_publisher.setter
+            def _publisher(self, worker):
+                self.__dict__['publisher'] = worker
+
+        started, barrier = [], threading.Barrier(8)
+
+        def start_background_task(task):
+            started.append(task)
+
+        def first_request():
+            barrier.wait()
+            store.start_publisher(metrics_registry, 5, start_background_task, time.sleep)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = SlowCheckStore(os.path.join(directory, 'metrics.db'))
+            threads = [threading.Thread(target=first_request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(started), 1)
+
+    def test_healthz(self):
+        with self.app.session_transaction() as sess:
+            sess.clear()
+        response = self.app.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['status'], 'ok')
+        self.assertGreaterEqual(response.json['db_ms'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
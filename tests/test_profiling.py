@@ -0,0 +1,88 @@
+import json
+import unittest
+from unittest import mock
+
+from app import app, db, User, Customer, dashboard_stats
+import profiling
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+    PROFILING = True
+    PROFILING_SAMPLE_RATE = 1.0
+    SLOW_QUERY_MS = 10000
+
+class TestRequestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        dashboard_stats.invalidate()
+        db.session.add(User(username='admin', password='x', role='admin'))
+        db.session.add(Customer(name="O'Brien Traders", email='ob@example.com', phone='1', address='Street'))
+        db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        app.config.update(PROFILING=False, SLOW_QUERY_MS=100)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def timings(response):
+        entries = {}
+        for entry in response.headers['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing_and_request_log(self):
+        with self.assertLogs('cms.profile', 'INFO') as logs:
+            response = self.app.get('/view_customer/1')
+        self.assertEqual(response.status_code, 200)
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'db', 'tpl', 'app', 'total'})
+        self.assertEqual(timings['db']['desc'], '"4 queries"')
+        self.assertEqual(timings['tpl']['desc'], '"1 templates"')
+        self.assertGreater(float(timings['total']['dur']), 0)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['route'], '/view_customer/<int:id>')
+        self.assertEqual(line['endpoint'], 'view_customer')
+        self.assertEqual((line['status'], line['queries'], line['templates']), (200, 4, 1))
+
+    def test_disabled_or_unsampled_requests_are_untouched(self):
+        app.config['PROFILING'] = False
+        self.assertNotIn('Server-Timing', self.app.get('/customers').headers)
+        app.config.update(PROFILING=True, PROFILING_SAMPLE_RATE=0.5)
+        with mock.patch('profiling.random.random', return_value=0.7):
+            self.assertNotIn('Server-Timing', self.app.get('/customers').headers)
+        with mock.patch('profiling.random.random', return_value=0.2):
+            self.assertIn('Server-Timing', self.app.get('/customers').headers)
+
+    def test_slow_queries_are_logged_without_values(self):
+        app.config['SLOW_QUERY_MS'] = 0
+        with self.assertLogs('cms.slow_query', 'WARNING') as logs:
+            self.app.get('/view_customer/1')
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual(len(entries), 4)
+        self.assertTrue(all(entry['route'] == '/view_customer/<int:id>' for entry in entries))
+        self.assertIn('FROM customer', entries[0]['statement'])
+        for entry in entries:
+            self.assertNotIn('Brien', json.dumps(entry))
+
+    def test_redact_sql(self):
+        self.assertEqual(profiling.redact_sql("SELECT *\n  FROM t WHERE name = 'O''Brien' AND id = 42 LIMIT ?"),
+                         'SELECT * FROM t WHERE name = ? AND id = ? LIMIT ?')
+        self.assertEqual(profiling.redact_sql('SELECT count_1, anon_2 FROM t'), 'SELECT count_1, anon_2 FROM t')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+
+import pytest
+from sqlalchemy import func
+
+from app import (app, db, socketio, Customer, Invoice, InvoiceItem, dashboard_stats, catalog_cache,
+                 invoice_render_cache)
+from benchmarks import dataset
+from query_budget import assert_max_queries
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+# Two sizes: a budget that only holds for the smaller one grows with the data
+SIZES = (dataset.SCALES['tiny'], dict(customers=100, products=30, invoices=400, transactions=2000))
+
+# <int:id> means a customer except on these pages
+URL_OVERRIDES = {'edit_product': {'id': 1}, 'search': {'kind': 'customers'}}
+QUERY_STRINGS = {'search': '?q=customer 00', 'add_transaction': '?customer_id=1'}
+
+SOCKET_EVENTS = (
+    ('subscribe', {'views': ['customers', 'transactions']}),
+    ('get_customers', {}),
+    ('get_transactions', {}),
+)
+
+def budgeted_pages():
+    """(endpoint, rule, budget) for every GET route that declares a query budget."""
+    for rule in app.url_map.iter_rules():
+        budget = getattr(app.view_functions[rule.endpoint], 'query_budget', None)
+        if budget is not None and 'GET' in rule.methods:
+            yield rule.endpoint, rule, budget
+
+def budgeted_events():
+    handlers = socketio.server.handlers['/']
+    for message, data in SOCKET_EVENTS:
+        yield message, data, handlers[message].query_budget
+
+class TestQueryBudgets(unittest.TestCase):
+    """Routes and socket handlers stay within their declared statement budgets at any size."""
+
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def seed(self, size):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        conn = db.engine.raw_connection()
+        dataset.seed(conn, password_hash=lambda password: password, **size)
+        # Exercise the busiest customer and the longest invoice
+        busiest = (db.session.query(Invoice.customer_id).group_by(Invoice.customer_id)
+                   .order_by(func.count().desc()).limit(1).scalar())
+        longest = (db.session.query(InvoiceItem.invoice_id).group_by(InvoiceItem.invoice_id)
+                   .order_by(func.count().desc()).limit(1).scalar())
+        return {'id': busiest, 'invoice_id': longest, 'dataset': 'reports'}
+
+    def login(self, client):
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_role'] = 'admin'
+
+    def measure(self, size):
+        """Statement counts per page and socket event, each with cold caches."""
+        args = self.seed(size)
+        client = app.test_client()
+        self.login(client)
+        counts = {}
+        for endpoint, rule, budget in budgeted_pages():
+            values = dict(args, **URL_OVERRIDES.get(endpoint, {}))
+            url = rule.build({name: values[name] for name in rule.arguments})[1] + QUERY_STRINGS.get(endpoint, '')
+            dashboard_stats.invalidate()
+            catalog_cache.invalidate()
+            invoice_render_cache.clear()
+            with assert_max_queries(budget, label=f'GET {url}') as counter:
+                response = client.get(url)
+                response.get_data()
+            self.assertEqual(response.status_code, 200, url)
+            counts[endpoint] = len(counter)
+
+        sock = socketio.test_client(app, flask_test_client=client)
+        for message, data, budget in budgeted_events():
+            with assert_max_queries(budget, label=f'{message} event') as counter:
+                sock.emit(message, data)
+            sock.get_received()
+            counts[message] = len(counter)
+        sock.disconnect()
+        return counts
+
+    def test_budgets_hold_and_do_not_grow_with_data(self):
+        small, large = (self.measure(size) for size in SIZES)
+        self.assertIn('customers', small)
+        self.assertIn('view_invoice', small)
+        self.assertEqual(small, large)
+
+    def test_every_page_and_sync_handler_declares_a_budget(self):
+        pages = {endpoint for endpoint, rule, budget in budgeted_pages()}
+        self.assertTrue({'index', 'customers', 'view_customer', 'invoices', 'payments', 'reports',
+                         'view_invoice', 'print_receipt', 'print_invoice_a4', 'credit_report'} <= pages)
+        self.assertEqual(len(list(budgeted_events())), len(SOCKET_EVENTS))
+
+def test_over_budget_lists_the_statements(query_counter):
+    with app.app_context():
+        db.create_all()
+        with query_counter:
+            db.session.query(Customer).all()
+            db.session.query(Invoice).all()
+        assert len(query_counter) == 2
+        with pytest.raises(AssertionError) as failure:
+            with assert_max_queries(1, label='two lookups'):
+                db.session.query(Customer).all()
+                db.session.query(Invoice).all()
+        db.session.remove()
+        db.drop_all()
+    message = str(failure.value)
+    assert message.startswith('two lookups ran 2 SQL statements, budget is 1:')
+    assert '1. SELECT customer.id' in message
+    assert '2. SELECT invoice.id' in message
+
+if __name__ == '__main__':
+    unittest.main()
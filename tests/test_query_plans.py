@@ -0,0 +1,95 @@
+import re
+import unittest
+from datetime import datetime
+from sqlalchemy import event
+from app import app, db, User, Customer, Product, Invoice, InvoiceItem, Transaction, dashboard_stats
+import migrations
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+HOT_TABLES = ('transaction', 'invoice', 'invoice_item')
+FULL_SCAN = re.compile(r'\bSCAN (%s)\b(?!.*\bUSING\b)' % '|'.join(HOT_TABLES))
+
+class TestHotQueryPlans(unittest.TestCase):
+    """Every query a hot route issues against the ledger tables must use an index."""
+
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        dashboard_stats.invalidate()
+
+        user = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street')
+        product = Product(name='Cement', hsn='2523', gst_percent=18, price=100)
+        db.session.add_all([user, customer, product])
+        db.session.commit()
+        invoice = Invoice(invoice_number=1, customer_id=customer.id, date=datetime(2024, 6, 1),
+                          payment_mode='Credit', total_amount=118, created_by=user.id)
+        db.session.add(invoice)
+        db.session.flush()
+        db.session.add(InvoiceItem(invoice_id=invoice.id, product_id=product.id, quantity=1, rate=100,
+                                   hsn='2523', gst_percent=18, amount=118))
+        db.session.add(Transaction(customer_id=customer.id, type='payment', amount=100,
+                                   description='Cash', date=datetime(2024, 6, 2)))
+        db.session.commit()
+        self.customer_id = customer.id
+        self.invoice_id = invoice.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def capture(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.assertEqual(self.app.get(url).status_code, 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return statements
+
+    def assert_indexed(self, url):
+        statements = self.capture(url)
+        self.assertTrue(statements)
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                details = [row[-1] for row in plan]
+                scans = [d for d in details if FULL_SCAN.search(d.replace('"', ''))]
+                self.assertFalse(scans, f'{url} runs a full table scan:\n{statement}\n{details}')
+
+    def test_hot_routes_use_indexes(self):
+        for url in ('/', f'/view_customer/{self.customer_id}', '/payments', '/invoices',
+                    f'/invoice/{self.invoice_id}', '/reports',
+                    f'/reports?start_date=2024-06-01&end_date=2024-06-30',
+                    f'/reports?customer_id={self.customer_id}',
+                    f'/customer/{self.customer_id}/statement',
+                    f'/customer/{self.customer_id}/statement?start_date=2024-06-01&end_date=2024-06-30'):
+            with self.subTest(url=url):
+                self.assert_indexed(url)
+
+    def test_migrations_are_stamped_and_idempotent(self):
+        migrations.stamp(db.engine)
+        self.assertEqual(migrations.upgrade(db.engine), [])
+        with db.engine.connect() as conn:
+            self.assertEqual(migrations.current_version(conn), migrations.latest_version())
+
+if __name__ == '__main__':
+    unittest.main()
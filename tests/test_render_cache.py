@@ -0,0 +1,141 @@
+import time
+import unittest
+from unittest import mock
+from app import (app, db, User, Customer, Product, Invoice, InvoiceItem,
+                 invoice_render_cache, RenderCache, catalog_cache)
+from query_budget import QueryCounter
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestInvoiceRenderCache(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        invoice_render_cache.clear()
+        catalog_cache.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Acme Builders', email='acme@example.com', phone='1', address='Main Road')
+        product = Product(name='Cement', hsn='2523', gst_percent=28, price=350)
+        db.session.add_all([admin, customer, product])
+        db.session.commit()
+        invoice = Invoice(invoice_number=1001, customer_id=customer.id, payment_mode='Cash',
+                          total_amount=448, created_by=admin.id)
+        db.session.add(invoice)
+        db.session.commit()
+        db.session.add(InvoiceItem(invoice_id=invoice.id, product_id=product.id, quantity=1, rate=350,
+                                   hsn='2523', gst_percent=28, amount=448))
+        db.session.commit()
+        self.invoice_id = invoice.id
+        self.customer_id = customer.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_repeat_views_are_served_from_the_cache(self):
+        for url in ('/invoice/%d' % self.invoice_id, '/invoice/%d/print_receipt' % self.invoice_id):
+            before = invoice_render_cache.stats()
+            first = self.app.get(url)
+            second = self.app.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first.data, second.data)
+            self.assertIn(b'Cement', second.data)
+            after = invoice_render_cache.stats()
+            self.assertEqual(after['misses'] - before['misses'], 1)
+            self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_customer_edit_invalidates_rendered_invoices(self):
+        self.app.get('/invoice/%d' % self.invoice_id)
+        self.app.post('/edit_customer/%d' % self.customer_id, data={
+            'name': 'Acme Infra', 'email': 'acme@example.com', 'phone': '1',
+            'address': 'Main Road', 'gstin': '', 'credit_limit': 0})
+        response = self.app.get('/invoice/%d' % self.invoice_id)
+        self.assertIn(b'Acme Infra', response.data)
+        self.assertNotIn(b'Acme Builders', response.data)
+
+    def test_customer_edit_keeps_other_customers_invoices(self):
+        other = Customer(name='Bharat Traders', email='bt@example.com', phone='2', address='Ring Road')
+        db.session.add(other)
+        db.session.commit()
+        self.app.get('/invoice/%d' % self.invoice_id)
+        self.app.post('/edit_customer/%d' % other.id, data={
+            'name': 'Bharat Exports', 'email': 'bt@example.com', 'phone': '2',
+            'address': 'Ring Road', 'gstin': '', 'credit_limit': 0})
+        before = invoice_render_cache.stats()
+        self.app.get('/invoice/%d' % self.invoice_id)
+        self.assertEqual(invoice_render_cache.stats()['hits'] - before['hits'], 1)
+
+    def test_other_workers_check_versions_on_an_interval(self):
+        worker = RenderCache(max_bytes=1024, check_interval=60)
+        worker.put(self.invoice_id, 'print_receipt.html', 'old', customer_id=self.customer_id)
+        with QueryCounter() as counter:
+            self.assertEqual(worker.get(self.invoice_id, 'print_receipt.html'), 'old')
+        self.assertEqual(len(counter), 0, counter.report())
+
+        self.app.post('/edit_customer/%d' % self.customer_id, data={
+            'name': 'Acme Infra', 'email': 'acme@example.com', 'phone': '1',
+            'address': 'Main Road', 'gstin': '', 'credit_limit': 0})
+        self.assertEqual(worker.get(self.invoice_id, 'print_receipt.html'), 'old')
+        with mock.patch('app.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(worker.get(self.invoice_id, 'print_receipt.html'))
+
+    def test_deleted_invoice_is_not_served(self):
+        self.app.get('/invoice/%d/print_a4' % self.invoice_id)
+        self.app.post('/delete_invoice/%d' % self.invoice_id)
+        self.assertEqual(self.app.get('/invoice/%d/print_a4' % self.invoice_id).status_code, 404)
+        self.assertEqual(self.app.get('/invoice/%d' % self.invoice_id).status_code, 404)
+
+    def test_template_change_misses_the_cache(self):
+        cache = RenderCache(max_bytes=1024)
+        cache.put(1, 'print_receipt.html', 'old')
+        self.assertEqual(cache.get(1, 'print_receipt.html'), 'old')
+        checksum, uptodate = cache._template_versions['print_receipt.html']
+        cache._template_versions['print_receipt.html'] = (checksum + 1, uptodate)
+        self.assertIsNone(cache.get(1, 'print_receipt.html'))
+
+    def test_included_partial_change_misses_the_cache(self):
+        loader = app.jinja_env.loader
+        get_source, edited = loader.get_source, []
+
+        def source(env, name):
+            text, filename, uptodate = get_source(env, name)
+            if name == '_invoice_a4.html':
+                return text + ''.join(edited), filename, lambda: not edited
+            return text, filename, uptodate
+
+        cache = RenderCache(max_bytes=1024)
+        with mock.patch.object(loader, 'get_source', side_effect=source):
+            cache.put(1, 'print_invoice_a4.html', 'old')
+            self.assertEqual(cache.get(1, 'print_invoice_a4.html'), 'old')
+            edited.append('<!-- edited -->')
+            self.assertIsNone(cache.get(1, 'print_invoice_a4.html'))
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        cache = RenderCache(max_bytes=10)
+        cache.put(1, 'print_receipt.html', 'aaaa')
+        cache.put(2, 'print_receipt.html', 'bbbb')
+        cache.get(1, 'print_receipt.html')
+        cache.put(3, 'print_receipt.html', 'cccc')
+        self.assertIsNone(cache.get(2, 'print_receipt.html'))
+        self.assertEqual(cache.get(1, 'print_receipt.html'), 'aaaa')
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['bytes'], 10)
+        cache.put(4, 'print_receipt.html', 'x' * 11)
+        self.assertIsNone(cache.get(4, 'print_receipt.html'))
+
+if __name__ == '__main__':
+    unittest.main()
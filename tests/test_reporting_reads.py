@@ -0,0 +1,122 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine, exc, text
+
+from app import (app, db, User, Customer, catalog_cache, dashboard_stats, create_read_engine, read_engines,
+                 read_source, refresh_reporting_snapshot, snapshot_taken_at)
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestReportingReads(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.saved_config = {key: app.config[key] for key in ('REPORTING_SNAPSHOT', 'REPORTING_SNAPSHOT_PATH')}
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+        dashboard_stats.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        db.session.add_all([admin, Customer(name='Primary Dealer', email='primary@example.com', phone='1',
+                                            address='Street', credit_limit=1000)])
+        db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+        # A second database file standing in for what the read-only engines see
+        self.directory = tempfile.mkdtemp()
+        self.replica = os.path.join(self.directory, 'cms.db')
+        engine = create_engine(f'sqlite:///{self.replica}')
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text('PRAGMA journal_mode=WAL'))
+        self.replica_engine = engine
+        self.add_replica_customer(100, 'Replica Dealer')
+        app.config['REPORTING_SNAPSHOT_PATH'] = os.path.join(self.directory, 'snapshot.db')
+
+    def tearDown(self):
+        for engine in read_engines.values():
+            engine.dispose()
+        read_engines.clear()
+        self.replica_engine.dispose()
+        shutil.rmtree(self.directory)
+        app.config.update(self.saved_config)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_replica_customer(self, id, name):
+        with self.replica_engine.begin() as conn:
+            conn.execute(Customer.__table__.insert(), {
+                'id': id, 'name': name, 'email': f'{id}@example.com', 'phone': str(id), 'address': 'Road',
+                'credit_limit': 0, 'created_at': datetime.utcnow(), 'invoiced_total': 500
+            })
+
+    def test_routed_views_read_from_the_reporting_engine(self):
+        app.config['REPORTING_SNAPSHOT'] = False
+        read_engines['reporting'] = create_read_engine(self.replica)
+
+        body = self.app.get('/credit_report').get_data(as_text=True)
+        self.assertIn('Replica Dealer', body)
+        self.assertNotIn('Primary Dealer', body)
+        self.assertNotIn('Figures as of', body)
+        # Views without reads_from stay on the primary engine
+        body = self.app.get('/customers').get_data(as_text=True)
+        self.assertIn('Primary Dealer', body)
+        self.assertNotIn('Replica Dealer', body)
+
+    def test_reporting_engine_refuses_writes(self):
+        engine = create_read_engine(self.replica)
+        try:
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text('PRAGMA query_only')).scalar(), 1)
+                with self.assertRaises(exc.OperationalError) as raised:
+                    conn.execute(text("UPDATE customer SET name = 'Changed'"))
+            self.assertIn('readonly', str(raised.exception))
+        finally:
+            engine.dispose()
+
+    def test_snapshot_serves_reports_and_shows_its_age(self):
+        app.config['REPORTING_SNAPSHOT'] = True
+        self.assertIsNone(snapshot_taken_at())
+        self.assertEqual(read_source('snapshot'), 'reporting')
+
+        before = time.time()
+        self.assertTrue(refresh_reporting_snapshot(self.replica))
+        self.assertGreaterEqual(snapshot_taken_at(), int(before))
+        snapshot = sqlite3.connect(app.config['REPORTING_SNAPSHOT_PATH'])
+        try:
+            self.assertEqual(snapshot.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        finally:
+            snapshot.close()
+        self.assertEqual(read_source('snapshot'), 'snapshot')
+
+        read_engines['snapshot'] = create_read_engine(app.config['REPORTING_SNAPSHOT_PATH'], immutable=True)
+        body = self.app.get('/credit_report').get_data(as_text=True)
+        self.assertIn('Replica Dealer', body)
+        self.assertIn('Figures as of', body)
+
+        # Writes after the copy only show up once the snapshot is refreshed
+        self.add_replica_customer(101, 'Late Dealer')
+        self.assertNotIn('Late Dealer', self.app.get('/credit_report').get_data(as_text=True))
+        refresh_reporting_snapshot(self.replica)
+        # A request's session keeps its connection until the app context ends
+        db.session.remove()
+        self.assertIn('Late Dealer', self.app.get('/credit_report').get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import re
+import unittest
+from datetime import datetime, timedelta
+from app import app, db, User, Customer, Transaction
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestReports(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(username='staff', password='x', role='staff')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1', address='Street')
+        db.session.add_all([user, customer])
+        db.session.commit()
+
+        # Two transactions share a timestamp so the id tie-breaker is exercised
+        base = datetime(2024, 5, 1, 10, 0)
+        dates = [base, base, base + timedelta(days=1), base + timedelta(days=2), base + timedelta(days=3)]
+        for i, date in enumerate(dates):
+            db.session.add(Transaction(customer_id=customer.id, type='credit' if i % 2 else 'payment',
+                                       amount=10 * (i + 1), description=f'tx{i}', date=date))
+        db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['user_role'] = 'staff'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_totals_are_aggregated_over_all_pages(self):
+        response = self.app.get('/reports?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('₹90.00', body)   # payments: 10 + 30 + 50
+        self.assertIn('₹60.00', body)   # credits: 20 + 40
+        self.assertIn('Showing 2 of 5 transactions', body)
+
+    def test_keyset_cursor_walks_every_row_once(self):
+        seen = []
+        url = '/reports?page_size=2'
+        while url:
+            response = self.app.get(url)
+            seen.extend(re.findall(r'<td>(tx\d)</td>', response.get_data(as_text=True)))
+            cursor = response.headers.get('X-Next-Cursor')
+            url = f'/reports?page_size=2&cursor={cursor}' if cursor else None
+        self.assertEqual(seen, ['tx4', 'tx3', 'tx2', 'tx1', 'tx0'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.app.get('/reports?cursor=garbage').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import json
+import unittest
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+import migrations
+from app import (app, db, User, Customer, Invoice, Transaction, Product, LedgerRollup, catalog_cache,
+                 dashboard_stats, ledger_totals, rebuild_ledger_rollups)
+from query_budget import QueryCounter
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestLedgerRollups(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+        dashboard_stats.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1',
+                            address='Street', credit_limit=100000)
+        other = Customer(name='Retail', email='retail@example.com', phone='2',
+                         address='Road', credit_limit=100000)
+        product = Product(name='Cement', hsn='2523', gst_percent=18, price=100)
+        db.session.add_all([admin, customer, other, product])
+        db.session.commit()
+        self.customer_id = customer.id
+        self.other_id = other.id
+        self.product_id = product.id
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add(self, customer_id, type, amount, when):
+        db.session.add(Transaction(customer_id=customer_id, type=type, amount=amount,
+                                   description=type, date=when))
+        db.session.commit()
+
+    def rollup(self, customer_id, day):
+        db.session.expire_all()
+        return db.session.get(LedgerRollup, (customer_id, day))
+
+    def test_writes_keep_the_rollup_in_step(self):
+        self.app.post('/create_invoice', data={
+            'customer_id': self.customer_id, 'date': '2024-04-01', 'payment_mode': 'Credit',
+            'items': json.dumps([{'product_id': self.product_id, 'quantity': 2, 'rate': 100}])
+        })
+        self.app.post('/add_transaction', data={
+            'customer_id': self.customer_id, 'type': 'credit', 'amount': 50,
+            'description': 'Opening', 'date': '2024-04-01T10:00'
+        })
+        self.app.post('/add_payment', data={
+            'customer_id': self.customer_id, 'amount': 100, 'payment_mode': 'Cash', 'date': '2024-04-01'
+        })
+        day = self.rollup(self.customer_id, date(2024, 4, 1))
+        self.assertAlmostEqual(day.invoiced, 236.0)
+        self.assertEqual((day.invoice_count, day.credit_count, day.payment_count), (1, 1, 1))
+        self.assertAlmostEqual(day.credited, 50.0)
+        self.assertAlmostEqual(day.paid, 100.0)
+
+        invoice = Invoice.query.one()
+        self.app.post(f'/delete_invoice/{invoice.id}')
+        day = self.rollup(self.customer_id, date(2024, 4, 1))
+        self.assertEqual(day.invoice_count, 0)
+        self.assertAlmostEqual(day.invoiced, 0.0)
+        self.assertEqual(rebuild_ledger_rollups(fix=False), [])
+
+    def test_edits_move_amounts_between_days_and_customers(self):
+        self.add(self.customer_id, 'payment', 40, datetime(2024, 4, 1, 9))
+        payment = Transaction.query.one()
+        payment.date = datetime(2024, 4, 2, 9)
+        payment.customer_id = self.other_id
+        payment.amount = 45
+        db.session.commit()
+        self.assertEqual(self.rollup(self.customer_id, date(2024, 4, 1)).payment_count, 0)
+        self.assertAlmostEqual(self.rollup(self.other_id, date(2024, 4, 2)).paid, 45.0)
+        self.assertEqual(rebuild_ledger_rollups(fix=False), [])
+
+    def test_range_totals_read_raw_rows_only_for_partial_days(self):
+        self.add(self.customer_id, 'payment', 10, datetime(2024, 4, 1, 8))
+        self.add(self.customer_id, 'payment', 20, datetime(2024, 4, 1, 18))
+        self.add(self.customer_id, 'credit', 30, datetime(2024, 4, 2, 12))
+        self.add(self.other_id, 'payment', 40, datetime(2024, 4, 3, 7))
+        self.add(self.other_id, 'payment', 50, datetime(2024, 4, 3, 20))
+
+        with QueryCounter() as queries:
+            totals = ledger_totals(date(2024, 4, 1), date(2024, 4, 4))
+        self.assertEqual(len(queries), 1)
+        self.assertAlmostEqual(totals.paid, 120.0)
+        self.assertEqual((totals.payment_count, totals.credit_count), (4, 1))
+
+        totals = ledger_totals(datetime(2024, 4, 1, 12), datetime(2024, 4, 3, 12))
+        self.assertAlmostEqual(totals.paid, 60.0)
+        self.assertAlmostEqual(totals.credited, 30.0)
+        self.assertEqual(totals.payment_count, 2)
+
+        self.assertAlmostEqual(ledger_totals(datetime(2024, 4, 1, 12), datetime(2024, 4, 1, 20)).paid, 20.0)
+        self.assertAlmostEqual(ledger_totals(customer_id=self.other_id).paid, 90.0)
+        self.assertAlmostEqual(ledger_totals(end=datetime(2024, 4, 3, 12)).paid, 70.0)
+
+    def test_rebuild_detects_and_fixes_drift(self):
+        self.add(self.customer_id, 'credit', 25, datetime(2024, 4, 1, 9))
+        db.session.execute(text('UPDATE ledger_rollup SET credited = 0'))
+        db.session.commit()
+
+        drift = rebuild_ledger_rollups(fix=False)
+        self.assertEqual(drift, [(self.customer_id, date(2024, 4, 1), 'credited', 0.0, 25.0)])
+        result = app.test_cli_runner().invoke(args=['rebuild-rollups', '--verify'])
+        self.assertEqual(result.exit_code, 1)
+        result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+        self.assertIn('Fixed 1 drifted', result.output)
+        self.assertEqual(rebuild_ledger_rollups(fix=False), [])
+
+    def test_upgrade_backfills_existing_rows(self):
+        self.add(self.customer_id, 'payment', 40, datetime(2024, 4, 1, 9))
+        self.add(self.customer_id, 'payment', 60, datetime(2024, 4, 1, 15))
+        migrations.stamp(db.engine, version=6)
+        with db.engine.begin() as conn:
+            conn.execute(text('DELETE FROM schema_version WHERE version > 6'))
+            migrations.drop_ledger_rollup_triggers(conn)
+            conn.execute(text('DROP TABLE ledger_rollup'))
+            conn.execute(text('DROP TABLE ledger_daily_total'))
+        self.assertEqual([number for number, _ in migrations.upgrade(db.engine, target=7)], [7])
+        day = self.rollup(self.customer_id, date(2024, 4, 1))
+        self.assertEqual((day.paid, day.payment_count), (100.0, 2))
+        self.assertAlmostEqual(ledger_totals(date(2024, 4, 1), date(2024, 4, 2)).paid, 100.0)
+
+        self.add(self.customer_id, 'payment', 5, datetime(2024, 4, 1, 16))
+        self.assertAlmostEqual(self.rollup(self.customer_id, date(2024, 4, 1)).paid, 105.0)
+
+if __name__ == '__main__':
+    unittest.main()
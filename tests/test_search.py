@@ -0,0 +1,96 @@
+import unittest
+from sqlalchemy import text
+from app import app, db, User, Customer, Product, dashboard_stats
+import migrations
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        dashboard_stats.invalidate()
+        db.session.add(User(username='admin', password='x', role='admin'))
+        db.session.add_all([
+            Customer(name='Ramesh Traders', email='ramesh@example.com', phone='9876543210', address='-',
+                     gstin='33ABCDE1234F1Z5'),
+            Customer(name='Suresh Hardware', email='suresh@example.com', phone='9123456780', address='-'),
+            Customer(name='Ram Kumar', email='kumar@example.com', phone='9000000001', address='-'),
+            Product(name='Cement OPC 53', hsn='2523', gst_percent=28, price=400),
+            Product(name='TMT Bar 12mm', hsn='7214', gst_percent=18, price=60),
+        ])
+        db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def names(self, kind, q, **params):
+        response = self.app.get(f'/search/{kind}', query_string=dict(q=q, **params))
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json]
+
+    def test_prefix_matches_on_every_indexed_column(self):
+        self.assertEqual(sorted(self.names('customers', 'ram')), ['Ram Kumar', 'Ramesh Traders'])
+        self.assertEqual(self.names('customers', 'ram tra'), ['Ramesh Traders'])
+        self.assertEqual(self.names('customers', 'suresh@'), ['Suresh Hardware'])
+        self.assertEqual(self.names('customers', '98765'), ['Ramesh Traders'])
+        self.assertEqual(self.names('customers', '33abcde'), ['Ramesh Traders'])
+        self.assertEqual(self.names('products', '7214'), ['TMT Bar 12mm'])
+        self.assertEqual(self.names('products', 'cem'), ['Cement OPC 53'])
+        row = self.app.get('/search/customers?q=suresh').json[0]
+        self.assertEqual(set(row), set(Customer.query.first().to_dict()))
+
+    def test_limit_and_query_syntax_are_safe(self):
+        self.assertEqual(len(self.names('customers', 'example', limit=2)), 2)
+        self.assertEqual(self.names('customers', ''), [])
+        self.assertEqual(self.names('customers', '"* OR ('), [])
+        self.assertEqual(self.names('customers', 'NEAR(ram'), [])
+        self.assertEqual(self.app.get('/search/invoices?q=1').status_code, 404)
+
+    def test_index_follows_writes(self):
+        self.app.post('/add_customer', data={'name': 'Ganesh Stores', 'email': 'ganesh@example.com',
+                                             'phone': '9333333333', 'address': '-', 'credit_limit': 0})
+        self.assertEqual(self.names('customers', 'gane'), ['Ganesh Stores'])
+        customer = Customer.query.filter_by(name='Ganesh Stores').one()
+        customer.name, customer.email = 'Lakshmi Stores', 'lakshmi@example.com'
+        db.session.commit()
+        self.assertEqual(self.names('customers', 'gane'), [])
+        self.assertEqual(self.names('customers', 'laksh'), ['Lakshmi Stores'])
+        self.app.post(f'/delete_customer/{customer.id}')
+        self.assertEqual(self.names('customers', 'laksh'), [])
+
+    def test_forms_do_not_embed_the_full_lists(self):
+        for url in ('/create_invoice', '/add_payment', '/add_transaction'):
+            page = self.app.get(url).get_data(as_text=True)
+            self.assertNotIn('Suresh Hardware', page, url)
+            self.assertNotIn('TMT Bar', page, url)
+            self.assertIn('/search/customers', page, url)
+        page = self.app.get('/add_transaction?customer_id=2').get_data(as_text=True)
+        self.assertIn('value="Suresh Hardware"', page)
+
+    def test_upgrade_builds_index_for_existing_rows(self):
+        migrations.stamp(db.engine, version=5)
+        with db.engine.begin() as conn:
+            conn.execute(text('DELETE FROM schema_version WHERE version > 5'))
+            migrations.drop_search_indexes(conn)
+        self.assertEqual([number for number, _ in migrations.upgrade(db.engine, target=6)], [6])
+        self.assertEqual(sorted(self.names('customers', 'ram')), ['Ram Kumar', 'Ramesh Traders'])
+        with db.engine.connect() as conn:
+            self.assertEqual(conn.execute(text(
+                "INSERT INTO customer_search (customer_search) VALUES ('integrity-check')")).rowcount, 1)
+
+if __name__ == '__main__':
+    unittest.main()
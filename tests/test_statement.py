@@ -0,0 +1,115 @@
+import csv
+import io
+import unittest
+from datetime import datetime
+
+from app import (app, db, User, Customer, Invoice, Transaction, catalog_cache, dashboard_stats,
+                 encode_statement_cursor, statement_query)
+from query_budget import QueryCounter
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestCustomerStatement(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        catalog_cache.invalidate()
+        dashboard_stats.invalidate()
+
+        admin = User(username='admin', password='x', role='admin')
+        customer = Customer(name='Dealer', email='dealer@example.com', phone='1',
+                            address='Street', credit_limit=100000)
+        other = Customer(name='Retail', email='retail@example.com', phone='2',
+                         address='Road', credit_limit=100000)
+        db.session.add_all([admin, customer, other])
+        db.session.commit()
+        self.customer_id = customer.id
+
+        db.session.add_all([
+            Transaction(customer_id=customer.id, type='credit', amount=50, description='Opening',
+                        date=datetime(2024, 3, 31, 9)),
+            Invoice(invoice_number=1, customer_id=customer.id, date=datetime(2024, 4, 1, 10),
+                    total_amount=200, payment_mode='Credit', created_by=admin.id),
+            Transaction(customer_id=customer.id, type='invoice', amount=200, description='Invoice #1',
+                        date=datetime(2024, 4, 1, 10)),
+            Transaction(customer_id=customer.id, type='payment', amount=120, payment_mode='Cash',
+                        description='Part payment', date=datetime(2024, 4, 1, 10)),
+            Invoice(invoice_number=2, customer_id=customer.id, date=datetime(2024, 4, 3, 12),
+                    total_amount=80, payment_mode='Credit', created_by=admin.id),
+            Transaction(customer_id=other.id, type='payment', amount=999, description='Other',
+                        date=datetime(2024, 4, 2, 12)),
+        ])
+        db.session.commit()
+
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['username'] = admin.username
+            sess['user_role'] = 'admin'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def entries(self, **kwargs):
+        return db.session.execute(statement_query(self.customer_id, 0.0, **kwargs)).all()
+
+    def test_running_balance_merges_sources_in_date_order(self):
+        entries = self.entries()
+        self.assertEqual([(entry.kind, entry.debit, entry.credit) for entry in entries], [
+            ('credit', 50.0, 0.0), ('invoice', 200.0, 0.0), ('payment', 0.0, 120.0), ('invoice', 80.0, 0.0)
+        ])
+        self.assertEqual([entry.balance for entry in entries], [50.0, 250.0, 130.0, 210.0])
+        self.assertEqual(entries[1].reference, '1')
+
+    def test_limited_page_skips_other_transaction_types(self):
+        db.session.add_all(Transaction(customer_id=self.customer_id, type='invoice', amount=10,
+                                       description='Mirror', date=datetime(2024, 3, 1, 9 + hour))
+                           for hour in range(3))
+        db.session.commit()
+        self.assertEqual([(entry.kind, entry.id) for entry in self.entries(limit=3)],
+                         [(entry.kind, entry.id) for entry in self.entries()[:3]])
+
+    def test_opening_balance_comes_from_history_before_start(self):
+        response = self.app.get(f'/customer/{self.customer_id}/statement?start_date=2024-04-01&end_date=2024-04-01')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Opening balance', html)
+        self.assertIn('₹50.00', html)
+        self.assertIn('₹130.00', html)
+        self.assertNotIn('₹210.00', html)
+
+    def test_pages_continue_the_balance_from_the_cursor(self):
+        first = self.app.get(f'/customer/{self.customer_id}/statement?page_size=2')
+        cursor = first.headers['X-Next-Cursor']
+        self.assertEqual(cursor, encode_statement_cursor(self.entries()[1]))
+        with QueryCounter() as queries:
+            second = self.app.get(f'/customer/{self.customer_id}/statement?page_size=2&cursor={cursor}')
+        self.assertLessEqual(len(queries), 2)
+        html = second.get_data(as_text=True)
+        self.assertIn('Balance brought forward', html)
+        self.assertIn('₹130.00', html)
+        self.assertIn('₹210.00', html)
+        self.assertNotIn('X-Next-Cursor', second.headers)
+
+        response = self.app.get(f'/customer/{self.customer_id}/statement?cursor=bogus')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_streams_the_whole_statement(self):
+        response = self.app.get(f'/export/statement?customer_id={self.customer_id}&start_date=2024-04-01')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[0], ['Date', 'Type', 'Reference', 'Description', 'Debit', 'Credit', 'Balance'])
+        self.assertEqual(rows[1], ['2024-04-01', 'opening', '', 'Opening balance', '', '', '50.0'])
+        self.assertEqual([row[-1] for row in rows[2:]], ['250.0', '130.0', '210.0'])
+        self.assertEqual(self.app.get('/export/statement').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
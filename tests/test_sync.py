@@ -0,0 +1,141 @@
+import re
+import unittest
+from sqlalchemy import event
+from app import app, db, socketio, User, Customer, Transaction
+
+class TestConfig:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'test-secret-key'
+
+class TestDeltaSync(unittest.TestCase):
+    def setUp(self):
+        app.config.from_object(TestConfig)
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        admin = User(username='admin', password='x', role='admin')
+        db.session.add(admin)
+        db.session.add_all([Customer(name=f'Customer {i}', email=f'c{i}@example.com', phone='1',
+                                     address='Street') for i in range(5)])
+        db.session.commit()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = admin.id
+            sess['user_role'] = 'admin'
+        self.socket = socketio.test_client(app, flask_test_client=self.app)
+        self.socket.get_received()
+
+    def tearDown(self):
+        self.socket.disconnect()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def request(self, event_name, **data):
+        self.socket.emit(event_name, data)
+        received = self.socket.get_received()
+        self.assertEqual(len(received), 1)
+        return received[0]['args'][0]
+
+    def sync_all(self, event_name, cursor=None, **data):
+        pages = []
+        while True:
+            reply = self.request(event_name, cursor=cursor, **data)
+            pages.append(reply)
+            cursor = reply['cursor']
+            if not reply.get('has_more'):
+                return pages, cursor
+
+    def test_full_sync_pages_without_gaps_or_repeats(self):
+        pages, cursor = self.sync_all('get_customers', limit=2)
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(pages[0]['reset'])
+        names = [c['name'] for page in pages for c in page['customers']]
+        self.assertEqual(names, [f'Customer {i}' for i in range(5)])
+        self.assertEqual(self.request('get_customers', cursor=cursor),
+                         {'unchanged': True, 'cursor': cursor})
+
+    def test_unchanged_reply_costs_one_lookup(self):
+        _, cursor = self.sync_all('get_customers')
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.assertTrue(self.request('get_customers', cursor=cursor)['unchanged'])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual(len(statements), 1)
+
+    def test_delta_returns_only_changed_and_deleted_rows(self):
+        _, cursor = self.sync_all('get_customers')
+        self.app.post('/edit_customer/2', data={'name': 'Renamed', 'email': 'c1@example.com', 'phone': '1',
+                                                'address': 'Street', 'gstin': '', 'credit_limit': 0})
+        self.app.post('/delete_customer/3')
+
+        pages, cursor = self.sync_all('get_customers', cursor=cursor)
+        self.assertEqual(len(pages), 1)
+        self.assertFalse(pages[0]['reset'])
+        self.assertEqual([c['name'] for c in pages[0]['customers']], ['Renamed'])
+        self.assertEqual(pages[0]['deleted'], [3])
+        self.assertTrue(self.request('get_customers', cursor=cursor)['unchanged'])
+
+    def test_transaction_feed_and_balance_changes(self):
+        _, customers_cursor = self.sync_all('get_customers')
+        _, cursor = self.sync_all('get_transactions', customer_id=1)
+        self.app.post('/add_transaction', data={'customer_id': 2, 'type': 'payment', 'amount': 50,
+                                                'description': 'Cash', 'date': '2024-06-01T10:00'})
+        self.app.post('/add_transaction', data={'customer_id': 1, 'type': 'payment', 'amount': 75,
+                                                'description': 'Cash', 'date': '2024-06-01T11:00'})
+        self.socket.get_received()
+
+        pages, _ = self.sync_all('get_transactions', cursor=cursor, customer_id=1)
+        self.assertEqual([t['amount'] for t in pages[0]['transactions']], [75])
+        pages, _ = self.sync_all('get_customers', cursor=customers_cursor)
+        self.assertEqual({c['id']: c['outstanding_balance'] for c in pages[0]['customers']},
+                         {1: -75, 2: -50})
+
+    def test_customer_page_syncs_its_transactions_from_the_rendered_cursor(self):
+        self.app.post('/add_transaction', data={'customer_id': 1, 'type': 'payment', 'amount': 20,
+                                                'description': 'Cash', 'date': '2024-06-01T09:00'})
+        body = self.app.get('/view_customer/1').get_data(as_text=True)
+        table = re.search(r'<table[^>]*data-sync-stream="transactions"[^>]*>', body).group(0)
+        self.assertIn('data-sync-customer="1"', table)
+        cursor = re.search(r'data-sync-cursor="([^"]*)"', table).group(1)
+        self.assertTrue(self.request('get_transactions', cursor=cursor, customer_id=1)['unchanged'])
+
+        self.app.post('/add_transaction', data={'customer_id': 1, 'type': 'payment', 'amount': 75,
+                                                'description': 'Cash', 'date': '2024-06-01T11:00'})
+        self.socket.get_received()
+        pages, _ = self.sync_all('get_transactions', cursor=cursor, customer_id=1)
+        self.assertFalse(pages[0]['reset'])
+        self.assertEqual([t['amount'] for t in pages[0]['transactions']], [75])
+
+    def test_deleted_transactions_reach_their_customers_stream(self):
+        self.app.post('/add_transaction', data={'customer_id': 1, 'type': 'payment', 'amount': 20,
+                                                'description': 'Cash', 'date': '2024-06-01T09:00'})
+        self.socket.get_received()
+        _, cursor = self.sync_all('get_transactions', customer_id=1)
+        _, other_cursor = self.sync_all('get_transactions', customer_id=2)
+        transaction = Transaction.query.one()
+        db.session.delete(transaction)
+        db.session.commit()
+
+        pages, _ = self.sync_all('get_transactions', cursor=cursor, customer_id=1)
+        self.assertEqual((pages[0]['transactions'], pages[0]['deleted']), ([], [transaction.id]))
+        pages, _ = self.sync_all('get_transactions', cursor=other_cursor, customer_id=2)
+        self.assertEqual(pages[0]['deleted'], [])
+
+    def test_invalid_cursor_falls_back_to_full_sync(self):
+        reply = self.request('get_transactions', cursor='garbage', limit='many')
+        self.assertTrue(reply['reset'])
+        self.assertEqual(reply['transactions'], [])
+        self.assertEqual(Transaction.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,15 @@
-from app import app
-from config import config
+import os
+
+# The eventlet profile has to patch the standard library before anything else
+# (SQLAlchemy's pool, threading, sockets) is imported
+if os.environ.get('SOCKETIO_ASYNC_MODE') == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
 
-# Load production configuration
-app.config.from_object(config['production'])
+# Load production configuration before the app builds its database engine
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+from app import app
 
 if __name__ == '__main__':
-    app.run() 
\ No newline at end of file
+    app.run() 